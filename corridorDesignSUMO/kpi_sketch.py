@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kpi_sketch.py
+Rolling-window quantiles and histograms of the SSM values for the dashboards.
+
+Each metric (TTC, PET, required deceleration, ΔV, ...) is a fixed-bin histogram
+over [lo, hi) kept per time slice (slice_s seconds) in a ring covering window_s.
+A running total over the live slices is updated as values arrive and when a
+slice leaves the window (its counts are subtracted), so quantiles and the
+histogram are read from `bins * resolution` counters: the cost does not depend
+on how many values the window holds.
+
+  - quantiles interpolate inside the fine bins: error <= (hi - lo) / (bins * resolution)
+  - the histogram sums the fine bins into `bins` display bins
+  - values >= hi are counted in an overflow bin (quantiles landing there report hi);
+    values < lo count in the first bin; None / NaN / inf are skipped
+  - the window moves in whole slices, so it spans window_s to window_s + slice_s
+
+add() only queues the values; they are binned in one vectorized pass by the
+next read (or once `chunk` rows are waiting), like recent_buffer.TimeRing.
+
+    kpi = KpiSketches({"ttc": (0.0, 30.0), "req_dec": (0.0, 15.0)}, window_s=600.0)
+    kpi.add(time.time(), ttc=2.4, req_dec=1.1)
+    kpi.quantile("ttc", 0.5)
+    kpi.summary()   # {"window_s", "slice_s", "metrics": {"ttc": {"count", "p05", "p50", "p95", "overflow", "hist"}}}
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+QUANTILES = (0.05, 0.50, 0.95)
+
+
+class RollingHistogram:
+    """One metric; not thread-safe on its own (KpiSketches holds the lock)."""
+
+    def __init__(self, lo, hi, bins=40, resolution=10, window_s=600.0, slice_s=10.0):
+        self.lo, self.hi = float(lo), float(hi)
+        self.bins, self.resolution = int(bins), int(resolution)
+        self.n_fine = self.bins * self.resolution
+        self.width = (self.hi - self.lo) / self.n_fine
+        self.window_s, self.slice_s = window_s, slice_s
+        self.n_slices = int(math.ceil(window_s / slice_s)) + 1
+        self._counts = np.zeros((self.n_slices, self.n_fine + 1), dtype=np.int64)  # last column: overflow
+        self._slice_ids = np.full(self.n_slices, -1, dtype=np.int64)             # slice held by each slot
+        self._total = np.zeros(self.n_fine + 1, dtype=np.int64)
+
+    def fold(self, ts, values):
+        """Add finite values with their timestamps (arrays)."""
+        sid = np.floor(ts / self.slice_s).astype(np.int64)
+        newest = max(int(sid.max()), int(self._slice_ids.max()))
+        keep = sid > newest - self.n_slices
+        sid, values = sid[keep], values[keep]
+        b = np.clip(np.floor((values - self.lo) / self.width), 0, self.n_fine).astype(np.int64)
+        for s in np.unique(sid):
+            slot = s % self.n_slices
+            if self._slice_ids[slot] != s:  # slot still holds a slice that left the ring
+                self._total -= self._counts[slot]
+                self._counts[slot] = 0
+                self._slice_ids[slot] = s
+            c = np.bincount(b[sid == s], minlength=self.n_fine + 1)
+            self._counts[slot] += c
+            self._total += c
+
+    def expire(self, now):
+        old = (self._slice_ids >= 0) & (self._slice_ids < math.floor((now - self.window_s) / self.slice_s))
+        if old.any():
+            self._total -= self._counts[old].sum(axis=0)
+            self._counts[old] = 0
+            self._slice_ids[old] = -1
+
+    def count(self):
+        return int(self._total.sum())
+
+    def quantile(self, q):
+        n = self.count()
+        if not n:
+            return None
+        cum = np.cumsum(self._total)
+        r = min(max(q * n, 1e-9), n)
+        i = int(np.searchsorted(cum, r, side="left"))
+        if i >= self.n_fine:
+            return self.hi
+        frac = (r - (cum[i] - self._total[i])) / self._total[i]
+        return self.lo + (i + frac) * self.width
+
+    def histogram(self):
+        counts = self._total[:-1].reshape(self.bins, self.resolution).sum(axis=1)
+        return {"edges": np.linspace(self.lo, self.hi, self.bins + 1).round(6).tolist(),
+                "counts": counts.tolist(), "overflow": int(self._total[-1])}
+
+    def summary(self):
+        out = {"count": self.count()}
+        for q in QUANTILES:
+            v = self.quantile(q)
+            out[f"p{int(round(q * 100)):02d}"] = None if v is None else round(float(v), 3)
+        out["overflow"] = int(self._total[-1])
+        out["hist"] = self.histogram()
+        return out
+
+
+class KpiSketches:
+    def __init__(self, ranges, window_s=600.0, slice_s=10.0, bins=40, resolution=10, chunk=4096):
+        """ranges: {metric: (lo, hi)}."""
+        self.window_s, self.slice_s = window_s, slice_s
+        self.hists = {name: RollingHistogram(lo, hi, bins, resolution, window_s, slice_s)
+                      for name, (lo, hi) in ranges.items()}
+        self.chunk = chunk
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, ts, **values):
+        """Queue one record's values (metrics not given, None or non-finite are skipped)."""
+        with self._lock:
+            self._pending.append((ts, values))
+            if len(self._pending) >= self.chunk:
+                self._fold()
+
+    def _fold(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        ts = np.array([r[0] for r in rows], dtype=float)
+        for name, h in self.hists.items():
+            v = np.array([r[1].get(name) for r in rows], dtype=float)  # None -> NaN
+            ok = np.isfinite(v)
+            if ok.any():
+                h.fold(ts[ok], v[ok])
+
+    def _current(self, now):
+        self._fold()
+        now = time.time() if now is None else now
+        for h in self.hists.values():
+            h.expire(now)
+
+    def quantile(self, name, q, now=None):
+        """q-quantile (0..1) of `name` over the window, or None without data."""
+        with self._lock:
+            self._current(now)
+            return self.hists[name].quantile(q)
+
+    def summary(self, now=None):
+        with self._lock:
+            self._current(now)
+            return {"window_s": self.window_s, "slice_s": self.slice_s,
+                    "metrics": {name: h.summary() for name, h in self.hists.items()}}
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+load_bench.py
+Throughput / latency benchmark of the SSM servers under synthetic corridor traffic.
+
+For each fleet size N (--fleet 50,100,...,10000) a synthetic corridor with N
+vehicles and P pedestrians is stepped like a SUMO run: every sim step sends one
+/v2x/check/vehicle update per vehicle (with sim_time), one /v2x/check/vru check
+per pedestrian against its nearest vehicle, one /v2x/check/rsu detection per
+object within range of a roadside unit, then /v2x/tick/close. The requests are
+issued by --concurrency threads, paced to --rate requests/s in total (0: as
+fast as the server answers), for --seconds per fleet size. As in run.py, the
+tick close is sent only once every request of its step has been answered, and
+the next step starts once the close has been answered, so each tick is
+evaluated whole.
+
+Traffic: two lanes per direction, eastbound heading 0 deg and westbound 180 deg
+(the kernel's heading convention) with a little jitter; desired speeds ~N(13.9, 2.5)
+m/s with a random-walk acceleration; the corridor length grows with N so the
+density stays at --density vehicles/km/lane and pairs per vehicle stay
+realistic. Pedestrians walk along the sidewalks or cross at crosswalks
+(1.3 m/s on average). Vehicles leaving one end re-enter at the other.
+
+Reported per fleet size and endpoint: requests, throughput, p50/p95/p99 latency,
+error rate (HTTP >= 400 or connection errors), plus the real-time factor (sim
+seconds stepped per wall second) and the server's tick counters over the run
+(late updates, ticks closed by reason; from GET /v2x/tick). Endpoints a server does not have are skipped
+(ssm_server has no /v2x/check/rsu). Vehicles of a fleet are sent to
+/v2x/vehicle/arrived before the next size starts.
+
+The server is loaded in-process (--server, as stress_state.py does) or reached
+over HTTP (--url). In-process, client and server share one interpreter, so for
+deployment sizing start the server on its own and use --url.
+
+    python load_bench.py --server ssm_dash_noexcel --fleet 50,500,5000 --seconds 10 --out bench_a.json
+    python load_bench.py --url http://10.45.0.1:5000 --concurrency 16 --rate 2000 --compare bench_a.json
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from request_stats import RequestStats
+from v2x_codec import CODECS, encode_body
+
+VEH_PATH = "/v2x/check/vehicle"
+VRU_PATH = "/v2x/check/vru"
+RSU_PATH = "/v2x/check/rsu"
+TICK_CLOSE_PATH = "/v2x/tick/close"
+ARRIVED_PATH = "/v2x/vehicle/arrived"
+ENDPOINTS = {"vehicle": VEH_PATH, "vru": VRU_PATH, "rsu": RSU_PATH}
+LANE_W = 3.2
+SIDEWALK_Y = (-2.0, 4 * LANE_W + 2.0)
+
+
+# ---- Synthetic corridor ----
+class Corridor:
+    """N vehicles and P pedestrians on a straight two-way corridor, stepped with NumPy."""
+
+    def __init__(self, n_veh, n_ped, density=25.0, step_length=0.1, rsu_spacing=300.0,
+                 rsu_range=30.0, crosswalk_spacing=250.0, seed=0):
+        rnd = self.rnd = np.random.default_rng(seed)
+        self.dt = step_length
+        self.length = max(1500.0, n_veh / (4 * density) * 1000.0)
+        self.rsu_range = rsu_range
+        self.rsu_x = np.arange(rsu_spacing / 2, self.length, rsu_spacing)
+        self.crosswalks = np.arange(crosswalk_spacing / 2, self.length, crosswalk_spacing)
+
+        lane = rnd.integers(0, 4, n_veh)            # 0,1 eastbound; 2,3 westbound
+        self.veh_ids = [f"lb_v{i}" for i in range(n_veh)]
+        self.vx = rnd.uniform(0.0, self.length, n_veh)
+        self.vy = (lane + 0.5) * LANE_W
+        self.v_dir = np.where(lane < 2, 1.0, -1.0)
+        self.v_desired = np.clip(rnd.normal(13.9, 2.5, n_veh), 3.0, 25.0)
+        self.v_speed = self.v_desired.copy()
+
+        self.ped_ids = [f"lb_p{i}" for i in range(n_ped)]
+        self.crossing = rnd.random(n_ped) < 0.3
+        side = rnd.integers(0, 2, n_ped)
+        self.py = np.array(SIDEWALK_Y)[side]
+        self.px = rnd.uniform(0.0, self.length, n_ped)
+        if len(self.crosswalks):
+            near = np.abs(self.px[:, None] - self.crosswalks[None, :]).argmin(axis=1)
+            self.px = np.where(self.crossing, self.crosswalks[near], self.px)
+        self.p_dir = np.where(self.crossing, np.where(side == 0, 1.0, -1.0), rnd.choice([-1.0, 1.0], n_ped))
+        self.p_speed = np.clip(rnd.normal(1.3, 0.2, n_ped), 0.5, 2.2)
+        self.sim_time = 0.0
+
+    def step(self):
+        dt, rnd = self.dt, self.rnd
+        n = len(self.vx)
+        accel = rnd.normal(0.0, 0.5, n) + 0.3 * (self.v_desired - self.v_speed)
+        self.v_speed = np.clip(self.v_speed + accel * dt, 0.0, 30.0)
+        self.vx = (self.vx + self.v_dir * self.v_speed * dt) % self.length
+        self.v_heading = np.where(self.v_dir > 0, 0.0, 180.0) + rnd.normal(0.0, 1.5, n)
+
+        walk = self.p_dir * self.p_speed * dt
+        self.px = np.where(self.crossing, self.px, (self.px + walk) % self.length)
+        self.py = np.where(self.crossing, self.py + walk, self.py)
+        turn = self.crossing & ((self.py <= SIDEWALK_Y[0]) | (self.py >= SIDEWALK_Y[1]))
+        self.p_dir = np.where(turn, -self.p_dir, self.p_dir)
+        self.py = np.clip(self.py, *SIDEWALK_Y)
+        self.p_heading = np.where(self.crossing, np.where(self.p_dir > 0, 90.0, 270.0),
+                                  np.where(self.p_dir > 0, 0.0, 180.0))
+        self.sim_time = round(self.sim_time + dt, 3)
+
+    def _veh(self, i):
+        return {"id": self.veh_ids[i], "position": [round(float(self.vx[i]), 2), round(float(self.vy[i]), 2)],
+                "speed": round(float(self.v_speed[i]), 3), "heading": round(float(self.v_heading[i]), 2)}
+
+    def requests(self, paths, response):
+        """(path, payload) of one sim step, in the order run.py sends them."""
+        t = self.sim_time
+        if VEH_PATH in paths:
+            for i in range(len(self.vx)):
+                payload = dict(self._veh(i), sim_time=t)
+                if response:
+                    payload["response"] = response
+                yield VEH_PATH, payload
+        if len(self.vx) and VRU_PATH in paths:
+            order = np.argsort(self.vx)
+            xs = self.vx[order]
+            near = np.clip(np.searchsorted(xs, self.px), 1, len(xs) - 1)
+            near = np.where(np.abs(xs[near - 1] - self.px) < np.abs(xs[near] - self.px), near - 1, near)
+            for j, k in enumerate(order[near]):
+                yield VRU_PATH, {
+                    "vehicle": self._veh(k),
+                    "pedestrian": {"id": self.ped_ids[j], "position": [round(float(self.px[j]), 2), round(float(self.py[j]), 2)],
+                                   "speed": round(float(self.p_speed[j]), 3), "heading": float(self.p_heading[j])}}
+        if RSU_PATH in paths:
+            rsu_y = SIDEWALK_Y[1]
+            for r, rx in enumerate(self.rsu_x):
+                for kind, ids, xs, ys, speeds in (("vehicle", self.veh_ids, self.vx, self.vy, self.v_speed),
+                                                  ("pedestrian", self.ped_ids, self.px, self.py, self.p_speed)):
+                    for i in np.flatnonzero(np.hypot(xs - rx, ys - rsu_y) <= self.rsu_range):
+                        yield RSU_PATH, {
+                            "rsu_id": f"RSU_{r}", "rsu_x": float(rx), "rsu_y": rsu_y, "obj_type": kind,
+                            "obj_id": ids[i], "obj_x": round(float(xs[i]), 2), "obj_y": round(float(ys[i]), 2),
+                            "distance_m": round(float(np.hypot(xs[i] - rx, ys[i] - rsu_y)), 2),
+                            "speed_mps": round(float(speeds[i]), 3), "sim_time": t}
+        if TICK_CLOSE_PATH in paths:
+            yield TICK_CLOSE_PATH, {"sim_time": t}
+
+
+# ---- Load driver ----
+class Schedule:
+    """
+    Hands out the corridor's requests in order, each with its send time under --rate.
+    A tick close waits until every request handed out before it is done(), and
+    nothing after it is handed out until it is done() itself.
+    """
+
+    def __init__(self, corridor, paths, response, rate, deadline):
+        self.corridor, self.paths, self.response = corridor, paths, response
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.deadline = deadline
+        self.cv = threading.Condition()
+        self.issued = 0
+        self.steps = 0          # sim steps whose requests were all issued
+        self.in_flight = 0      # handed out, not done() yet
+        self.closing = False    # a tick close is in flight
+        self.t0 = time.monotonic()
+        self._it = iter(())
+        self._head = None       # next item, held back while it waits
+
+    def _peek(self):
+        if self._head is None:
+            item = next(self._it, None)
+            if item is None:
+                if self.issued:
+                    self.steps += 1
+                self.corridor.step()
+                self._it = self.corridor.requests(self.paths, self.response)
+                item = next(self._it, None)
+            self._head = item
+        return self._head
+
+    def next(self):
+        with self.cv:
+            while True:
+                left = self.deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                item = self._peek()
+                if item is None:  # nothing to send (no endpoints for this fleet)
+                    return None
+                if not self.closing and (item[0] != TICK_CLOSE_PATH or not self.in_flight):
+                    break
+                self.cv.wait(left)
+            self._head = None
+            self.in_flight += 1
+            self.closing = item[0] == TICK_CLOSE_PATH
+            send_at = self.t0 + self.issued * self.interval
+            self.issued += 1
+        return item, send_at
+
+    def done(self, path):
+        with self.cv:
+            self.in_flight -= 1
+            if path == TICK_CLOSE_PATH:
+                self.closing = False
+            self.cv.notify_all()
+
+
+def worker(stats, schedule, url, codec):
+    s = requests.Session()
+    while True:
+        job = schedule.next()
+        if job is None:
+            return
+        (path, payload), send_at = job
+        delay = send_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        body, headers = encode_body(payload, codec)
+        t0 = time.perf_counter()
+        try:
+            r = s.post(url + path, data=body, headers=headers, timeout=30)
+            ok, detail = r.status_code < 400, f"HTTP {r.status_code} {r.text[:200]}"
+        except Exception as e:
+            ok, detail = False, repr(e)
+        stats.record(path, (time.perf_counter() - t0) * 1000.0, ok, detail)
+        schedule.done(path)
+
+
+def served_paths(url, wanted):
+    """The paths of `wanted` the server has: an empty body gets 4xx/5xx, only a missing route 404/405."""
+    out = []
+    for path in wanted:
+        try:
+            code = requests.post(url + path, json={}, timeout=10).status_code
+        except Exception as e:
+            print(f"[WARN] {path} unreachable: {e}")
+            continue
+        if code in (404, 405):
+            print(f"[WARN] {path} not served (HTTP {code}), skipped")
+        else:
+            out.append(path)
+    return out
+
+
+def tick_counters(url):
+    """The server's late-update and tick-close counters (GET /v2x/tick); None if it has none."""
+    try:
+        r = requests.get(url + "/v2x/tick", timeout=10)
+        if r.ok:
+            t = r.json()
+            return {"late": t["late"], "closed": t["closed"]}
+    except Exception as e:
+        print(f"[WARN] /v2x/tick unavailable: {e}")
+    return None
+
+
+def _tick_delta(before, after):
+    if before is None or after is None:
+        return {"late_updates": None, "ticks_closed": None}
+    return {"late_updates": after["late"] - before["late"],
+            "ticks_closed": {k: n - before["closed"].get(k, 0) for k, n in after["closed"].items()}}
+
+
+def release(url, ids, paths, sim_time):
+    """Drop a finished fleet from the server so the next size starts empty."""
+    if ARRIVED_PATH not in paths:
+        return
+    for i in range(0, len(ids), 1000):
+        try:
+            requests.post(url + ARRIVED_PATH, json={"sim_time": sim_time, "ids": ids[i:i + 1000]}, timeout=30)
+        except Exception as e:
+            print(f"[WARN] arrived cleanup failed: {e}")
+            return
+
+
+def _summary(lat, calls, errors, elapsed):
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if lat else (0.0, 0.0, 0.0)
+    return {"requests": calls, "errors": errors, "error_rate": round(errors / calls, 6) if calls else 0.0,
+            "throughput_rps": round(calls / elapsed, 2), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "max_ms": round(max(lat), 3) if lat else 0.0}
+
+
+def run_fleet(args, url, paths, n_veh, sim_start):
+    n_ped = args.peds if args.peds is not None else int(round(args.ped_ratio * n_veh))
+    corridor = Corridor(n_veh, n_ped, density=args.density, step_length=args.step_length,
+                        rsu_spacing=args.rsu_spacing, rsu_range=args.rsu_range, seed=args.seed)
+    corridor.sim_time = sim_start
+    stats = RequestStats(max_examples=5)
+    ticks_before = tick_counters(url)
+    t0 = time.monotonic()
+    schedule = Schedule(corridor, paths, response_options(args), args.rate, t0 + args.seconds)
+    threads = [threading.Thread(target=worker, args=(stats, schedule, url, args.codec))
+               for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - t0
+    ticks = _tick_delta(ticks_before, tick_counters(url))
+    release(url, corridor.veh_ids, paths, corridor.sim_time)
+
+    all_lat = [ms for lat in stats.lat_ms.values() for ms in lat]
+    run = {"vehicles": n_veh, "pedestrians": n_ped, "corridor_m": round(corridor.length, 1),
+           "elapsed_s": round(elapsed, 3), "sim_steps": schedule.steps,
+           "realtime_factor": round(schedule.steps * args.step_length / elapsed, 4), **ticks,
+           **_summary(all_lat, sum(stats.calls.values()), sum(stats.failed.values()), elapsed),
+           "endpoints": {p: _summary(stats.lat_ms[p], stats.calls[p], stats.failed[p], elapsed)
+                         for p in sorted(stats.calls)}}
+    for ex in stats.examples:
+        print("[FAIL]", ex)
+    return run, corridor.sim_time
+
+
+def response_options(args):
+    """The "response" object of vehicle updates, as run.py --v2x-response sends it."""
+    if args.response == "full":
+        return None
+    opts = {"view": args.response}
+    if args.response == "top_k":
+        opts["k"] = args.top_k
+    return opts
+
+
+def print_run(run):
+    print(f"  N={run['vehicles']} P={run['pedestrians']}: {run['requests']} requests in {run['elapsed_s']:.1f}s, "
+          f"{run['throughput_rps']:.0f} req/s, {run['sim_steps']} steps, real-time factor {run['realtime_factor']:.3f}")
+    print(f"    {'path':24s} {'req':>8s} {'req/s':>8s} {'err %':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+    for path, e in run["endpoints"].items():
+        print(f"    {path:24s} {e['requests']:8d} {e['throughput_rps']:8.0f} {100 * e['error_rate']:7.2f} "
+              f"{e['p50_ms']:8.2f} {e['p95_ms']:8.2f} {e['p99_ms']:8.2f}")
+    if run["late_updates"] is not None:
+        closed = ", ".join(f"{k} {n}" for k, n in run["ticks_closed"].items() if n)
+        print(f"    server: {run['late_updates']} late updates, ticks closed: {closed or 'none'}")
+
+
+def compare(runs, path):
+    """Throughput and p99 of this run against a saved result file, per fleet size."""
+    with open(path) as f:
+        old = {r["vehicles"]: r for r in json.load(f)["runs"]}
+    print(f"[INFO] compared with {path}")
+    print(f"  {'N':>6s} {'req/s old':>10s} {'req/s new':>10s} {'change':>8s} {'p99 old':>8s} {'p99 new':>8s}")
+    for r in runs:
+        o = old.get(r["vehicles"])
+        if o is None:
+            continue
+        change = (r["throughput_rps"] / o["throughput_rps"] - 1) * 100 if o["throughput_rps"] else 0.0
+        print(f"  {r['vehicles']:6d} {o['throughput_rps']:10.0f} {r['throughput_rps']:10.0f} {change:+7.1f}% "
+              f"{o['p99_ms']:8.2f} {r['p99_ms']:8.2f}")
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(args):
+    fleet = [int(n) for n in args.fleet.split(",") if n.strip()]
+    srv = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+        srv = make_server("127.0.0.1", 0, __import__(args.server).app, threaded=True)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{srv.server_port}"
+
+    wanted = [ENDPOINTS[e] for e in args.endpoints.split(",")]
+    paths = served_paths(url, wanted)
+    if not paths:
+        print("[ERROR] none of the endpoints is served")
+        return 1
+    paths += served_paths(url, [TICK_CLOSE_PATH, ARRIVED_PATH])
+    print(f"[INFO] {args.server if srv else url}: {args.concurrency} threads, "
+          f"rate {args.rate or 'unlimited'} req/s, {args.seconds:.0f}s per fleet size, codec {args.codec}")
+
+    runs, sim_time = [], 0.0
+    for n in fleet:
+        run, sim_time = run_fleet(args, url, paths, n, sim_time)
+        runs.append(run)
+        print_run(run)
+    if srv is not None:
+        srv.shutdown()
+
+    if args.compare:
+        compare(runs, args.compare)
+    if args.out:
+        meta = {"label": args.label, "target": args.server if srv else url, "in_process": srv is not None,
+                "git_rev": _git_rev(), "python": platform.python_version(), "host": platform.node(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "paths": paths,
+                **{k: getattr(args, k) for k in ("concurrency", "rate", "seconds", "codec", "response",
+                                                 "step_length", "density", "ped_ratio", "peds", "seed")}}
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "runs": runs}, f, indent=2)
+        print(f"[INFO] results written to {args.out}")
+    return 1 if any(r["errors"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Drive an SSM server with synthetic corridor traffic and report "
+                                             "throughput and latency per fleet size.")
+    target = ap.add_mutually_exclusive_group()
+    target.add_argument("--server", default="ssm_dash_noexcel",
+                        help="Server module to load in-process (ssm_server, ssm_desh, ssm_dash_noexcel, ssm_dash_noexcel_pet)")
+    target.add_argument("--url", default=None, help="Base URL of a running server instead of --server")
+    ap.add_argument("--fleet", default="50,100,500,1000,5000,10000", help="Comma-separated vehicle counts N")
+    ap.add_argument("--ped-ratio", type=float, default=0.1, help="Pedestrians per vehicle (P = ratio * N)")
+    ap.add_argument("--peds", type=int, default=None, help="Fixed pedestrian count P (overrides --ped-ratio)")
+    ap.add_argument("--endpoints", default="vehicle,vru,rsu", help="Comma-separated subset of vehicle,vru,rsu")
+    ap.add_argument("--seconds", type=float, default=10.0, help="Duration per fleet size")
+    ap.add_argument("--concurrency", type=int, default=8, help="Client threads")
+    ap.add_argument("--rate", type=float, default=0.0, help="Target requests/s over all threads (0: unthrottled)")
+    ap.add_argument("--codec", choices=CODECS, default="fast-json", help="Request body encoding")
+    ap.add_argument("--response", choices=("full", "alerts", "top_k"), default="alerts",
+                    help="Response view of vehicle updates (see ssm_response.py)")
+    ap.add_argument("--top-k", type=int, default=5, help="k for --response top_k")
+    ap.add_argument("--step-length", type=float, default=0.1, help="Sim step (s)")
+    ap.add_argument("--density", type=float, default=25.0, help="Vehicles per km per lane (sets the corridor length)")
+    ap.add_argument("--rsu-spacing", type=float, default=300.0, help="Distance between roadside units (m)")
+    ap.add_argument("--rsu-range", type=float, default=30.0, help="RSU detection range (m)")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the synthetic traffic")
+    ap.add_argument("--label", default=None, help="Free text stored with the results (e.g. the version tested)")
+    ap.add_argument("--out", default=None, help="Write the results as JSON to this file")
+    ap.add_argument("--compare", default=None, help="Earlier --out file to compare throughput and p99 with")
+    sys.exit(main(ap.parse_args()))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py
+In-process metrics for the SSM servers, exported in the Prometheus text format.
+
+Three kinds, each with optional label names:
+  Counter    monotonically increasing (inc)
+  Gauge      a value that goes up and down (set / inc / dec), or a callback
+             evaluated only when /metrics is scraped (buffer sizes, queue depths)
+  Histogram  fixed buckets (observe / time()); exported cumulatively with _sum and _count
+
+Recording is a dict lookup and an add under the metric's own lock; histograms
+find their bucket by bisection. Nothing is aggregated until render(), so an
+update costs the hot path well under a microsecond.
+
+Metrics live in a Registry; REGISTRY is the process-wide default that the
+modules (tick_engine, result_log, ...) register into at import time. Asking for
+an existing name again returns the same metric, so modules loaded twice share it.
+
+    PAIRS = REGISTRY.counter("ssm_pairs_evaluated_total", "Pairs evaluated by the SSM kernel")
+    PAIRS.inc(n)
+    LAT = REGISTRY.histogram("v2x_http_request_duration_seconds", "Latency", ("path",), LATENCY_BUCKETS)
+    with LAT.time("/v2x/check/vehicle"):
+        ...
+    REGISTRY.gauge("v2x_rsu_buffer_rows", "RSU rows buffered", fn=lambda: len(rsu_buf))
+
+instrument(app, paths) times the given Flask routes (count, latency, in-flight)
+and adds GET /metrics.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+
+def _fmt(v):
+    if v == math.inf:
+        return "+Inf"
+    if v == -math.inf:
+        return "-Inf"
+    if v != v:
+        return "NaN"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}   # label values tuple -> value
+        if not self.labelnames:
+            self._values[()] = self._zero()  # unlabelled metrics export 0 before the first update
+
+    def _zero(self):
+        return 0
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+        return labels
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn  # () -> value, or {label values tuple: value} for labelled gauges
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, *labels):
+        self.inc(-amount, *labels)
+
+    def render(self):
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception as e:
+                print(f"[WARN] gauge {self.name} failed: {e}")
+                return []
+            items = list(v.items()) if isinstance(v, dict) else [((), v)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(float(b) for b in buckets if b != math.inf))
+        super().__init__(name, help, labelnames)
+
+    def _zero(self):
+        return [[0] * (len(self.bounds) + 1), 0.0, 0]  # per-bucket counts, sum, count
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        i = bisect_left(self.bounds, value)  # first bound >= value ("le" is inclusive)
+        with self._lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = self._zero()
+            st[0][i] += 1
+            st[1] += value
+            st[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(st[0]), st[1], st[2])) for k, st in self._values.items()]
+        out = self._header()
+        for key, (counts, total, n) in items:
+            cum = 0
+            for bound, c in zip(self.bounds + (math.inf,), counts):
+                cum += c
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _fmt(bound)))} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(m) is not cls:
+                raise ValueError(f"metric {name} already registered as a {m.kind}")
+            return m
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        g = self._get(Gauge, name, help, labelnames)
+        if fn is not None:
+            g.fn = fn  # the latest registration (e.g. a re-imported server) reports
+        return g
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def instrument(app, paths, registry=REGISTRY):
+    """Count and time requests to the routes in `paths` (rule strings) and serve GET /metrics."""
+    from flask import Response, g, request
+
+    paths = frozenset(paths)
+    requests_total = registry.counter("v2x_http_requests_total", "HTTP requests by route, method and status",
+                                      ("path", "method", "status"))
+    latency = registry.histogram("v2x_http_request_duration_seconds", "HTTP request latency by route",
+                                 ("path",), LATENCY_BUCKETS)
+    in_flight = registry.gauge("v2x_http_requests_in_flight", "HTTP requests being handled", ("path",))
+
+    def _route():
+        rule = request.url_rule
+        return rule.rule if rule is not None and rule.rule in paths else None
+
+    @app.before_request
+    def _metrics_start():
+        path = _route()
+        if path is not None:
+            g._metrics_t0 = time.perf_counter()
+            in_flight.inc(1, path)
+
+    @app.after_request
+    def _metrics_stop(resp):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is not None:
+            path = request.url_rule.rule
+            latency.observe(time.perf_counter() - t0, path)
+            requests_total.inc(1, path, request.method, str(resp.status_code))
+            in_flight.dec(1, path)
+        return resp
+
+    @app.teardown_request
+    def _metrics_abort(exc):
+        # unhandled exception: after_request did not run
+        if g.pop("_metrics_t0", None) is not None:
+            path = request.url_rule.rule
+            requests_total.inc(1, path, request.method, "500")
+            in_flight.dec(1, path)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """All registered metrics in the Prometheus text exposition format."""
+        return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plot_cache.py
+Shared, throttled rendering of the /v2x/plot vehicle map.
+
+The landing pages reload /v2x/plot every second per open tab. PlotCache keeps
+the last PNG and renders a new one only when the state version changed and at
+least min_interval_s passed since the last render; every client in between gets
+the cached bytes. One render runs at a time: requests arriving meanwhile wait
+for it and share its result instead of rendering the same map again.
+
+    plot_cache = PlotCache(lambda: render_map(vehicle_store.snapshot()), min_interval_s=1.0)
+    png, version = plot_cache.get(vehicle_store.version)
+
+render_map() draws the whole map with batched artists: one scatter for the
+vehicles, one quiver for the headings and one LineCollection for the risky
+pairs, so the cost grows with N inside NumPy/Agg instead of per matplotlib
+artist. Vehicle labels are per-artist text and only drawn up to label_max
+vehicles. It uses the object-oriented Figure/Agg API (no pyplot state), so it
+is safe to call from request threads and needs no GUI backend.
+"""
+import io
+import threading
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+
+class PlotCache:
+    def __init__(self, render, min_interval_s=1.0):
+        """render() -> PNG bytes of the current state."""
+        self.render = render
+        self.min_interval_s = min_interval_s
+        self._lock = threading.Lock()   # held while rendering (single flight)
+        self._png = None
+        self._version = None
+        self._rendered_at = 0.0
+        self.renders = 0
+        self.hits = 0
+        self.render_ms = 0.0
+
+    def _fresh(self, version):
+        return self._png is not None and (
+            version == self._version or time.monotonic() - self._rendered_at < self.min_interval_s)
+
+    def get(self, version):
+        """(PNG bytes, version they show) for state `version`, rendering only if needed."""
+        if self._fresh(version):
+            self.hits += 1
+            return self._png, self._version
+        with self._lock:
+            if self._fresh(version):  # rendered by another request while we waited
+                self.hits += 1
+                return self._png, self._version
+            t0 = time.perf_counter()
+            png = self.render()
+            self.render_ms = (time.perf_counter() - t0) * 1000.0
+            self._png, self._version, self._rendered_at = png, version, time.monotonic()
+            self.renders += 1
+            return png, version
+
+    def stats(self):
+        return {"renders": self.renders, "hits": self.hits, "last_render_ms": round(self.render_ms, 3),
+                "version": self._version, "min_interval_s": self.min_interval_s}
+
+
+def render_map(states, pairs=None, title="V2X Vehicle Map", pair_title="Risky pairs:", pair_lines=(),
+               figsize=(10, 6), dpi=120, arrow_m=3.0, label_max=80):
+    """
+    PNG of the vehicle map.
+    states: {vid: {"position": (x, y), "heading": deg, ...}}; pairs: [(vid_a, vid_b)] drawn as
+    red dashed lines and counted as alerts (None: no pair layer); pair_lines: text listed next to the axes (first 10).
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_title(title)
+    ax.set_xlabel("X [m]"); ax.set_ylabel("Y [m]")
+
+    vids = list(states)
+    if vids:
+        xy = np.array([states[v]["position"] for v in vids], dtype=float).reshape(-1, 2)
+        hdg = np.radians([states[v].get("heading", 0.0) for v in vids])
+        ax.scatter(xy[:, 0], xy[:, 1], s=16, c="blue", zorder=3)
+        ax.quiver(xy[:, 0], xy[:, 1], arrow_m * np.cos(hdg), arrow_m * np.sin(hdg), color="blue",
+                  angles="xy", scale_units="xy", scale=1, width=0.002, zorder=2)
+        if len(vids) <= label_max:
+            for vid, (x, y) in zip(vids, xy):
+                ax.text(x + 1, y + 1, vid, fontsize=7)
+
+    segs = [(states[a]["position"], states[b]["position"]) for a, b in pairs or ()]
+    if segs:
+        ax.add_collection(LineCollection(segs, colors="red", linestyles="--", linewidths=2, zorder=1))
+
+    ax.grid(True)
+    ax.set_aspect("equal", adjustable="datalim")
+    counts = f"Vehicles: {len(vids)}" + ("" if pairs is None else f"\nAlerts: {len(segs)}")
+    ax.text(0.01, 0.99, counts,
+            transform=ax.transAxes, va="top", fontsize=10,
+            bbox=dict(boxstyle="round", fc="w", ec="0.5"))
+    if pair_lines:
+        ax.text(1.02, 0.97, pair_title, transform=ax.transAxes, va="top", fontsize=9)
+        for i, msg in enumerate(pair_lines[:10]):
+            ax.text(1.02, 0.93 - 0.05 * i, msg, transform=ax.transAxes, fontsize=8)
+
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
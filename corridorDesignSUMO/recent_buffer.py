@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+recent_buffer.py
+Bounded append-only buffers shared between Flask request threads.
+
+Handlers append rows while /v2x/snapshot and the Dash callbacks read them. A
+plain deque raises "deque mutated during iteration" when a reader iterates it
+in Python while another thread appends, so neither buffer hands out its live
+storage:
+
+RecentBuffer  untyped rows (e.g. raw request payloads). view() copies the deque
+              once after it changed and hands the same immutable tuple to every
+              reader until the next append (copy-on-write).
+
+    buf = RecentBuffer(maxlen=20000)
+    buf.append(payload)
+    rows = list(buf.view())
+
+TimeRing      rows with a fixed schema and a "ts" column, stored column-wise in
+              NumPy arrays used as a ring. Timestamps are kept sorted, so "every
+              row since t" is a binary search plus a slice instead of a scan of
+              the whole buffer. Capacity is a row count (maxlen) and optionally
+              an age (max_age_s): rows older than the newest row by more than
+              max_age_s are dropped even if the ring is not full.
+
+    buf = TimeRing({"ts": float, "ego": str, "ttc": float}, maxlen=20000, max_age_s=600.0)
+    buf.append({"ts": time.time(), "ego": "veh_1", "ttc": None})
+    rows = buf.window(600.0)                   # list of dicts, oldest first
+    cols = buf.columns_since(time.time() - 60) # {"ts": ndarray, "ego": ndarray, ...}
+
+TimeRing.append() only queues the row; queued rows are written into the arrays
+in one vectorized pass by the next query (or once `chunk` rows are waiting),
+so the per-pair appends on the tick path stay as cheap as a deque append. The
+appended dicts are kept as well, so since() returns them by reference without
+rebuilding rows from the columns; they must not be modified after append().
+Rows arriving from different threads may be a few microseconds out of order;
+the stored ts column is raised to the previous row's ts to keep it sorted.
+
+Both buffers number their rows in append order (0, 1, 2, ...). read() returns
+the rows plus a cursor (the number of the next row); passing that cursor back as
+`after` returns only the rows appended since, which is how /v2x/snapshot serves
+deltas. A cursor larger than the buffer has ever numbered (the server restarted)
+is reported as a reset and answered with everything.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class RecentBuffer:
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._view = ()
+        self._dirty = False
+        self.appended = 0
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+            self._dirty = True
+            self.appended += 1
+
+    def view(self):
+        """Immutable tuple of the buffered items, oldest first."""
+        if not self._dirty:
+            return self._view
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        if self._dirty:
+            self._view = tuple(self._items)
+            self._dirty = False
+        return self._view
+
+    def read(self, after=None):
+        """(items numbered >= after (all if None), cursor, reset)."""
+        with self._lock:
+            items, end = self._refresh(), self.appended
+        reset = after is not None and after > end
+        if after is not None and not reset:
+            items = items[max(0, len(items) - (end - after)):]
+        return list(items), end, reset
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __len__(self):
+        return len(self._items)
+
+
+class TimeRing:
+    def __init__(self, columns, maxlen, max_age_s=None, chunk=4096):
+        if "ts" not in columns:
+            raise ValueError("TimeRing needs a 'ts' column")
+        self.names = list(columns)
+        self.floats = {c for c, kind in columns.items() if kind is float}  # None <-> NaN
+        self.maxlen = int(maxlen)
+        self.max_age_s = max_age_s  # None/0 disables
+        self.chunk = chunk
+        self._cols = {c: np.empty(self.maxlen, dtype=float if c in self.floats else object)
+                      for c in self.names}
+        self._rows = np.empty(self.maxlen, dtype=object)  # the appended dicts
+        self._start = 0             # physical index of the oldest row
+        self._size = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.written = 0            # rows moved into the ring = number of the next row
+
+    def append(self, row):
+        """Queue one row (dict with at least "ts"; missing columns become None)."""
+        with self._lock:
+            self._pending.append(row)
+            self.appended += 1
+            if len(self._pending) >= self.chunk:
+                self._compact()
+
+    # ---- storage (caller holds _lock) ----
+    def _compact(self):
+        self.written += len(self._pending)
+        rows, self._pending = self._pending[-self.maxlen:], []
+        n = len(rows)
+        if not n:
+            return
+        new = {}
+        for c in self.names:
+            vals = [r.get(c) for r in rows]
+            if c in self.floats:
+                new[c] = _floats(vals)
+            else:
+                new[c] = np.empty(n, dtype=object)
+                new[c][:] = vals
+        ts = new["ts"]
+        if self._size:
+            ts[0] = max(ts[0], self._cols["ts"][self._phys(self._size - 1)])
+        np.maximum.accumulate(ts, out=ts)
+
+        idx = (self._start + self._size + np.arange(n)) % self.maxlen
+        for c in self.names:
+            self._cols[c][idx] = new[c]
+        self._rows[idx] = rows
+        overflow = max(0, self._size + n - self.maxlen)
+        self._start = (self._start + overflow) % self.maxlen
+        self._size += n - overflow
+
+        if self.max_age_s:
+            self._drop_before(ts[-1] - self.max_age_s)
+
+    def _phys(self, i):
+        return (self._start + i) % self.maxlen
+
+    def _first_at_or_after(self, t):
+        """Logical index of the first row with ts >= t (binary search over both ring segments)."""
+        ts = self._cols["ts"]
+        n1 = min(self._size, self.maxlen - self._start)
+        head = ts[self._start:self._start + n1]
+        if n1 and head[-1] >= t:
+            return int(np.searchsorted(head, t, side="left"))
+        return n1 + int(np.searchsorted(ts[:self._size - n1], t, side="left"))
+
+    def _drop_before(self, t):
+        k = self._first_at_or_after(t)
+        self._start = self._phys(k) if k < self._size else 0
+        self._size -= k
+
+    def _index(self, t, last=None, after=None):
+        """Physical indices of the rows with ts >= t (numbered >= after, newest `last` only), oldest first."""
+        self._compact()
+        k = self._first_at_or_after(t)
+        if last is not None:
+            k = max(k, self._size - last)
+        if after is not None:
+            k = max(k, after - (self.written - self._size))
+        return self._phys(np.arange(k, self._size))
+
+    # ---- queries ----
+    def columns_since(self, t, last=None):
+        """{column: ndarray} of the rows with ts >= t (only the newest `last` of them if given), oldest first.
+        The arrays are copies; None is stored as NaN in float columns."""
+        with self._lock:
+            idx = self._index(t, last)
+            return {c: self._cols[c][idx] for c in self.names}  # fancy indexing copies
+
+    def since(self, t, last=None):
+        """Rows with ts >= t (only the newest `last` of them if given), oldest first: the appended dicts."""
+        with self._lock:
+            return self._rows[self._index(t, last)].tolist()
+
+    def window(self, seconds, now=None, last=None):
+        """Rows of the last `seconds` (ts >= now - seconds)."""
+        return self.since((time.time() if now is None else now) - seconds, last)
+
+    def read(self, t, after=None):
+        """(rows with ts >= t numbered >= after (all if None), cursor, reset)."""
+        with self._lock:
+            self._compact()
+            reset = after is not None and after > self.written
+            idx = self._index(t, after=None if reset else after)
+            return self._rows[idx].tolist(), self.written, reset
+
+    def seq_range(self, t):
+        """(number of the first row with ts >= t, cursor): changes when rows are added or age out."""
+        with self._lock:
+            self._compact()
+            return self.written - self._size + self._first_at_or_after(t), self.written
+
+    def __len__(self):
+        with self._lock:
+            self._compact()
+            return self._size
+
+
+def _floats(vals):
+    try:
+        return np.array(vals, dtype=float)
+    except (TypeError, ValueError):
+        out = np.empty(len(vals))
+        for i, v in enumerate(vals):
+            try:
+                out[i] = np.nan if v is None else float(v)
+            except (TypeError, ValueError):
+                out[i] = np.nan
+        return out
+
+
+def parse_cursor(text, n):
+    """'12.40.7' -> [12, 40, 7]; None/'' -> [None] * n. Raises ValueError if malformed."""
+    if not text:
+        return [None] * n
+    seqs = [int(x) for x in text.split(".")]
+    if len(seqs) != n or min(seqs) < 0:
+        raise ValueError(f"cursor must be {n} non-negative integers joined by '.'")
+    return seqs
+
+
+def format_cursor(seqs):
+    return ".".join(str(s) for s in seqs)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+request_stats.py
+Per-path request counters and latencies for the client-side scripts
+(stress_state.py, load_bench.py).
+
+Client threads call record() after every request; the script reads calls,
+failed and lat_ms once they have finished. What counts as a failure is up to
+the caller (5xx in the stress run, any HTTP >= 400 in the benchmark).
+
+    stats = RequestStats(max_examples=5)
+    stats.record("/v2x/check/vehicle", 1.8, ok=True)
+    stats.record("/v2x/check/vehicle", 30.2, ok=False, detail="HTTP 500 ...")
+"""
+import threading
+from collections import Counter
+
+
+def percentile(xs, q):
+    """Nearest-rank q-quantile (0..1) of xs; 0.0 for an empty list."""
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+
+class RequestStats:
+    def __init__(self, max_examples=10):
+        self.lock = threading.Lock()
+        self.calls = Counter()      # path -> calls
+        self.failed = Counter()     # path -> failed calls
+        self.lat_ms = {}            # path -> [ms]
+        self.examples = []          # first few failures, "path: detail"
+        self.max_examples = max_examples
+
+    def record(self, path, ms, ok, detail=None):
+        with self.lock:
+            self.calls[path] += 1
+            self.lat_ms.setdefault(path, []).append(ms)
+            if not ok:
+                self.failed[path] += 1
+                if len(self.examples) < self.max_examples:
+                    self.examples.append(f"{path}: {detail}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_log.py
+Append-only result log for the Excel-logging SSM servers (ssm_server.py, ssm_desh.py).
+
+Request handlers call append(rows) which only queues the rows; a background
+flusher thread inserts everything queued so far into a SQLite table (WAL mode)
+every `flush_interval` seconds, or sooner once `batch_rows` are waiting, in one
+transaction. Each row costs the same no matter how long the run is, and readers
+(the dashboard, the Excel export) never block the writer.
+
+The rows use the old server_results.xlsx schema (COLUMNS); keys a row does not
+have are stored as NULL. Excel is only produced on demand:
+
+    log = ResultLog("server_results.sqlite")
+    log.append([{"timestamp_utc": t, "vehicle_id": "veh_1", "record_type": "ssm", ...}])
+    df = log.recent(8000)                      # DataFrame of the newest rows
+    buf = log.to_excel_bytes("server_results") # .xlsx of the whole log
+
+Flushes (rows, duration) and the pending rows are exported via metrics.REGISTRY.
+"""
+import atexit
+import io
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from metrics import REGISTRY
+
+COLUMNS = [
+    "timestamp_utc",
+    "vehicle_id",
+    "record_type",            # "ssm" | "alert" | "safe" | "vru_ssm" | "rsu_detection"
+    # ssm fields
+    "other_id",
+    "distance_m",
+    "closing_speed_mps",
+    "delta_v_mps",
+    "ttc_s",
+    "required_deceleration_mps2",
+    "time_headway_s",
+    # alert fields
+    "alert_type",
+    "alert_from",
+    "alert_to",
+    "risk_score",
+    "recommended_action",
+    "alert_ttc_s",
+    # VRU-only extras
+    "pet_s",
+    # RSU detection fields
+    "rsu_id",
+    "object_type",
+    "object_id",
+    "object_x",
+    "object_y",
+    "object_distance_m",
+    "object_speed_mps",
+    # raw
+    "raw_payload"
+]
+TEXT_COLUMNS = {"vehicle_id", "record_type", "other_id", "alert_type", "alert_from", "alert_to",
+                "recommended_action", "rsu_id", "object_type", "object_id", "raw_payload"}
+
+FLUSH_SECONDS = REGISTRY.histogram("result_log_flush_seconds", "Time of one result log flush (one transaction)")
+ROWS_WRITTEN = REGISTRY.counter("result_log_rows_written_total", "Rows written to the result log")
+
+
+class ResultLog:
+    def __init__(self, path, table="results", flush_interval=1.0, batch_rows=5000):
+        self.path = path
+        self.table = table
+        self.flush_interval = flush_interval
+        self.batch_rows = max(1, int(batch_rows))
+        self._pending = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        cols = ", ".join(f'"{c}" {"TEXT" if c in TEXT_COLUMNS else "REAL"}' for c in COLUMNS)
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols})')
+        self._db.commit()
+        self._insert = (f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(COLUMNS))})')
+
+        REGISTRY.gauge("result_log_pending_rows", "Rows queued for the next result log flush",
+                       fn=lambda: len(self._pending))
+        self._thread = threading.Thread(target=self._run, name="result-log-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, rows):
+        """Queue rows (dicts keyed by COLUMNS); never touches the disk."""
+        if not rows:
+            return
+        with self._cond:
+            self._pending.extend(rows)
+            if len(self._pending) >= self.batch_rows:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_rows:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print("[WARN] result log flush failed:", e)
+
+    def flush(self):
+        """Write every queued row now (one transaction); returns the number written."""
+        with self._write_lock:
+            with self._cond:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            t0 = time.perf_counter()
+            with self._db:
+                self._db.executemany(self._insert, ([r.get(c) for c in COLUMNS] for r in rows))
+            elapsed = time.perf_counter() - t0
+            self.rows_written += len(rows)
+            self.flushes += 1
+            self.last_flush_ms = elapsed * 1000.0
+            FLUSH_SECONDS.observe(elapsed)
+            ROWS_WRITTEN.inc(len(rows))
+            return len(rows)
+
+    def _read(self, sql, params=()):
+        with closing(sqlite3.connect(self.path)) as db:  # own connection: WAL readers do not block the writer
+            return pd.read_sql_query(sql, db, params=params)
+
+    def recent(self, n_rows=10000):
+        """DataFrame of the newest n_rows rows (oldest first), in COLUMNS order."""
+        df = self._read(f'SELECT * FROM "{self.table}" ORDER BY rowid DESC LIMIT ?', (int(n_rows),))
+        return df.iloc[::-1].reset_index(drop=True)
+
+    def to_excel_bytes(self, sheet_name):
+        """Whole log as an .xlsx workbook in memory (pending rows are flushed first)."""
+        self.flush()
+        df = self._read(f'SELECT * FROM "{self.table}" ORDER BY rowid')
+        buf = io.BytesIO()
+        with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+        buf.seek(0)
+        return buf
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {"path": self.path, "rows_written": self.rows_written, "pending": pending,
+                "flushes": self.flushes, "last_flush_ms": round(self.last_flush_ms, 3)}
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5.0)
+        try:
+            self.flush()
+        finally:
+            self._db.close()
@@ -13,14 +13,27 @@ Outputs:
   - lanes_log.csv
   - edges_log.csv
   - detectors_log.csv
+  - step_profile.csv + step_profile_summary.txt (with --profile)
+(or .parquet / .arrow with --log-format parquet|arrow, see columnar_log.py)
 """
 import os
 import sys
 import csv
 import time
-import math
+import queue
 import argparse
-import requests
+import threading
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from v2x_sender import DirectSender, V2XSender, POLICIES
+from ssm_response import VIEWS as RESPONSE_VIEWS
+from v2x_codec import CODECS
+from columnar_log import ColumnarWriter, FORMATS as COLUMNAR_FORMATS, EXTENSIONS as COLUMNAR_EXT
+import step_profiler
+from step_profiler import StepProfiler, NullProfiler
 
 # --- SUMO / TraCI bootstrap ---
 def _add_sumo_tools():
@@ -35,38 +48,286 @@ _add_sumo_tools()
 
 try:
     import traci
+    import traci.constants as tc
+    import sumolib
     from sumolib import checkBinary
 except Exception as e:
     print("[FATAL] Could not import TraCI / sumolib. Ensure SUMO is installed and SUMO_HOME is set.\n", e)
     sys.exit(1)
 
 
+# Flask SSM server (ssm_dash_noexcel_pet.py listens here by default)
+V2X_URL = "http://10.45.0.1:6000"
+
+
 # -------- CSV helpers --------
+FSYNC_MODES = ("step", "n-steps", "interval", "close")
+
+
+class CsvWriterThread:
+    """
+    Dedicated writer thread shared by several CsvWriter objects: row formatting
+    and disk I/O run here instead of on the TraCI thread. The queue is bounded,
+    so a disk that cannot keep up eventually applies back-pressure.
+    """
+
+    def __init__(self, max_queue=100000):
+        self._q = queue.Queue(maxsize=max_queue)
+        self._th = threading.Thread(target=self._run, name="csv-writer", daemon=True)
+        self._th.start()
+
+    def put(self, fn, *a):
+        self._q.put((fn, a))
+
+    def _run(self):
+        while True:
+            fn, a = self._q.get()
+            if fn is None:
+                return
+            try:
+                fn(*a)
+            except Exception as e:
+                print(f"[WARN] CSV writer thread: {e}")
+
+    def stop(self, timeout=30.0):
+        self._q.put((None, ()))
+        self._th.join(timeout)
+
+
 class CsvWriter:
-    def __init__(self, path, headers):
+    """
+    Row-wise CSV log with a configurable durability policy. flush() is called
+    once per simulation step; whether it reaches the disk depends on `fsync`:
+      - "step"     : flush + os.fsync every step (old behaviour)
+      - "n-steps"  : flush + fsync every `fsync_every` steps
+      - "interval" : flush + fsync at most every `fsync_interval` seconds
+      - "close"    : only on close(); rows stay in the `buffer_size` buffer
+    If `writer_thread` is given, write/flush/close are queued to it.
+    """
+
+    def __init__(self, path, headers, fsync="step", fsync_every=50, fsync_interval=5.0,
+                 buffer_size=1 << 20, writer_thread=None):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"unknown fsync mode {fsync!r} (expected one of {FSYNC_MODES})")
         self.path = path
         self.headers = headers
-        self._fh = open(self.path, "w", newline="")
-        self._wr = csv.DictWriter(self._fh, fieldnames=self.headers)
+        self.fsync = fsync
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = float(fsync_interval)
+        self._thread = writer_thread
+        self._steps = 0
+        self._last_sync = time.monotonic()
+        self._fh = open(self.path, "w", newline="", buffering=buffer_size)
+        # restval pads missing columns with "" (no per-row setdefault)
+        self._wr = csv.DictWriter(self._fh, fieldnames=self.headers, restval="")
         self._wr.writeheader()
         self.flush()
 
     def write(self, row: dict):
-        for h in self.headers:
-            row.setdefault(h, "")
-        self._wr.writerow(row)
+        if self._thread is not None:
+            self._thread.put(self._wr.writerow, row)
+        else:
+            self._wr.writerow(row)
 
     def flush(self):
+        if self._thread is not None:
+            self._thread.put(self._flush_now)
+        else:
+            self._flush_now()
+
+    def _flush_now(self):
+        self._steps += 1
+        if self.fsync == "step":
+            due = True
+        elif self.fsync == "n-steps":
+            due = self._steps % self.fsync_every == 0
+        elif self.fsync == "interval":
+            due = (time.monotonic() - self._last_sync) >= self.fsync_interval
+        else:
+            due = False
+        if due:
+            self._sync()
+
+    def _sync(self):
         self._fh.flush()
         os.fsync(self._fh.fileno())
+        self._last_sync = time.monotonic()
 
     def close(self):
+        if self._thread is not None:
+            self._thread.put(self._close_now)
+        else:
+            self._close_now()
+
+    def _close_now(self):
+        try:
+            self._sync()
+        except Exception:
+            pass
         try:
             self._fh.close()
         except:
             pass
 
 
+# -------- Log sinks --------
+# Column order + type of every log. CSV only uses the names; the columnar
+# sink (--log-format parquet/arrow) uses the kinds, with "dict" columns
+# dictionary-encoded.
+LOG_SCHEMAS = {
+    "vehicles_log": [
+        ("sim_time", "float"), ("veh_id", "dict"), ("type", "dict"), ("edge", "dict"), ("lane", "dict"),
+        ("lane_pos", "float"), ("x", "float"), ("y", "float"), ("speed", "float"), ("accel", "float"),
+        ("angle", "float"), ("route_id", "dict"), ("leader_id", "dict"), ("gap_to_leader", "float")
+    ],
+    "pedestrians_log": [
+        ("sim_time", "float"), ("person_id", "dict"), ("edge", "dict"), ("lane", "dict"),
+        ("x", "float"), ("y", "float"), ("speed", "float"), ("stage", "int")
+    ],
+    "rsus_log": [
+        ("sim_time", "float"), ("rsu_id", "dict"), ("x", "float"), ("y", "float"),
+        ("type", "dict"), ("range_m", "float")
+    ],
+    "rsu_detections": [
+        ("sim_time", "float"), ("rsu_id", "dict"), ("rsu_x", "float"), ("rsu_y", "float"),
+        ("obj_type", "dict"), ("obj_id", "dict"), ("obj_x", "float"), ("obj_y", "float"),
+        ("distance_m", "float"), ("speed_mps", "float")
+    ],
+    "lanes_log": [
+        ("sim_time", "float"), ("lane_id", "dict"), ("edge_id", "dict"), ("allowed_vclasses", "str"),
+        ("max_speed", "float"), ("mean_speed_last_step", "float"), ("veh_count_last_step", "int")
+    ],
+    "edges_log": [
+        ("sim_time", "float"), ("edge_id", "dict"), ("mean_speed_last_step", "float"),
+        ("traveltime_last_step", "float"), ("veh_count_last_step", "int")
+    ],
+    "detectors_log": [
+        ("sim_time", "float"), ("detector_id", "dict"), ("type", "dict"),
+        ("veh_count_last_step", "int"), ("mean_speed", "float"), ("veh_ids", "str")
+    ],
+    "step_profile": step_profiler.columns(),  # only written with --profile
+}
+LOG_FORMATS = ("csv",) + COLUMNAR_FORMATS
+
+
+def open_log(name, args, writer_thread=None):
+    """Open `name` (a LOG_SCHEMAS key) with the sink selected by --log-format."""
+    columns = LOG_SCHEMAS[name]
+    if args.log_format == "csv":
+        return CsvWriter(f"{name}.csv", [c for c, _ in columns],
+                         fsync=args.fsync, fsync_every=args.fsync_every, fsync_interval=args.fsync_interval,
+                         buffer_size=args.csv_buffer, writer_thread=writer_thread)
+    return ColumnarWriter(f"{name}{COLUMNAR_EXT[args.log_format]}", columns, fmt=args.log_format,
+                          row_group_steps=args.row_group_steps, writer_thread=writer_thread)
+
+
+# -------- State collection (getters vs. subscriptions) --------
+# Variables pulled for every vehicle/person each step. In "subscribe" mode these
+# are registered once on departure and read back in bulk with
+# getAllSubscriptionResults(), instead of one TraCI round-trip per getter.
+VEH_SUB_VARS = (
+    tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ANGLE, tc.VAR_LANE_ID, tc.VAR_ROAD_ID,
+    tc.VAR_LANEPOSITION, tc.VAR_TYPE, tc.VAR_ROUTE_ID, tc.VAR_ACCELERATION, tc.VAR_LEADER
+)
+VEH_SUB_PARAMS = {tc.VAR_LEADER: ("d", 1000.0)}  # same lookahead as getLeader(vid, 1000)
+
+PED_SUB_VARS = (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID, tc.VAR_LANE_ID, tc.VAR_STAGE)
+PED_SUB_PARAMS = {tc.VAR_STAGE: ("i", 0)}  # current stage, as getStage(pid)
+
+
+def subscribe_vehicle(veh_id):
+    traci.vehicle.subscribe(veh_id, VEH_SUB_VARS, parameters=VEH_SUB_PARAMS)
+
+
+def subscribe_person(person_id):
+    traci.person.subscribe(person_id, PED_SUB_VARS, parameters=PED_SUB_PARAMS)
+
+
+def read_vehicle_state(veh_id):
+    """Per-getter path: one TraCI call per value."""
+    x, y = traci.vehicle.getPosition(veh_id)
+    st = {
+        "x": x, "y": y,
+        "speed": traci.vehicle.getSpeed(veh_id),
+        "angle": traci.vehicle.getAngle(veh_id),
+        "lane_id": traci.vehicle.getLaneID(veh_id),
+        "edge_id": traci.vehicle.getRoadID(veh_id),
+        "lane_pos": traci.vehicle.getLanePosition(veh_id),
+        "vtype": traci.vehicle.getTypeID(veh_id),
+        "route_id": "", "accel": "", "leader": None
+    }
+    try:
+        st["route_id"] = traci.vehicle.getRouteID(veh_id)
+    except Exception:
+        pass
+    try:
+        st["accel"] = traci.vehicle.getAcceleration(veh_id)
+    except Exception:
+        pass
+    try:
+        st["leader"] = traci.vehicle.getLeader(veh_id, 1000)
+    except Exception:
+        pass
+    return st
+
+
+def vehicle_state_from_subscription(veh_id, results):
+    """
+    Subscription path: same dict as read_vehicle_state(), built from the
+    step's getAllSubscriptionResults(). A vehicle we have not subscribed yet
+    (e.g. it was already in the network) is subscribed on the spot.
+    """
+    res = results.get(veh_id)
+    if res is None:
+        subscribe_vehicle(veh_id)
+        res = traci.vehicle.getSubscriptionResults(veh_id)
+    x, y = res[tc.VAR_POSITION]
+    return {
+        "x": x, "y": y,
+        "speed": res[tc.VAR_SPEED],
+        "angle": res[tc.VAR_ANGLE],
+        "lane_id": res[tc.VAR_LANE_ID],
+        "edge_id": res[tc.VAR_ROAD_ID],
+        "lane_pos": res[tc.VAR_LANEPOSITION],
+        "vtype": res[tc.VAR_TYPE],
+        "route_id": res.get(tc.VAR_ROUTE_ID, ""),
+        "accel": res.get(tc.VAR_ACCELERATION, ""),
+        "leader": res.get(tc.VAR_LEADER)
+    }
+
+
+def read_person_state(person_id):
+    x, y = traci.person.getPosition(person_id)
+    st = {
+        "x": x, "y": y,
+        "speed": traci.person.getSpeed(person_id),
+        "edge": traci.person.getRoadID(person_id),
+        "lane": traci.person.getLaneID(person_id),
+        "stage": ""
+    }
+    try:
+        st["stage"] = traci.person.getStage(person_id).type
+    except Exception:
+        pass
+    return st
+
+
+def person_state_from_subscription(person_id, results):
+    res = results.get(person_id)
+    if res is None:
+        subscribe_person(person_id)
+        res = traci.person.getSubscriptionResults(person_id)
+    x, y = res[tc.VAR_POSITION]
+    stage = res.get(tc.VAR_STAGE)
+    return {
+        "x": x, "y": y,
+        "speed": res[tc.VAR_SPEED],
+        "edge": res[tc.VAR_ROAD_ID],
+        "lane": res[tc.VAR_LANE_ID],
+        "stage": "" if stage is None else stage.type
+    }
+
+
 # -------- RSU abstraction --------
 def list_rsus():
     rsus = []
@@ -98,6 +359,101 @@ def list_rsus():
     return rsus
 
 
+# -------- Static infrastructure registry --------
+def sumocfg_inputs(sumocfg):
+    """
+    Paths listed in the <input> section of a .sumocfg, resolved relative to it:
+    {"net-file": [...], "route-files": [...], "additional-files": [...]}.
+    """
+    out = {"net-file": [], "route-files": [], "additional-files": []}
+    try:
+        root = ET.parse(sumocfg).getroot()
+    except Exception as e:
+        print(f"[WARN] could not parse {sumocfg}: {e}")
+        return out
+    base = os.path.dirname(os.path.abspath(sumocfg))
+    for key in out:
+        for el in root.iter(key):
+            for v in el.get("value", "").split(","):
+                if v.strip():
+                    out[key].append(os.path.join(base, v.strip()))
+    return out
+
+
+def read_additional_infra(paths):
+    """
+    POIs and detector ids declared in additional files (e.g. corridor.add.xml).
+    Returns (pois, e1_ids, e2_ids); pois: id -> {"type","x","y","params"}.
+    """
+    pois, e1_ids, e2_ids = {}, [], []
+    for path in paths:
+        try:
+            root = ET.parse(path).getroot()
+        except Exception as e:
+            print(f"[WARN] could not parse additional file {path}: {e}")
+            continue
+        for el in root.iter("poi"):
+            if el.get("x") is None or el.get("y") is None:
+                continue  # lane-based POI: position only known to SUMO
+            pois[el.get("id")] = {
+                "type": el.get("type", ""),
+                "x": float(el.get("x")), "y": float(el.get("y")),
+                "params": {p.get("key"): p.get("value") for p in el.iter("param")}
+            }
+        for tag in ("inductionLoop", "e1Detector"):
+            e1_ids += [el.get("id") for el in root.iter(tag)]
+        for tag in ("laneAreaDetector", "e2Detector"):
+            e2_ids += [el.get("id") for el in root.iter(tag)]
+    return pois, e1_ids, e2_ids
+
+
+class InfraRegistry:
+    """
+    RSUs plus induction-loop (e1) and lane-area (e2) detector lists, built once
+    (from the additional files when they describe everything, else from TraCI)
+    and rebuilt only when one of the TraCI ID lists changes. Detection code gets
+    precomputed rsu_ids / rsu_xy / rsu_range arrays.
+    """
+
+    def __init__(self, additional_files=()):
+        self._xml = read_additional_infra(additional_files) if additional_files else None
+        self._key = None
+        self.rsus = []
+        self.e1_ids, self.e2_ids = [], []
+        self.rsu_ids, self.rsu_xy, self.rsu_range = rsu_arrays([])
+        self.version = 0
+
+    def _id_lists(self):
+        lists = []
+        for dom in ("rsu", "poi", "inductionloop", "lanearea"):
+            try:
+                lists.append(tuple(getattr(traci, dom).getIDList()) if hasattr(traci, dom) else ())
+            except Exception:
+                lists.append(())
+        return tuple(lists)
+
+    def refresh(self):
+        """Cheap per-step check; returns True when the registry was (re)built."""
+        key = self._id_lists()
+        if key == self._key:
+            return False
+        self._key = key
+        native_ids, poi_ids, e1_ids, e2_ids = key
+
+        xml_pois = self._xml[0] if self._xml else {}
+        if not native_ids and poi_ids and set(poi_ids) <= set(xml_pois):
+            # every POI is described by the additional files: no per-POI TraCI queries
+            self.rsus = [{"id": pid, "x": xml_pois[pid]["x"], "y": xml_pois[pid]["y"], "type": "poi_rsu",
+                          "range_m": xml_pois[pid]["params"].get("range_m", "")}
+                         for pid in poi_ids if str(xml_pois[pid]["type"]).upper() == "RSU"]
+        else:
+            self.rsus = list_rsus()
+        self.e1_ids, self.e2_ids = list(e1_ids), list(e2_ids)
+        self.rsu_ids, self.rsu_xy, self.rsu_range = rsu_arrays(self.rsus)
+        self.version += 1
+        return True
+
+
 # -------- RSU detection --------
 def _float_range(rsu_dict_entry, default=200.0):
     try:
@@ -106,58 +462,95 @@ def _float_range(rsu_dict_entry, default=200.0):
         return default
 
 
-def rsu_detect(rsu_list, veh_ids, ped_ids):
-    detections = []
-    for rsu in rsu_list:
-        rx, ry = rsu["x"], rsu["y"]
-        rng = _float_range(rsu)
-        rid = rsu["id"]
+def rsu_arrays(rsu_list):
+    """RSU list -> (ids, xy[R,2], range_m[R]) for the vectorized detector."""
+    ids = [r["id"] for r in rsu_list]
+    xy = np.array([(r["x"], r["y"]) for r in rsu_list], dtype=float).reshape(-1, 2)
+    rng = np.array([_float_range(r) for r in rsu_list], dtype=float)
+    return ids, xy, rng
 
-        # vehicles
-        for vid in veh_ids:
-            try:
-                vx, vy = traci.vehicle.getPosition(vid)
-                vspd = traci.vehicle.getSpeed(vid)
-                d = math.hypot(vx - rx, vy - ry)
-                if d <= rng:
-                    detections.append({
-                        "rsu_id": rid, "rsu_x": rx, "rsu_y": ry,
-                        "obj_type": "vehicle", "obj_id": vid,
-                        "obj_x": vx, "obj_y": vy,
-                        "distance_m": d, "speed_mps": vspd
-                    })
-            except Exception:
-                pass
 
-        # pedestrians
-        for pid in ped_ids:
-            try:
-                px, py = traci.person.getPosition(pid)
-                ps = traci.person.getSpeed(pid)
-                d = math.hypot(px - rx, py - ry)
-                if d <= rng:
-                    detections.append({
-                        "rsu_id": rid, "rsu_x": rx, "rsu_y": ry,
-                        "obj_type": "pedestrian", "obj_id": pid,
-                        "obj_x": px, "obj_y": py,
-                        "distance_m": d, "speed_mps": ps
-                    })
-            except Exception:
-                pass
-    return detections
+class StepObjects:
+    """Positions/speeds of the step's vehicles and pedestrians, as already read by the main loop."""
+
+    def __init__(self):
+        self.types, self.ids, self.x, self.y, self.speed = [], [], [], [], []
+
+    def add(self, obj_type, obj_id, x, y, speed):
+        self.types.append(obj_type)
+        self.ids.append(obj_id)
+        self.x.append(x)
+        self.y.append(y)
+        self.speed.append(speed)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# upper bound on RSU x object distances evaluated per broadcast block
+RSU_BLOCK_CELLS = 1 << 20
+
+
+def rsu_detect(rsu_ids, rsu_xy, rsu_range, objs):
+    """
+    All RSU-object distances in one NumPy broadcast against per-RSU range_m,
+    using the positions the main loop already collected (no TraCI calls).
+    Returns a columnar batch: dict of equal-length lists, ordered by RSU then
+    object (vehicles before pedestrians), like the old nested loops.
+    """
+    cols = ("rsu_id", "rsu_x", "rsu_y", "obj_type", "obj_id", "obj_x", "obj_y", "distance_m", "speed_mps")
+    if not rsu_ids or not len(objs):
+        return {c: [] for c in cols}
+
+    ox = np.asarray(objs.x, dtype=float)
+    oy = np.asarray(objs.y, dtype=float)
+    ri_parts, oi_parts, d_parts = [], [], []
+    step = max(1, RSU_BLOCK_CELLS // len(ox))
+    for r0 in range(0, len(rsu_ids), step):
+        bx = rsu_xy[r0:r0 + step, 0:1]
+        by = rsu_xy[r0:r0 + step, 1:2]
+        d = np.hypot(ox[None, :] - bx, oy[None, :] - by)            # [block, N]
+        ri, oi = np.nonzero(d <= rsu_range[r0:r0 + step, None])
+        ri_parts.append(ri + r0)
+        oi_parts.append(oi)
+        d_parts.append(d[ri, oi])
+    ri = np.concatenate(ri_parts)
+    oi = np.concatenate(oi_parts)
+
+    obj_types = np.asarray(objs.types, dtype=object)[oi]
+    obj_ids = np.asarray(objs.ids, dtype=object)[oi]
+    return {
+        "rsu_id": [rsu_ids[i] for i in ri.tolist()],
+        "rsu_x": rsu_xy[ri, 0].tolist(),
+        "rsu_y": rsu_xy[ri, 1].tolist(),
+        "obj_type": obj_types.tolist(),
+        "obj_id": obj_ids.tolist(),
+        "obj_x": ox[oi].tolist(),
+        "obj_y": oy[oi].tolist(),
+        "distance_m": np.concatenate(d_parts).tolist(),
+        "speed_mps": np.asarray(objs.speed, dtype=float)[oi].tolist(),
+    }
+
+
+def detection_rows(batch):
+    """Columnar detection batch -> row dicts (CSV / V2X payloads)."""
+    keys = list(batch.keys())
+    return [dict(zip(keys, vals)) for vals in zip(*(batch[k] for k in keys))]
 
 
 # -------- Detector helpers --------
-def poll_detectors():
+def poll_detectors(infra):
+    """Last-step readings for the registry's e1 (induction loop) and e2 (lane area) detectors."""
     rows = []
-    if hasattr(traci, "inductionloop"):
-        for did in traci.inductionloop.getIDList():
+    for dom, det_type, ids in (("inductionloop", "e1", infra.e1_ids), ("lanearea", "e2", infra.e2_ids)):
+        domain = getattr(traci, dom)
+        for did in ids:
             try:
-                vehs = traci.inductionloop.getLastStepVehicleIDs(did)
-                flow = traci.inductionloop.getLastStepVehicleNumber(did)
-                mean_speed = traci.inductionloop.getLastStepMeanSpeed(did)
+                vehs = domain.getLastStepVehicleIDs(did)
+                flow = domain.getLastStepVehicleNumber(did)
+                mean_speed = domain.getLastStepMeanSpeed(did)
                 rows.append({
-                    "detector_id": did, "type": "e1",
+                    "detector_id": did, "type": det_type,
                     "veh_count_last_step": flow,
                     "veh_ids": " ".join(vehs),
                     "mean_speed": round(mean_speed, 3)
@@ -180,83 +573,178 @@ def set_lane_change_mode_for_vehicle(veh_id):
         pass
 
 
-def _lane_allows_vclass(lane_id, vclass):
-    """
-    Returns True if lane allows the vclass (e.g., 'passenger', 'motorcycle').
-    If lane.getAllowed fails or returns empty, treat as allowed for safety.
-    """
-    try:
-        allowed = traci.lane.getAllowed(lane_id)
-        # if allowed is empty or contains 'all', treat as permissive
-        if not allowed:
-            return True
-        # allowed items may be bytes/strings; normalize
-        allowed_strs = [str(a).strip() for a in allowed]
-        if "all" in allowed_strs or "ALL" in allowed_strs:
-            return True
-        # If vclass appears, allow
-        if vclass in allowed_strs:
-            return True
-        # Some networks use vType ids in allowed; also check
-        return False
-    except Exception:
-        # If the API is not available, be permissive
-        return True
+def read_vtype_classes(paths):
+    """vType id -> vClass from route/additional files (SUMO's default vClass is passenger)."""
+    classes = {}
+    for path in paths:
+        try:
+            root = ET.parse(path).getroot()
+        except Exception as e:
+            print(f"[WARN] could not parse {path} for vTypes: {e}")
+            continue
+        for el in root.iter("vType"):
+            classes[el.get("id")] = el.get("vClass", "passenger")
+    return classes
 
 
-def find_allowed_lane_on_edge(vtype_id, edge_id):
+class LanePermissions:
     """
-    Search lanes on the given edge for a lane that allows the vehicle's vclass (vtype_id).
-    Returns target laneIndex (int) if found else None.
-    We assume lanes named edgeid_0, edgeid_1, ...
+    Lane permission index built once from the .net.xml with sumolib:
+      lane -> set of allowed vClasses
+      (edge, vClass) -> index of the first lane allowing it (or None)
+    plus the vType -> vClass map from the route files. Lookups for lanes/vTypes
+    not in the index fall back to TraCI once and are cached.
     """
-    try:
-        # obtain vehicle class from vType
-        vclass = None
-        try:
-            vclass = traci.vehicle.getVehicleClass(vtype_id)
-        except Exception:
-            # fallback: many vType -> vClass not directly accessible; assume mapping by vtype name
-            # crude mapping:
-            if vtype_id.startswith("car"):
-                vclass = "passenger"
-            elif vtype_id.startswith("mtw") or vtype_id.startswith("auto"):
-                vclass = "motorcycle"
-            elif vtype_id.startswith("truck"):
-                vclass = "truck"
-            elif vtype_id.startswith("bus"):
-                vclass = "bus"
-            elif vtype_id.startswith("bike"):
-                vclass = "bicycle"
-            else:
+
+    def __init__(self, net_file=None, vtype_classes=None):
+        self.vtype_class = dict(vtype_classes or {})
+        self.lane_allowed = {}      # lane_id -> frozenset(vClass) (empty = unrestricted)
+        self.edge_lanes = {}        # edge_id -> [lane_id by index]
+        self._edge_target = {}      # (edge_id, vclass) -> lane index | None
+        if net_file:
+            try:
+                net = sumolib.net.readNet(net_file, withInternal=True)
+                for edge in net.getEdges(withInternal=True):
+                    lanes = edge.getLanes()
+                    self.edge_lanes[edge.getID()] = [ln.getID() for ln in lanes]
+                    for ln in lanes:
+                        self.lane_allowed[ln.getID()] = frozenset(ln.getPermissions())
+            except Exception as e:
+                print(f"[WARN] could not index lane permissions from {net_file}: {e}")
+
+    def vclass_of(self, vtype):
+        vclass = self.vtype_class.get(vtype)
+        if vclass is None:
+            try:
+                vclass = traci.vehicletype.getVehicleClass(vtype)
+            except Exception:
                 vclass = "passenger"
-    except Exception:
-        vclass = "passenger"
+            self.vtype_class[vtype] = vclass
+        return vclass
 
-    # try get lane count for edge
-    try:
-        lane_count = traci.edge.getLaneNumber(edge_id)
-    except Exception:
-        # fallback: try scanning lane indices until one exists
-        lane_count = 0
-        while True:
-            lid = f"{edge_id}_{lane_count}"
+    def allows(self, lane_id, vclass):
+        """True if the lane allows vclass; unknown or unrestricted lanes are permissive."""
+        allowed = self.lane_allowed.get(lane_id)
+        if allowed is None:
             try:
-                traci.lane.getLength(lid)
-                lane_count += 1
-                if lane_count > 20:
-                    break
+                allowed = frozenset(str(a).strip() for a in traci.lane.getAllowed(lane_id))
             except Exception:
-                break
-        # if none found, return None
-        if lane_count == 0:
-            return None
+                allowed = frozenset()
+            self.lane_allowed[lane_id] = allowed
+        return not allowed or "all" in allowed or vclass in allowed
+
+    def allowed_lane_index(self, edge_id, vclass):
+        """Index of the first lane on edge_id that allows vclass, else None."""
+        key = (edge_id, vclass)
+        if key not in self._edge_target:
+            lanes = self.edge_lanes.get(edge_id)
+            if lanes is None:
+                try:
+                    n = traci.edge.getLaneNumber(edge_id)
+                except Exception:
+                    n = 0
+                lanes = self.edge_lanes[edge_id] = [f"{edge_id}_{i}" for i in range(n)]
+            self._edge_target[key] = next((i for i, ln in enumerate(lanes) if self.allows(ln, vclass)), None)
+        return self._edge_target[key]
+
+
+def check_lane_compliance(perms, vid, vtype, lane_id, edge_id):
+    """If the vehicle's lane disallows its vClass, request a change to an allowed lane on the same edge."""
+    vclass = perms.vclass_of(vtype)
+    if perms.allows(lane_id, vclass):
+        return
+    target_lane_idx = perms.allowed_lane_index(edge_id, vclass)
+    if target_lane_idx is not None:
+        try:
+            # perform lane change towards target lane index (duration 2.0s)
+            traci.vehicle.changeLane(vid, int(target_lane_idx), 2.0)
+            print(f"[INFO] Requested lane change for {vid} to lane {edge_id}_{target_lane_idx} (was {lane_id})")
+        except Exception as e:
+            print(f"[WARN] changeLane failed for {vid}: {e}")
+    else:
+        print(f"[WARN] No allowed lane found on edge {edge_id} for vtype {vtype} (vehicle {vid})")
+
+
+# -------- Entity lifecycle --------
+class Lifecycle:
+    """
+    Departure/arrival hooks driven by TraCI's departed/arrived ID lists, so
+    one-time setup (lane-change mode, subscriptions) and teardown (server-side
+    cleanup) run exactly once per entity instead of every step.
 
-    for lane_idx in range(lane_count):
-        lane_id = f"{edge_id}_{lane_idx}"
-        if _lane_allows_vclass(lane_id, vclass):
-            return lane_idx
-    return None
+        lc.on_depart("vehicle", fn)    # fn(entity_id, sim_time)
+        lc.on_arrive("person", fn)
+
+    Call step(t) once right after traci.simulationStep().
+    """
+    KINDS = {
+        "vehicle": ("getDepartedIDList", "getArrivedIDList"),
+        "person": ("getDepartedPersonIDList", "getArrivedPersonIDList"),
+    }
+
+    def __init__(self):
+        self._depart = {k: [] for k in self.KINDS}
+        self._arrive = {k: [] for k in self.KINDS}
+
+    def on_depart(self, kind, fn):
+        self._depart[kind].append(fn)
+
+    def on_arrive(self, kind, fn):
+        self._arrive[kind].append(fn)
+
+    def step(self, t):
+        for kind, (departed, arrived) in self.KINDS.items():
+            for hooks, getter in ((self._depart[kind], departed), (self._arrive[kind], arrived)):
+                if not hooks:
+                    continue
+                try:
+                    ids = getattr(traci.simulation, getter)()
+                except Exception:
+                    continue  # e.g. person arrivals on old SUMO versions
+                for eid in ids:
+                    for fn in hooks:
+                        try:
+                            fn(eid, t)
+                        except Exception as e:
+                            print(f"[WARN] {kind} lifecycle hook failed for {eid}: {e}")
+
+
+# -------- V2X client helpers --------
+VEH_PATH = "/v2x/check/vehicle"
+BATCH_PATH = "/v2x/check/vehicles/batch"
+TICK_CLOSE_PATH = "/v2x/tick/close"
+RSU_PATH = "/v2x/check/rsu"
+DEPARTED_PATH = "/v2x/vehicle/departed"
+ARRIVED_PATH = "/v2x/vehicle/arrived"
+
+
+def make_sender(args):
+    if args.sender == "background":
+        return V2XSender(args.v2x_url, workers=args.sender_workers,
+                         queue_size=args.sender_queue, policy=args.sender_policy, codec=args.v2x_codec)
+    return DirectSender(args.v2x_url, codec=args.v2x_codec)
+
+
+def response_options(args):
+    """The "response" object sent with vehicle updates (None: full replies)."""
+    if args.v2x_response == "full":
+        return None
+    opts = {"view": args.v2x_response}
+    if args.v2x_response == "top_k":
+        opts["k"] = args.v2x_top_k
+    if args.v2x_ttc_lt is not None:
+        opts["ttc_lt"] = args.v2x_ttc_lt
+    return opts
+
+
+def handle_v2x_responses(sender):
+    """Print alerts for whatever server replies have arrived since the last step."""
+    for path, key, resp in sender.poll():
+        if path == VEH_PATH:
+            print(f"[SSM] {key} alerts={resp.get('alerts')}")
+        elif path == BATCH_PATH:
+            for res in resp.get("results", []):
+                print(f"[SSM] {res.get('vehicle_id')} alerts={res.get('alerts')}")
 
 
 # -------- Main --------
@@ -272,96 +760,100 @@ def main(args):
     traci.start(sumo_cmd)
     print("[INFO] TraCI connected.")
 
-    veh_csv = CsvWriter("vehicles_log.csv", [
-        "sim_time", "veh_id", "type", "edge", "lane", "lane_pos",
-        "x", "y", "speed", "accel", "angle", "route_id", "leader_id", "gap_to_leader"
-    ])
-    ped_csv = CsvWriter("pedestrians_log.csv", [
-        "sim_time", "person_id", "edge", "lane", "x", "y", "speed", "stage"
-    ])
-    rsu_csv = CsvWriter("rsus_log.csv", ["sim_time", "rsu_id", "x", "y", "type", "range_m"])
-    rsu_det_csv = CsvWriter("rsu_detections.csv", [
-        "sim_time", "rsu_id", "rsu_x", "rsu_y", "obj_type", "obj_id", "obj_x", "obj_y", "distance_m", "speed_mps"
-    ])
-    lanes_csv = CsvWriter("lanes_log.csv", [
-        "sim_time", "lane_id", "edge_id", "allowed_vclasses", "max_speed",
-        "mean_speed_last_step", "veh_count_last_step"
-    ])
-    edges_csv = CsvWriter("edges_log.csv", [
-        "sim_time", "edge_id", "mean_speed_last_step", "traveltime_last_step", "veh_count_last_step"
-    ])
-    det_csv = CsvWriter("detectors_log.csv", [
-        "sim_time", "detector_id", "type", "veh_count_last_step", "mean_speed", "veh_ids"
-    ])
+    csv_thread = CsvWriterThread() if args.csv_thread else None
+    veh_csv = open_log("vehicles_log", args, csv_thread)
+    ped_csv = open_log("pedestrians_log", args, csv_thread)
+    rsu_csv = open_log("rsus_log", args, csv_thread)
+    rsu_det_csv = open_log("rsu_detections", args, csv_thread)
+    lanes_csv = open_log("lanes_log", args, csv_thread)
+    edges_csv = open_log("edges_log", args, csv_thread)
+    det_csv = open_log("detectors_log", args, csv_thread)
+    sender = make_sender(args)
+    response_opts = response_options(args)
+
+    cfg_inputs = sumocfg_inputs(args.sumocfg)
+    additional = list(cfg_inputs["additional-files"])
+    if args.additional:
+        additional += [a.strip() for a in args.additional.split(",") if a.strip()]
+    infra = InfraRegistry(additional)
+
+    perms = LanePermissions(cfg_inputs["net-file"][0] if cfg_inputs["net-file"] else None,
+                            read_vtype_classes(cfg_inputs["route-files"] + additional))
+    last_lane = {}  # vid -> lane id at the last compliance check
+
+    subscribe = (args.collect == "subscribe")
+    departed = []   # vehicles that entered during the current step
+    arrived = []    # vehicles that left during the current step
+    lifecycle = Lifecycle()
+    # Ensure permissive lane-change mode to allow escaping bad lanes (once per vehicle)
+    lifecycle.on_depart("vehicle", lambda vid, t: set_lane_change_mode_for_vehicle(vid))
+    if subscribe:
+        lifecycle.on_depart("vehicle", lambda vid, t: subscribe_vehicle(vid))
+        lifecycle.on_depart("person", lambda pid, t: subscribe_person(pid))
+    lifecycle.on_depart("vehicle", lambda vid, t: departed.append(vid))
+    lifecycle.on_arrive("vehicle", lambda vid, t: last_lane.pop(vid, None))
+    lifecycle.on_arrive("vehicle", lambda vid, t: arrived.append(vid))
+
+    if args.profile:
+        prof = StepProfiler(window=args.profile_window)
+        prof_csv = open_log("step_profile", args, csv_thread)
+    else:
+        prof, prof_csv = NullProfiler(), None
 
     try:
         while traci.simulation.getMinExpectedNumber() > 0:
+            prof.begin_step()
             traci.simulationStep()
             t = traci.simulation.getTime()
+            prof.mark("sumo_step")
+            lifecycle.step(t)
+            if departed:
+                # sent before this step's vehicle updates; clears state of reused ids
+                sender.submit(DEPARTED_PATH, {"sim_time": t, "ids": departed[:]}, ordered=True)
+                departed.clear()
+            prof.mark("lifecycle")
 
             # --- Vehicles ---
             vids = traci.vehicle.getIDList()
+            batch_payloads = []
+            objs = StepObjects()
+            if subscribe:
+                veh_results = traci.vehicle.getAllSubscriptionResults()
+            prof.mark("veh_state")
             for vid in vids:
                 try:
-                    x, y = traci.vehicle.getPosition(vid)
-                    speed = traci.vehicle.getSpeed(vid)
-                    angle = traci.vehicle.getAngle(vid)
-                    lane_id = traci.vehicle.getLaneID(vid)
-                    edge_id = traci.vehicle.getRoadID(vid)
-                    lane_pos = traci.vehicle.getLanePosition(vid)
-                    vtype = traci.vehicle.getTypeID(vid)
-                    route_id = ""
-                    try:
-                        route_id = traci.vehicle.getRouteID(vid)
-                    except Exception:
-                        pass
-                    accel = ""
-                    try:
-                        accel = traci.vehicle.getAcceleration(vid)
-                    except Exception:
-                        pass
-
-                    # Ensure permissive lane-change mode to allow escaping bad lanes
-                    set_lane_change_mode_for_vehicle(vid)
+                    st = vehicle_state_from_subscription(vid, veh_results) if subscribe else read_vehicle_state(vid)
+                    x, y = st["x"], st["y"]
+                    speed, angle = st["speed"], st["angle"]
+                    objs.add("vehicle", vid, x, y, speed)
+                    prof.mark("veh_state")
+                    lane_id, edge_id = st["lane_id"], st["edge_id"]
+                    lane_pos, vtype = st["lane_pos"], st["vtype"]
+                    route_id, accel = st["route_id"], st["accel"]
 
                     # get leader info if available
                     leader_id, gap = (None, None)
-                    try:
-                        leader = traci.vehicle.getLeader(vid, 1000)
-                        if leader:
-                            leader_id, gap = leader
-                    except Exception:
-                        leader_id, gap = (None, None)
-
-                    # check if current lane allows this vehicle type; if not, try to move to allowed lane on same edge
-                    try:
-                        if lane_id and edge_id:
-                            allowed_ok = _lane_allows_vclass(lane_id, vtype)
-                            if not allowed_ok:
-                                target_lane_idx = find_allowed_lane_on_edge(vtype, edge_id)
-                                if target_lane_idx is not None:
-                                    try:
-                                        # perform lane change towards target lane index (duration 2.0s)
-                                        traci.vehicle.changeLane(vid, int(target_lane_idx), 2.0)
-                                        print(f"[INFO] Requested lane change for {vid} to lane {edge_id}_{target_lane_idx} (was {lane_id})")
-                                    except Exception as e:
-                                        print(f"[WARN] changeLane failed for {vid}: {e}")
-                                else:
-                                    print(f"[WARN] No allowed lane found on edge {edge_id} for vtype {vtype} (vehicle {vid})")
-                    except Exception as e:
-                        print(f"[WARN] lane-allowance check failed for {vid}: {e}")
+                    if st["leader"]:
+                        leader_id, gap = st["leader"]
+
+                    # lane permissions only need re-checking when the vehicle's lane changes
+                    if lane_id and edge_id and last_lane.get(vid) != lane_id:
+                        last_lane[vid] = lane_id
+                        try:
+                            check_lane_compliance(perms, vid, vtype, lane_id, edge_id)
+                        except Exception as e:
+                            print(f"[WARN] lane-allowance check failed for {vid}: {e}")
+                    prof.mark("lane_fix")
 
                     # --- Send vehicle data to Flask ---
-                    payload = {"id": vid, "position": [x, y], "speed": speed, "heading": angle}
-                    try:
-                        r = requests.post("http://10.45.0.1:6000/v2x/check/vehicle", json=payload, timeout=5.0)
-                        if r.ok:
-                            resp = r.json()
-                            print(f"[SSM] {vid} alerts={resp.get('alerts')}")
-                        else:
-                            print(f"[WARN] Flask responded {r.status_code}")
-                    except Exception as e:
-                        print(f"[ERROR] V2X vehicle endpoint error for {vid}: {e}")
+                    payload = {"id": vid, "position": [x, y], "speed": speed, "heading": angle, "sim_time": t}
+                    if args.v2x_mode == "batch":
+                        batch_payloads.append(payload)
+                    else:
+                        if response_opts:
+                            payload["response"] = response_opts
+                        sender.submit(VEH_PATH, payload, key=vid)
+                    prof.mark("v2x_send")
 
                     veh_csv.write({
                         "sim_time": t, "veh_id": vid, "type": vtype,
@@ -372,62 +864,84 @@ def main(args):
                         "leader_id": leader_id if leader_id else "",
                         "gap_to_leader": "" if gap is None else round(gap, 3)
                     })
+                    prof.mark("csv_write")
                 except Exception as e:
                     print(f"[WARN] vehicle read failed for {vid}: {e}")
 
+            if args.v2x_mode == "batch" and batch_payloads:
+                step_payload = {"sim_time": t, "vehicles": batch_payloads}
+                if response_opts:
+                    step_payload["response"] = response_opts
+                sender.submit(BATCH_PATH, step_payload, key="step")
+            elif vids:
+                # all of this step's vehicles are in: let the server evaluate the tick now;
+                # ordered, so it reaches the server after every update of the step
+                sender.submit(TICK_CLOSE_PATH, {"sim_time": t}, ordered=True)
+            if arrived:
+                # server-side cleanup for vehicles that left the network this step
+                sender.submit(ARRIVED_PATH, {"sim_time": t, "ids": arrived[:]}, ordered=True)
+                arrived.clear()
+            prof.mark("v2x_send")
+
             # --- Pedestrians ---
             pids = traci.person.getIDList()
+            if subscribe:
+                ped_results = traci.person.getAllSubscriptionResults()
+            prof.mark("ped_state")
             for pid in pids:
                 try:
-                    x, y = traci.person.getPosition(pid)
-                    speed = traci.person.getSpeed(pid)
-                    edge = traci.person.getRoadID(pid)
-                    lane = traci.person.getLaneID(pid)
-                    stage = ""
-                    try:
-                        stage = traci.person.getStage(pid).type
-                    except Exception:
-                        pass
+                    ps = person_state_from_subscription(pid, ped_results) if subscribe else read_person_state(pid)
+                    objs.add("pedestrian", pid, ps["x"], ps["y"], ps["speed"])
+                    prof.mark("ped_state")
                     ped_csv.write({
-                        "sim_time": t, "person_id": pid, "edge": edge, "lane": lane,
-                        "x": round(x, 2), "y": round(y, 2), "speed": round(speed, 3),
-                        "stage": stage
+                        "sim_time": t, "person_id": pid, "edge": ps["edge"], "lane": ps["lane"],
+                        "x": round(ps["x"], 2), "y": round(ps["y"], 2), "speed": round(ps["speed"], 3),
+                        "stage": ps["stage"]
                     })
+                    prof.mark("csv_write")
                 except Exception as e:
                     print(f"[WARN] pedestrian read failed for {pid}: {e}")
 
-            # --- RSUs ---
-            rsus = list_rsus()
-            for r in rsus:
-                rsu_csv.write({
-                    "sim_time": t, "rsu_id": r.get("id"),
-                    "x": round(r.get("x", 0.0), 2), "y": round(r.get("y", 0.0), 2),
-                    "type": r.get("type", ""), "range_m": r.get("range_m", "")
-                })
+            # --- RSUs (static: logged only when the registry is (re)built) ---
+            if infra.refresh():
+                for r in infra.rsus:
+                    rsu_csv.write({
+                        "sim_time": t, "rsu_id": r.get("id"),
+                        "x": round(r.get("x", 0.0), 2), "y": round(r.get("y", 0.0), 2),
+                        "type": r.get("type", ""), "range_m": r.get("range_m", "")
+                    })
+            prof.mark("infra")
 
             # RSU detections + send to Flask
-            detections = rsu_detect(rsus, vids, pids)
+            detections = detection_rows(rsu_detect(infra.rsu_ids, infra.rsu_xy, infra.rsu_range, objs))
+            prof.mark("rsu_detect")
             for d in detections:
                 d["sim_time"] = t
                 rsu_det_csv.write(d)
-                try:
-                    r = requests.post("http://10.45.0.1:6000/v2x/check/rsu", json=d, timeout=5.0)
-                    if not r.ok:
-                        print(f"[WARN] Flask RSU endpoint responded {r.status_code}")
-                except Exception as e:
-                    print(f"[ERROR] V2X RSU endpoint error: {e}")
+                prof.mark("csv_write")
+                sender.submit(RSU_PATH, d, key=f"{d['rsu_id']}:{d['obj_id']}")
+                prof.mark("v2x_send")
+
+            handle_v2x_responses(sender)
+            prof.mark("v2x_responses")
 
             # --- Detectors ---
-            for row in poll_detectors():
+            for row in poll_detectors(infra):
                 row["sim_time"] = t
                 det_csv.write(row)
+            prof.mark("detectors")
 
             # --- Flush CSVs ---
             veh_csv.flush(); ped_csv.flush(); rsu_csv.flush()
             rsu_det_csv.flush(); lanes_csv.flush(); edges_csv.flush(); det_csv.flush()
+            prof.mark("csv_flush")
+
+            if prof_csv is not None:
+                prof_csv.write(prof.end_step(t))
+                prof_csv.flush()
 
             if int(t) % 5 == 0:
-                print(f"[{t:6.1f}s] vehicles={len(vids)} peds={len(pids)} rsus={len(rsus)}")
+                print(f"[{t:6.1f}s] vehicles={len(vids)} peds={len(pids)} rsus={len(infra.rsus)} {prof.status()}".rstrip())
 
         print("[INFO] Simulation ended.")
 
@@ -438,11 +952,23 @@ def main(args):
             traci.close()
         except:
             pass
-        for w in (veh_csv, ped_csv, rsu_csv, rsu_det_csv, lanes_csv, edges_csv, det_csv):
+        sender.close()
+        handle_v2x_responses(sender)
+        print("[INFO] V2X sender:", sender.stats())
+        if prof.steps:
+            report = prof.summary()
+            print(report)
+            with open("step_profile_summary.txt", "w") as f:
+                f.write(report + "\n")
+        for w in (veh_csv, ped_csv, rsu_csv, rsu_det_csv, lanes_csv, edges_csv, det_csv, prof_csv):
+            if w is None:
+                continue
             try:
                 w.close()
             except:
                 pass
+        if csv_thread is not None:
+            csv_thread.stop()
         print("[INFO] Closed TraCI and CSVs. Bye!")
 
 
@@ -452,6 +978,44 @@ if __name__ == "__main__":
     ap.add_argument("--gui", action="store_true", help="Use sumo-gui instead of sumo")
     ap.add_argument("--step-length", type=float, default=None, help="Override step-length (s)")
     ap.add_argument("--additional", type=str, default=None, help="Additional files")
+    ap.add_argument("--collect", choices=["getters", "subscribe"], default="getters",
+                    help="How per-step vehicle/person state is read: one TraCI call per value (getters) "
+                         "or bulk subscription results (subscribe)")
+    ap.add_argument("--v2x-url", type=str, default=V2X_URL, help="Base URL of the SSM server")
+    ap.add_argument("--v2x-mode", choices=["per-vehicle", "batch"], default="per-vehicle",
+                    help="POST each vehicle to /v2x/check/vehicle, or the whole step to /v2x/check/vehicles/batch")
+    ap.add_argument("--v2x-response", choices=RESPONSE_VIEWS, default="alerts",
+                    help="Reply shape asked from the SSM server: alerts only (all this client prints), "
+                         "the k riskiest pairs, pairs under a TTC threshold, or every pair")
+    ap.add_argument("--v2x-top-k", type=int, default=5, help="Pairs per vehicle for --v2x-response top_k")
+    ap.add_argument("--v2x-ttc-lt", type=float, default=None,
+                    help="Only pairs with TTC below this (s); required for --v2x-response threshold")
+    ap.add_argument("--v2x-codec", choices=CODECS, default="fast-json",
+                    help="Wire format of V2X messages: stdlib JSON, orjson-encoded JSON (same wire format), "
+                         "or MessagePack (servers with v2x_codec.install)")
+    ap.add_argument("--sender", choices=["direct", "background"], default="direct",
+                    help="direct: blocking POST per message; background: pooled session + worker threads")
+    ap.add_argument("--sender-workers", type=int, default=2, help="Background sender worker threads")
+    ap.add_argument("--sender-queue", type=int, default=2000, help="Background sender queue capacity")
+    ap.add_argument("--sender-policy", choices=POLICIES, default="latest",
+                    help="When the queue is full: drop new messages, or keep only the latest per vehicle")
+    ap.add_argument("--log-format", choices=LOG_FORMATS, default="csv",
+                    help="Log sink: row-wise CSV, or columnar Parquet / Arrow IPC files")
+    ap.add_argument("--row-group-steps", type=int, default=50,
+                    help="Steps per Parquet row group / Arrow record batch")
+    ap.add_argument("--fsync", choices=FSYNC_MODES, default="step",
+                    help="CSV durability: fsync every step, every N steps, every T seconds, or only on close")
+    ap.add_argument("--fsync-every", type=int, default=50, help="Steps between fsyncs for --fsync n-steps")
+    ap.add_argument("--fsync-interval", type=float, default=5.0, help="Seconds between fsyncs for --fsync interval")
+    ap.add_argument("--csv-buffer", type=int, default=1 << 20, help="Per-file write buffer in bytes")
+    ap.add_argument("--csv-thread", action="store_true",
+                    help="Format and write log rows on a dedicated thread instead of the TraCI loop")
+    ap.add_argument("--profile", action="store_true",
+                    help="Time each loop phase and count TraCI calls per step (step_profile table + summary)")
+    ap.add_argument("--profile-window", type=int, default=1000,
+                    help="Steps kept for the rolling percentiles of --profile")
     args = ap.parse_args()
+    if args.v2x_response == "threshold" and args.v2x_ttc_lt is None:
+        ap.error("--v2x-response threshold needs --v2x-ttc-lt")
     main(args)
 
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+spatial_index.py
+Uniform hash grid over live vehicle positions, shared by the SSM servers so a
+/v2x/check/vehicle call only evaluates nearby vehicles instead of every entry
+in vehicle_states.
+
+A pair (a, b) is "in range" when
+
+    distance <= max(radius, horizon * (speed_a + speed_b))
+
+i.e. within a fixed interaction radius, or close enough to meet within the
+time horizon at their current speeds (horizon=0 disables the second term).
+The rule is symmetric, so the batch endpoint can still evaluate each pair once.
+The horizon search reach uses the largest speed among the live entries; it is
+recomputed when the fastest entry slows down or is removed, so one outlier
+speed (a teleport, a bad payload) widens queries only while it is present.
+
+    grid = SpatialGrid(cell_size=150.0)
+    grid.update("veh_1", x, y, speed)
+    near = grid.neighbors("veh_1", radius=150.0, horizon=5.0)
+    grid.remove("veh_1")
+"""
+import math
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=150.0):
+        self.cell = max(float(cell_size), 1e-6)
+        self._cells = {}     # (cx, cy) -> set(ids)
+        self._where = {}     # id -> (cx, cy)
+        self._state = {}     # id -> (x, y, speed)
+        self._max_speed = 0.0  # largest live speed (bounds the horizon query)
+        self._max_stale = False  # the fastest entry slowed down or left: recompute on read
+
+    def _key(self, x, y):
+        return (math.floor(x / self.cell), math.floor(y / self.cell))
+
+    def update(self, oid, x, y, speed=0.0):
+        key = self._key(x, y)
+        old = self._where.get(oid)
+        if old != key:
+            if old is not None:
+                cell = self._cells[old]
+                cell.discard(oid)
+                if not cell:
+                    del self._cells[old]
+            self._cells.setdefault(key, set()).add(oid)
+            self._where[oid] = key
+        old_state = self._state.get(oid)
+        self._state[oid] = (x, y, speed)
+        if speed >= self._max_speed:
+            self._max_speed = speed
+        elif old_state is not None and old_state[2] >= self._max_speed:
+            self._max_stale = True
+
+    def remove(self, oid):
+        key = self._where.pop(oid, None)
+        state = self._state.pop(oid, None)
+        if state is not None and state[2] >= self._max_speed:
+            self._max_stale = True
+        if key is not None:
+            cell = self._cells[key]
+            cell.discard(oid)
+            if not cell:
+                del self._cells[key]
+
+    @property
+    def max_speed(self):
+        """Largest speed among the live entries (0.0 when empty)."""
+        if self._max_stale:
+            self._max_speed = max((s[2] for s in self._state.values()), default=0.0)
+            self._max_stale = False
+        return self._max_speed
+
+    def __contains__(self, oid):
+        return oid in self._where
+
+    def __len__(self):
+        return len(self._where)
+
+    def neighbors(self, oid, radius, horizon=0.0):
+        """Ids of the objects in range of `oid` (see module docstring), excluding itself."""
+        x, y, speed = self._state[oid]
+        reach = max(radius, horizon * (speed + self.max_speed))
+        span = int(math.ceil(reach / self.cell))
+        cx, cy = self._where[oid]
+        out = []
+        for gx in range(cx - span, cx + span + 1):
+            for gy in range(cy - span, cy + span + 1):
+                cell = self._cells.get((gx, gy))
+                if not cell:
+                    continue
+                for other in cell:
+                    if other == oid:
+                        continue
+                    ox, oy, ospeed = self._state[other]
+                    if math.hypot(ox - x, oy - y) <= max(radius, horizon * (speed + ospeed)):
+                        out.append(other)
+        return out
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ssm_bench.py
+Microbenchmarks of the SSM math with stored baselines and a regression budget.
+
+Cases, each on fixed seeded corridor traffic (load_bench.Corridor) per fleet size N:
+  euclidean_distance, project_speed_along_line, compute_ttc,
+  required_deceleration, time_headway
+                                the scalar helpers of the servers before ssm_kernel,
+                                kept here as the reference (one call each)
+  will_collide                  surrogate_safety/v2x_server.py's pair check, which
+                                still runs on every pair there
+  velocity, point_metrics       scalar kernel entry points (one VRU check)
+  will_collide_loop[N]          v2x_server's per-request loop: one ego vs the N-1 others
+  scalar_pair_loop[N]           the pure-Python per-pair loop the kernel replaced
+                                (one ego vs the N-1 others), kept as the reference
+  ego_metrics[N]                one ego vs the N-1 others in one kernel pass
+  pair_list_metrics[N]          all neighbour pairs of a step (spatial grid) in one pass
+  tick_evaluate[N]              TickEngine.evaluate() of a whole step: neighbour
+                                search, kernel, per-vehicle grouping (the full
+                                per-request pair evaluation of the servers)
+
+Each case is timed with timeit (loop count from autorange, best of --repeat) and
+reported as throughput in its unit (calls/s or pairs/s). Before timing, the
+kernel is checked against the scalar reference on the same inputs; a mismatch
+exits with 2, so a faster but wrong change cannot pass.
+
+--save writes the results as the baseline; later runs compare against it and
+exit with 1 when a case's throughput drops by more than --budget (a fraction,
+default 0.10). Baselines are machine specific: save one per machine.
+
+    python ssm_bench.py --save                 # record ssm_bench_baseline.json
+    python ssm_bench.py --budget 0.15          # after a change: compare, fail on regressions
+    python ssm_bench.py --cases "tick|ego" --sizes 100,1000
+"""
+import argparse
+import ast
+import json
+import math
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+
+import numpy as np
+
+import ssm_kernel
+from load_bench import Corridor
+from tick_engine import TickEngine
+from vehicle_store import VehicleStore
+
+NEIGHBOR_RADIUS_M = 150.0   # as in the servers
+NEIGHBOR_HORIZON_S = 5.0
+
+
+# ---- scalar reference (the servers' helpers and per-pair loop body before ssm_kernel) ----
+def euclidean_distance(p1, p2):
+    dx = p1[0] - p2[0]
+    dy = p1[1] - p2[1]
+    return math.hypot(dx, dy)
+
+
+def unit_vector(vx, vy):
+    mag = math.hypot(vx, vy)
+    if mag == 0.0:
+        return 0.0, 0.0
+    return vx / mag, vy / mag
+
+
+def project_speed_along_line(pos_rel, heading_speed_vec):
+    """Closing speed of rel. velocity ego_v - other_v along pos_rel = other - ego (+ve when closing)."""
+    dx, dy = pos_rel
+    ux, uy = unit_vector(dx, dy)
+    rvx, rvy = heading_speed_vec
+    return -(rvx * ux + rvy * uy)
+
+
+def compute_ttc(distance, closing_speed):
+    if closing_speed <= 0 or distance <= 0:
+        return math.inf
+    return distance / closing_speed
+
+
+def required_deceleration(rel_speed, distance, cushion=0.0):
+    d_eff = max(distance - cushion, 1e-3)
+    return (rel_speed ** 2) / (2.0 * d_eff)
+
+
+def time_headway(distance, follower_speed):
+    if follower_speed <= 0:
+        return math.inf
+    return distance / follower_speed
+
+
+def scalar_pair(pos, speed, heading, opos, ospeed, ohead):
+    """(distance, closing, delta_v, ttc, req_dec, thw) of one ego/other pair in plain Python."""
+    distance = euclidean_distance(pos, opos)
+    vx, vy = speed * math.cos(math.radians(heading)), speed * math.sin(math.radians(heading))
+    ovx, ovy = ospeed * math.cos(math.radians(ohead)), ospeed * math.sin(math.radians(ohead))
+    rvx, rvy = vx - ovx, vy - ovy
+    closing = project_speed_along_line((opos[0] - pos[0], opos[1] - pos[1]), (rvx, rvy))
+    ttc = compute_ttc(distance, closing)
+    delta_v = math.hypot(rvx, rvy)
+    req_dec = required_deceleration(delta_v, distance)
+    thw = time_headway(distance, speed)
+    return distance, closing, delta_v, ttc, req_dec, thw
+
+
+def scalar_ego_loop(states, ego):
+    e = states[ego]
+    return [scalar_pair(e["position"], e["speed"], e["heading"], o["position"], o["speed"], o["heading"])
+            for vid, o in states.items() if vid != ego]
+
+
+def load_will_collide():
+    """
+    will_collide of surrogate_safety/v2x_server.py. That script starts its Flask
+    app on import, so only its helper definitions are compiled from the source.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "surrogate_safety", "v2x_server.py")
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    tree.body = [n for n in tree.body
+                 if isinstance(n, ast.FunctionDef) and n.name in ("euclidean_distance", "will_collide")]
+    ns = {"math": math}
+    exec(compile(tree, path, "exec"), ns)
+    return ns["will_collide"]
+
+
+def will_collide_loop(will_collide, states, ego):
+    """v2x_server's check_vehicle_risk loop body: will_collide against every other live vehicle."""
+    e = states[ego]
+    return [will_collide(e["position"], o["position"], e["speed"], o["speed"])
+            for vid, o in states.items() if vid != ego]
+
+
+# ---- inputs ----
+class Fleet:
+    """Seeded corridor state of N vehicles, loaded into a VehicleStore and a TickEngine."""
+
+    def __init__(self, n, seed=0):
+        c = Corridor(n, 0, seed=seed)
+        c.step()
+        self.store = VehicleStore(ttl_sim=None, ttl_wall=None, cell_size=NEIGHBOR_RADIUS_M)
+        for i, vid in enumerate(c.veh_ids):
+            self.store.upsert(vid, (float(c.vx[i]), float(c.vy[i])), float(c.v_speed[i]),
+                              float(c.v_heading[i]), sim_time=c.sim_time)
+        self.ids = list(c.veh_ids)
+        self.ego = self.ids[0]
+        self.others = self.ids[1:]
+        self.states = {vid: dict(s) for vid, s in self.store.snapshot().items()}
+        self.engine = TickEngine(self.store, NEIGHBOR_RADIUS_M, NEIGHBOR_HORIZON_S,
+                                 lambda vid, pairs, out_of_range, ts: len(pairs), deadline_s=None)
+        egos, others = [], []
+        for a in self.ids:
+            for b in self.store.neighbors(a, NEIGHBOR_RADIUS_M, NEIGHBOR_HORIZON_S):
+                egos.append(a)
+                others.append(b)
+        self.pair_egos, self.pair_others = egos, others
+
+
+def check_kernel(fleet):
+    """Largest difference between ego_metrics and the scalar reference (inf must match inf)."""
+    ref = np.array(scalar_ego_loop(fleet.states, fleet.ego)).reshape(-1, 6)
+    m = ssm_kernel.ego_metrics(fleet.store.table, fleet.ego, fleet.others)
+    worst = 0.0
+    for col, key in enumerate(("distance", "closing", "delta_v", "ttc", "req_dec", "thw")):
+        a, b = np.asarray(m[key], dtype=float), ref[:, col]
+        if not np.array_equal(np.isinf(a), np.isinf(b)):
+            return math.inf
+        fin = ~np.isinf(a)
+        if fin.any():
+            worst = max(worst, float(np.max(np.abs(a[fin] - b[fin]) / np.maximum(1.0, np.abs(b[fin])))))
+    return worst
+
+
+def cases(sizes, seed):
+    """(name, fn, units per call, unit)."""
+    ego, other = (100.0, 5.0), (130.0, 14.0)
+    will_collide = load_will_collide()
+    out = [
+        ("euclidean_distance", lambda: euclidean_distance(ego, other), 1, "calls"),
+        ("project_speed_along_line", lambda: project_speed_along_line((30.0, 9.0), (13.9, -1.3)), 1, "calls"),
+        ("compute_ttc", lambda: compute_ttc(31.3, 12.1), 1, "calls"),
+        ("required_deceleration", lambda: required_deceleration(12.1, 31.3), 1, "calls"),
+        ("time_headway", lambda: time_headway(31.3, 13.9), 1, "calls"),
+        ("will_collide", lambda: will_collide(ego, (106.0, 5.0), 13.9, 8.2), 1, "calls"),
+        ("velocity", lambda: ssm_kernel.velocity(13.9, 87.5), 1, "calls"),
+        ("point_metrics", lambda: ssm_kernel.point_metrics((100.0, 5.0), 13.9, 0.0, (130.0, 14.0), 1.3, 270.0,
+                                                           pet_speed=1.3), 1, "calls"),
+    ]
+    for n in sizes:
+        f = Fleet(n, seed)
+        out += [
+            (f"scalar_pair_loop[{n}]", lambda f=f: scalar_ego_loop(f.states, f.ego), n - 1, "pairs"),
+            (f"will_collide_loop[{n}]", lambda f=f: will_collide_loop(will_collide, f.states, f.ego), n - 1, "pairs"),
+            (f"ego_metrics[{n}]", lambda f=f: ssm_kernel.ego_metrics(f.store.table, f.ego, f.others), n - 1, "pairs"),
+            (f"pair_list_metrics[{n}]",
+             lambda f=f: ssm_kernel.pair_list_metrics(f.store.table, f.pair_egos, f.pair_others),
+             len(f.pair_egos), "pairs"),
+            (f"tick_evaluate[{n}]", lambda f=f: f.engine.evaluate(f.ids), n, "vehicles"),
+        ]
+    return out
+
+
+def measure(fn, repeat, min_time):
+    """Best seconds per call over `repeat` runs of at least min_time each."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(number, int(math.ceil(number * min_time / 0.2)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main(args):
+    sizes = [int(n) for n in args.sizes.split(",") if n.strip()]
+    pick = re.compile(args.cases) if args.cases else None
+
+    err = check_kernel(Fleet(min(sizes), args.seed))
+    if err > 1e-9:
+        print(f"[FAIL] ssm_kernel differs from the scalar reference (relative error {err:.3g})")
+        return 2
+
+    baseline = {}
+    if not args.save:
+        try:
+            with open(args.baseline) as f:
+                saved = json.load(f)
+            baseline = saved["cases"]
+            if saved.get("meta", {}).get("host") != platform.node():
+                print(f"[WARN] baseline {args.baseline} was recorded on {saved['meta'].get('host')}")
+        except FileNotFoundError:
+            print(f"[WARN] no baseline at {args.baseline}; run with --save to record one")
+
+    results, regressed = {}, []
+    print(f"{'case':28s} {'us/call':>11s} {'throughput':>14s} {'unit':>9s} {'vs base':>8s}")
+    for name, fn, units, unit in cases(sizes, args.seed):
+        if pick is not None and not pick.search(name):
+            continue
+        sec = measure(fn, args.repeat, args.min_time)
+        tput = units / sec
+        results[name] = {"us_per_call": round(sec * 1e6, 3), "throughput": round(tput, 1), "unit": unit}
+        change, flag = "", ""
+        base = baseline.get(name)
+        if base:
+            ratio = tput / base["throughput"]
+            change = f"{(ratio - 1) * 100:+7.1f}%"
+            if ratio < 1.0 - args.budget:
+                regressed.append(name)
+                flag = "  REGRESSED"
+        print(f"{name:28s} {sec * 1e6:11.2f} {tput:14.0f} {unit + '/s':>9s} {change:>8s}{flag}")
+
+    if args.save:
+        meta = {"host": platform.node(), "python": platform.python_version(), "numpy": np.__version__,
+                "machine": platform.machine(), "saved": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seed": args.seed, "repeat": args.repeat}
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": meta, "cases": results}, f, indent=2)
+        print(f"[INFO] baseline written to {args.baseline}")
+        return 0
+    if regressed:
+        print(f"[FAIL] {len(regressed)} case(s) slower than the baseline by more than "
+              f"{args.budget:.0%}: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Time the SSM math on seeded inputs and compare with a stored baseline.")
+    ap.add_argument("--sizes", default="10,100,1000,5000", help="Comma-separated fleet sizes N")
+    ap.add_argument("--cases", default=None, help="Regex: only run the matching case names")
+    ap.add_argument("--baseline", default="ssm_bench_baseline.json", help="Baseline file to compare with / --save to")
+    ap.add_argument("--save", action="store_true", help="Record this run as the baseline instead of comparing")
+    ap.add_argument("--budget", type=float, default=0.10,
+                    help="Allowed throughput drop vs the baseline, as a fraction (0.10 = 10%%)")
+    ap.add_argument("--repeat", type=int, default=5, help="Timing runs per case (the best counts)")
+    ap.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing run")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the synthetic inputs")
+    sys.exit(main(ap.parse_args()))
@@ -6,76 +6,183 @@ Surrogate Safety (SSM) Flask API + Dash dashboard (Excel-free, in-memory only)
 
 Endpoints your SUMO client (run.py) should call:
   - POST /v2x/check/vehicle   (per-vehicle each step)
+  - POST /v2x/check/vehicles/batch (whole step in one call)
+  - POST /v2x/tick/close      (after the per-vehicle calls of a step)
   - POST /v2x/check/vru       (vehicle vs pedestrian, optional)
   - POST /v2x/check/rsu       (RSU detections from run.py)
+  - POST /v2x/vehicle/departed, /v2x/vehicle/arrived (vehicle lifecycle)
 Dashboard:
   - GET  /dash                (Plotly Dash UI, auto-refresh)
 Support:
   - GET  /v2x/snapshot        (compact JSON snapshot for the dash)
+  - GET  /v2x/kpi             (rolling TTC/PET/req. decel/ΔV quantiles + histograms)
+  - GET  /v2x/vehicle/stats   (live count + eviction counters)
+  - GET  /v2x/tick            (tick engine state + counters)
   - GET  /                    (simple landing with link)
 """
 
 from flask import Flask, request, jsonify, Response
-import math
 import time
 import json
-from collections import deque
+
+import metrics
+import ssm_kernel
+import v2x_codec
+from kpi_sketch import KpiSketches
+from recent_buffer import TimeRing, format_cursor, parse_cursor
+from ssm_response import parse_view, shape_result
+from tick_engine import TickEngine
+from vehicle_store import VehicleStore
 
 # ---------------- Flask app ----------------
 app = Flask(__name__)
+v2x_codec.install(app)  # fast JSON / MessagePack bodies and replies
 
 # =========================
 # In-memory state & buffers
 # =========================
-# Live vehicles (latest state)
-#   vid -> {"position":(x,y), "speed":v, "heading":deg, "timestamp":ts}
-vehicle_states = {}
-
-# Recent records (ring buffers)
+# Live vehicles (latest state): vehicle_store.states
+#   vid -> {"position":(x,y), "speed":v, "heading":deg, "timestamp":ts, "sim_time":s}
+# vehicle_store.py keeps the spatial grid and SoA table in step with the states and
+# evicts vehicles on arrival, or after STATE_TTL_SIM_S sim seconds / STATE_TTL_WALL_S
+# wall seconds without an update (background sweep every STATE_SWEEP_S).
+
+# Neighbour search: only vehicles within NEIGHBOR_RADIUS_M, or close enough to meet
+# within NEIGHBOR_HORIZON_S at their current speeds, are paired (spatial_index.py).
+# The rest are counted as "out_of_range" in the response.
+# Updates carrying sim_time are evaluated per tick (tick_engine.py); an open tick is
+# closed by the next step, POST /v2x/tick/close, or TICK_DEADLINE_S after it opened.
+NEIGHBOR_RADIUS_M = 150.0
+NEIGHBOR_HORIZON_S = 5.0
+STATE_TTL_SIM_S = 5.0
+STATE_TTL_WALL_S = 30.0
+STATE_SWEEP_S = 1.0
+TICK_DEADLINE_S = 1.0
+vehicle_store = VehicleStore(ttl_sim=STATE_TTL_SIM_S, ttl_wall=STATE_TTL_WALL_S,
+                             cell_size=NEIGHBOR_RADIUS_M)
+vehicle_store.start_sweeper(STATE_SWEEP_S)
+
+# Recent records: time-ordered columnar rings (recent_buffer.TimeRing), so the
+# snapshot windows below are a binary search + slice. Capacity: BUF_SIZE rows
+# or BUF_AGE_S seconds, whichever is reached first (None in float columns = inf).
 BUF_SIZE = 20000
-ssm_buf   = deque(maxlen=BUF_SIZE)  # {"ts","ego","other","dist","closing","ttc","req_dec","thw","delta_v"}
-alert_buf = deque(maxlen=BUF_SIZE)  # {"ts","type","from","to","risk","action","ttc"}
-vru_buf   = deque(maxlen=BUF_SIZE)  # {"ts","veh_id","ped_id","dist","closing","ttc","pet","req_dec","thw","risk","action"}
-rsu_buf   = deque(maxlen=BUF_SIZE)  # {"ts","rsu_id","obj_type","obj_id","rsu_x","rsu_y","obj_x","obj_y","distance","speed"}
+BUF_AGE_S = 600.0
+F, S = float, str
+ssm_buf   = TimeRing({"ts": F, "ego": S, "other": S, "dist": F, "closing": F, "ttc": F, "req_dec": F,
+                      "thw": F, "delta_v": F}, BUF_SIZE, BUF_AGE_S)
+alert_buf = TimeRing({"ts": F, "type": S, "from": S, "to": S, "risk": F, "action": S, "ttc": F},
+                     BUF_SIZE, BUF_AGE_S)
+vru_buf   = TimeRing({"ts": F, "veh_id": S, "ped_id": S, "dist": F, "closing": F, "ttc": F, "pet": F,
+                      "req_dec": F, "thw": F, "risk": F, "action": S}, BUF_SIZE, BUF_AGE_S)
+rsu_buf   = TimeRing({"ts": F, "rsu_id": S, "obj_type": S, "obj_id": S, "rsu_x": F, "rsu_y": F,
+                      "obj_x": F, "obj_y": F, "distance": F, "speed": F}, BUF_SIZE, BUF_AGE_S)
+
+# Rolling quantiles + histograms of the SSM values over the last BUF_AGE_S seconds
+# (kpi_sketch.py), fed as rows arrive (PET from the VRU checks); the dashboard KPIs and histograms read
+# these instead of rebuilding value lists from the buffered rows.
+KPI_RANGES = {"ttc": (0.0, 30.0), "pet": (0.0, 30.0), "req_dec": (0.0, 15.0), "delta_v": (0.0, 40.0)}
+ssm_kpi = KpiSketches(KPI_RANGES, window_s=BUF_AGE_S, slice_s=10.0)
+
+# =========================
+# Metrics
+# =========================
+# Request count/latency/in-flight of the V2X endpoints and state gauges at GET /metrics
+# (metrics.py, Prometheus text format); the tick engine (kernel time, pairs per
+# evaluation) and the result log register their own metrics.
+METRIC_PATHS = ("/v2x/check/vehicle", "/v2x/check/vehicles/batch", "/v2x/check/vru", "/v2x/check",
+                "/v2x/check/rsu", "/v2x/snapshot")
+metrics.instrument(app, METRIC_PATHS)
+metrics.REGISTRY.gauge("v2x_vehicles_live", "Live vehicles in the store", fn=lambda: len(vehicle_store))
+metrics.REGISTRY.gauge("v2x_buffer_rows", "Rows held by the in-memory record buffers", ("buffer",),
+                       fn=lambda: {("ssm",): len(ssm_buf), ("alerts",): len(alert_buf),
+                                   ("vru",): len(vru_buf), ("rsu",): len(rsu_buf)})
 
 # =========================
-# Math helpers (SSMs)
+# SSM rows + alerts (math lives in ssm_kernel.py)
 # =========================
-def euclidean_distance(p1, p2):
-    dx = p1[0] - p2[0]
-    dy = p1[1] - p2[1]
-    return math.hypot(dx, dy)
-
-def unit_vector(vx, vy):
-    mag = math.hypot(vx, vy)
-    if mag == 0.0:
-        return 0.0, 0.0
-    return vx / mag, vy / mag
-
-def project_speed_along_line(pos_rel, heading_speed_vec):
+def _record_pair(vid, other_id, core, ts):
     """
-    pos_rel = other - ego (dx,dy)
-    heading_speed_vec = ego_v - other_v (vx,vy)
-    returns +ve if closing, -ve if separating
+    SSM dict + optional alert for one (ego, other) pair from its ssm_kernel
+    core tuple; appends to the buffers.
+    Returns (ssm, alert_or_None).
     """
-    dx, dy = pos_rel
-    ux, uy = unit_vector(dx, dy)
-    rvx, rvy = heading_speed_vec
-    return -(rvx * ux + rvy * uy)
-
-def compute_ttc(distance, closing_speed):
-    if closing_speed <= 0 or distance <= 0:
-        return float('inf')
-    return distance / closing_speed
-
-def required_deceleration(rel_speed, distance, cushion=0.0):
-    d_eff = max(distance - cushion, 1e-3)
-    return (rel_speed ** 2) / (2.0 * d_eff)
+    distance, closing, delta_v, ttc, req_dec, thw, _ = core
+
+    ssm = {
+        "other_id": other_id,
+        "distance": round(distance, 3),
+        "closing_speed": round(closing, 3),
+        "delta_v": round(delta_v, 3),
+        "ttc": None if ttc == float('inf') else round(ttc, 3),
+        "required_deceleration": round(req_dec, 3),
+        "time_headway": None if thw == float('inf') else round(thw, 3),
+    }
 
-def time_headway(distance, follower_speed):
-    if follower_speed <= 0:
-        return float('inf')
-    return distance / follower_speed
+    # store compact SSM row in buffer
+    ssm_buf.append({
+        "ts": ts,
+        "ego": vid,
+        "other": other_id,
+        "dist": distance,
+        "closing": closing,
+        "ttc": (None if ttc == float('inf') else ttc),
+        "req_dec": req_dec,
+        "thw": (None if thw == float('inf') else thw),
+        "delta_v": delta_v
+    })
+    ssm_kpi.add(ts, ttc=ttc, req_dec=req_dec, delta_v=delta_v)
+
+    # risk score & alert
+    risk = 0.0
+    if ttc != float('inf'):
+        risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
+    if req_dec > 5.0:
+        risk += 0.2
+    if delta_v > 5.0:
+        risk += 0.2
+    risk = min(1.0, risk)
+
+    if risk >= 0.8:
+        alert_type, action = "collision_imminent", "emergency_brake"
+    elif risk >= 0.4:
+        alert_type, action = "collision_warning", "slow_down"
+    else:
+        return ssm, None
+
+    alert = {
+        "type": alert_type,
+        "from": vid, "to": other_id,
+        "risk_score": round(risk, 3),
+        "recommended_action": action,
+        "ttc": None if ttc == float('inf') else round(ttc, 3)
+    }
+    alert_buf.append({
+        "ts": ts, "type": alert_type, "from": vid, "to": other_id,
+        "risk": risk, "action": action,
+        "ttc": (None if ttc == float('inf') else ttc)
+    })
+    return ssm, alert
+
+def _parse_vehicle(data):
+    """Vehicle payload -> (vid, pos, speed, heading)."""
+    return (data["id"], tuple(data["position"]),
+            float(data.get("speed", 0.0)), float(data.get("heading", 0.0)))
+
+def _vehicle_result(vid, pairs, out_of_range, ts):
+    """Response entry for one vehicle of an evaluated tick (tick_engine shape callback)."""
+    ssm_list = []
+    alerts = []
+    for other_id, core in pairs:
+        ssm, alert = _record_pair(vid, other_id, core, ts)
+        ssm_list.append(ssm)
+        if alert:
+            alerts.append(alert)
+    return {"vehicle_id": vid, "ssm": ssm_list,
+            "alerts": alerts or [{"action": "safe", "timestamp": ts}],
+            "out_of_range": out_of_range}
+
+vehicle_ticks = TickEngine(vehicle_store, NEIGHBOR_RADIUS_M, NEIGHBOR_HORIZON_S,
+                           shape=_vehicle_result, deadline_s=TICK_DEADLINE_S)
 
 # =========================
 # REST API
@@ -83,120 +190,121 @@ def time_headway(distance, follower_speed):
 @app.route("/v2x/check/vehicle", methods=["POST"])
 def check_vehicle_risk():
     """
-    JSON: { "id": "veh_1", "position":[x,y], "speed": v, "heading": deg }
-    Returns SSMs vs other known vehicles + alerts. Stores results in memory.
+    JSON: { "id": "veh_1", "position":[x,y], "speed": v, "heading": deg, "sim_time": t }
+    With sim_time the update joins tick t and the reply is this vehicle's result from
+    the last closed tick ("tick" = its sim_time; empty until the first tick closes).
+    Without sim_time the vehicle is evaluated against nearby live vehicles right away.
+    Optional "response": {"view": "alerts" | "top_k" | "threshold" | "full", "k", "ttc_lt", "fields"}
+    trims the ssm list of the reply (ssm_response.py).
     """
     try:
-        data = request.get_json(force=True)
-        ts = time.time()
+        data = v2x_codec.read_payload(v2x_codec.VEHICLE)
+        try:
+            view = parse_view(data.get("response"), request.args)
+        except ValueError as e:
+            return jsonify({"error": f"bad response options: {e}"}), 400
+        vid, pos, speed, heading = _parse_vehicle(data)
+        if data.get("sim_time") is None:
+            return jsonify(shape_result(vehicle_ticks.evaluate_now(vid, pos, speed, heading), view))
+
+        tick, res = vehicle_ticks.update(vid, pos, speed, heading, float(data["sim_time"]))
+        return jsonify({**shape_result(res or {"vehicle_id": vid, "ssm": [], "alerts": []}, view), "tick": tick})
+
+    except v2x_codec.PayloadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-        vid = data["id"]
-        pos = tuple(data["position"])
-        speed = float(data.get("speed", 0.0))
-        heading = float(data.get("heading", 0.0))
-
-        vehicle_states[vid] = {"position": pos, "speed": speed, "heading": heading, "timestamp": ts}
-
-        ssm_list = []
-        alerts = []
-
-        # pair with others
-        for other_id, other in vehicle_states.items():
-            if other_id == vid:
-                continue
-            opos = tuple(other["position"])
-            ospeed = float(other.get("speed", 0.0))
-            ohead = float(other.get("heading", 0.0))
-
-            distance = euclidean_distance(pos, opos)
-
-            # velocity vectors
-            vx,  vy  = speed * math.cos(math.radians(heading)),  speed * math.sin(math.radians(heading))
-            ovx, ovy = ospeed * math.cos(math.radians(ohead)),    ospeed * math.sin(math.radians(ohead))
-
-            pos_rel = (opos[0] - pos[0], opos[1] - pos[1])
-            rel_vx, rel_vy = vx - ovx, vy - ovy
-
-            closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-            ttc = compute_ttc(distance, closing)
-            delta_v = abs(math.hypot(rel_vx, rel_vy))
-            req_dec = required_deceleration(delta_v, distance)
-            thw = time_headway(distance, speed)
-
-            ssm = {
-                "other_id": other_id,
-                "distance": round(distance, 3),
-                "closing_speed": round(closing, 3),
-                "delta_v": round(delta_v, 3),
-                "ttc": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration": round(req_dec, 3),
-                "time_headway": None if thw == float('inf') else round(thw, 3),
-            }
-            ssm_list.append(ssm)
-
-            # store compact SSM row in buffer
-            ssm_buf.append({
-                "ts": ts,
-                "ego": vid,
-                "other": other_id,
-                "dist": distance,
-                "closing": closing,
-                "ttc": (None if ttc == float('inf') else ttc),
-                "req_dec": req_dec,
-                "thw": (None if thw == float('inf') else thw),
-                "delta_v": delta_v
-            })
-
-            # risk score & alert
-            risk = 0.0
-            if ttc != float('inf'):
-                risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
-            if req_dec > 5.0:
-                risk += 0.2
-            if delta_v > 5.0:
-                risk += 0.2
-            risk = min(1.0, risk)
-
-            if risk >= 0.8:
-                alert = {
-                    "type": "collision_imminent",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "emergency_brake",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                alert_buf.append({
-                    "ts": ts, "type": alert["type"], "from": vid, "to": other_id,
-                    "risk": risk, "action": "emergency_brake",
-                    "ttc": (None if ttc == float('inf') else ttc)
-                })
-            elif risk >= 0.4:
-                alert = {
-                    "type": "collision_warning",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "slow_down",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                alert_buf.append({
-                    "ts": ts, "type": alert["type"], "from": vid, "to": other_id,
-                    "risk": risk, "action": "slow_down",
-                    "ttc": (None if ttc == float('inf') else ttc)
-                })
-
-        if not alerts:
-            alerts = [{"action": "safe", "timestamp": ts}]
-
-        return jsonify({"vehicle_id": vid, "ssm": ssm_list, "alerts": alerts})
 
+@app.route("/v2x/check/vehicles/batch", methods=["POST"])
+def check_vehicles_batch():
+    """
+    JSON: {"sim_time": 12.4, "vehicles": [{"id","position","speed","heading"}, ...]}
+    One call per simulation step = one tick: stores every vehicle first, then
+    evaluates each pair once (both directions) and returns per-vehicle SSMs + alerts:
+      {"sim_time": ..., "results": [{"vehicle_id","ssm","alerts"}, ...]}
+    An optional "response" object shapes every result as on /v2x/check/vehicle.
+    """
+    try:
+        data = v2x_codec.read_payload(v2x_codec.VEHICLE_BATCH)
+        try:
+            view = parse_view(data.get("response"), request.args)
+        except ValueError as e:
+            return jsonify({"error": f"bad response options: {e}"}), 400
+        batch = [_parse_vehicle(v) for v in data.get("vehicles", [])]
+        sim_time = data.get("sim_time")
+        tick = vehicle_ticks.run_tick(None if sim_time is None else float(sim_time), batch)
+        results = [shape_result(tick.results[b[0]], view) for b in batch if b[0] in tick.results] if tick else []
+        return jsonify({"sim_time": sim_time, "results": results})
+
+    except v2x_codec.PayloadError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/v2x/tick/close", methods=["POST"])
+def tick_close():
+    """
+    JSON: { "sim_time": 12.4 }
+    Sent after the last per-vehicle update of a step; evaluates that tick now
+    instead of waiting for the next step or the TICK_DEADLINE_S deadline.
+    """
+    try:
+        data = request.get_json(force=True)
+        sim_time = data.get("sim_time")
+        tick = vehicle_ticks.close(None if sim_time is None else float(sim_time))
+        return jsonify(tick.summary() if tick else {"sim_time": sim_time, "closed_by": None})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/v2x/tick", methods=["GET"])
+def tick_stats():
+    """Open tick, last closed tick (size, pairs, eval time) and close/late counters."""
+    return jsonify(vehicle_ticks.stats())
+
+
+@app.route("/v2x/vehicle/departed", methods=["POST"])
+def vehicle_departed():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it enters the simulation; drops state left over
+    from an earlier vehicle with the same id.
+    """
+    try:
+        data = request.get_json(force=True)
+        replaced = vehicle_store.depart(data.get("ids", []), data.get("sim_time"))
+        return jsonify({"sim_time": data.get("sim_time"), "replaced": replaced})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/v2x/vehicle/arrived", methods=["POST"])
+def vehicle_arrived():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it leaves the simulation; drops its state so it
+    is no longer paired with live vehicles.
+    """
+    try:
+        data = request.get_json(force=True)
+        removed = vehicle_store.arrive(data.get("ids", []))
+        return jsonify({"sim_time": data.get("sim_time"), "removed": removed})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/v2x/vehicle/stats", methods=["GET"])
+def vehicle_stats():
+    """Live vehicle count, sim clock, departures and eviction counts by reason."""
+    return jsonify(vehicle_store.stats())
+
+
 @app.route("/v2x/check/vru", methods=["POST"])
 def vru_check_risk():
     """
@@ -207,7 +315,7 @@ def vru_check_risk():
     }
     """
     try:
-        payload = request.get_json(force=True)
+        payload = v2x_codec.read_payload(v2x_codec.VRU)
         ts = time.time()
 
         v = payload["vehicle"]
@@ -220,21 +328,9 @@ def vru_check_risk():
         vh = float(v.get("heading", 0.0))
         ph = float(p.get("heading", 0.0))
 
-        dist = euclidean_distance(vpos, ppos)
-
-        vvx, vvy = vs * math.cos(math.radians(vh)), vs * math.sin(math.radians(vh))
-        pvx, pvy = ps * math.cos(math.radians(ph)), ps * math.sin(math.radians(ph))
-
-        rel_vx = vvx - pvx
-        rel_vy = vvy - pvy
-        pos_rel = (ppos[0] - vpos[0], ppos[1] - vpos[1])
-
-        closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-        ttc = compute_ttc(dist, closing)
-        pet = abs((dist/ps) - (dist/closing)) if (ps > 0 and closing > 0) else float('inf')
-        delta_v = abs(math.hypot(rel_vx, rel_vy))
-        req_dec = required_deceleration(delta_v, dist)
-        thw = time_headway(dist, vs)
+        m = ssm_kernel.point_metrics(vpos, vs, vh, ppos, ps, ph, pet_speed=ps)
+        dist, closing, delta_v = m["distance"], m["closing"], m["delta_v"]
+        ttc, pet, req_dec, thw = m["ttc"], m["pet"], m["req_dec"], m["thw"]
 
         # risk score
         risk = 0.0
@@ -270,6 +366,7 @@ def vru_check_risk():
         }
 
         # store in buffer (optional for future charts)
+        ssm_kpi.add(ts, pet=pet)
         vru_buf.append({
             "ts": ts, "veh_id": v.get("id"), "ped_id": p.get("id"),
             "dist": dist, "closing": closing,
@@ -304,7 +401,7 @@ def rsu_check():
     }
     """
     try:
-        d = request.get_json(force=True)
+        d = v2x_codec.read_payload(v2x_codec.RSU)
         ts = time.time()
 
         rsu_buf.append({
@@ -323,6 +420,23 @@ def rsu_check():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# Record lists of the snapshot: (key, buffer, window seconds); the snapshot
+# cursor holds one row number per buffer, in this order.
+SNAPSHOT_LISTS = (("rsu_recent", rsu_buf, 60.0),
+                  ("alerts_recent", alert_buf, 600.0),
+                  ("ssm_recent", ssm_buf, 600.0))
+SNAPSHOT_EPOCH = format(time.time_ns(), "x")  # keeps ETags of different server runs apart
+
+def _vehicle_rows(view):
+    return [{
+        "veh_id": vid,
+        "x": v["position"][0],
+        "y": v["position"][1],
+        "speed": v["speed"],
+        "heading": v.get("heading", 0.0),
+        "timestamp": v.get("timestamp", 0.0)
+    } for vid, v in view.items()]
+
 @app.route("/v2x/snapshot", methods=["GET"])
 def snapshot():
     """
@@ -330,43 +444,51 @@ def snapshot():
       - vehicles: live set
       - rsu_recent: last 60s
       - alerts_recent & ssm_recent: last 10 min
+      - cursor: send it back as ?since=<cursor> to receive only the records added
+        after this reply (vehicles are always complete; drop records that left
+        the windows yourself). "reset": true means the cursor did not belong to
+        this server run and the lists are complete.
+    Replies carry an ETag; If-None-Match with an unchanged state returns 304.
     """
+    try:
+        after = parse_cursor(request.args.get("since"), len(SNAPSHOT_LISTS))
+    except ValueError as e:
+        return jsonify({"error": f"bad since cursor: {e}"}), 400
     try:
         now = time.time()
-
-        vehicles = [{
-            "veh_id": vid,
-            "x": v["position"][0],
-            "y": v["position"][1],
-            "speed": v["speed"],
-            "heading": v.get("heading", 0.0),
-            "timestamp": v.get("timestamp", 0.0)
-        } for vid, v in vehicle_states.items()]
-
-        rsu_recent   = [r for r in rsu_buf   if (now - r["ts"]) <= 60.0]
-        alerts_recent= [a for a in alert_buf if (now - a["ts"]) <= 600.0]
-        ssm_recent   = [s for s in ssm_buf   if (now - s["ts"]) <= 600.0]
-
-        return jsonify({
-            "vehicles": vehicles,
-            "rsu_recent": rsu_recent,
-            "alerts_recent": alerts_recent,
-            "ssm_recent": ssm_recent,
-            "server_time": now
-        })
+        version, view = vehicle_store.versioned_snapshot()
+        etag = "-".join([SNAPSHOT_EPOCH, str(version)] +
+                        [str(s) for _, buf, win in SNAPSHOT_LISTS for s in buf.seq_range(now - win)])
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+
+        data = {"vehicles": _vehicle_rows(view)}
+        cursor, reset = [], False
+        for (key, buf, win), since in zip(SNAPSHOT_LISTS, after):
+            data[key], seq, was_reset = buf.read(now - win, since)
+            cursor.append(seq)
+            reset |= was_reset
+        data.update(server_time=now, cursor=format_cursor(cursor),
+                    delta=after[0] is not None and not reset, reset=reset)
+        resp = jsonify(data)
+        resp.set_etag(etag)
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/v2x/kpi", methods=["GET"])
+def kpi_summary():
+    """p05/p50/p95, counts and histograms of TTC, PET, required deceleration and ΔV over the window."""
+    return jsonify(ssm_kpi.summary())
+
 # =========================
 # Dash dashboard (/dash)
 # =========================
 def init_dash(flask_app: Flask):
     from dash import Dash, dcc, html, dash_table, Input, Output
     import plotly.graph_objects as go
-    import plotly.express as px
-    import statistics
-    import time as _t
-    import requests as _rq
 
     dash_app = Dash(
         __name__,
@@ -427,6 +549,24 @@ def init_dash(flask_app: Flask):
         dcc.Interval(id="timer", interval=2000, n_intervals=0)  # 2s refresh
     ], style={"fontFamily":"Arial, sans-serif", "padding":"12px 18px"})
 
+    def _kpi_text(m, key, fmt, unit):
+        """Sketch quantile as KPI text ("≥ hi" when it falls in the overflow bin)."""
+        if not m["count"]:
+            return "—"
+        v, hi = m[key], m["hist"]["edges"][-1]
+        return f"≥ {hi:g} {unit}" if v >= hi else f"{v:{fmt}} {unit}"
+
+    def _hist_figure(m, label, title):
+        """Bar chart of one kpi_sketch histogram (bins computed on the server)."""
+        h = m["hist"]
+        edges = h["edges"]
+        fig = go.Figure(go.Bar(x=[(a + b) / 2 for a, b in zip(edges, edges[1:])], y=h["counts"],
+                               width=edges[1] - edges[0], opacity=0.85))
+        if h["overflow"]:
+            title += f" (+{h['overflow']} ≥ {edges[-1]:g})"
+        fig.update_layout(title=title, xaxis_title=label, yaxis_title="count", bargap=0)
+        return fig
+
     @dash_app.callback(
         Output("kpi_vehicles","children"),
         Output("kpi_alerts","children"),
@@ -439,25 +579,20 @@ def init_dash(flask_app: Flask):
         Input("timer","n_intervals")
     )
     def refresh(_):
-        # Pull single snapshot (already filtered by time windows)
-        try:
-            snap = _rq.get("http://127.0.0.1:5000/v2x/snapshot", timeout=0.7).json()
-        except Exception:
-            snap = {"vehicles": [], "rsu_recent": [], "alerts_recent": [], "ssm_recent": []}
-
-        vehs          = snap.get("vehicles", [])
-        rsu_recent    = snap.get("rsu_recent", [])
-        alerts_recent = snap.get("alerts_recent", [])
-        ssm_recent    = snap.get("ssm_recent", [])
+        # Read the server state in-process (same windows as /v2x/snapshot, no HTTP/JSON)
+        now = time.time()
+        vehs          = _vehicle_rows(vehicle_store.snapshot())
+        rsu_recent    = rsu_buf.window(60.0, now)
+        alerts_recent = alert_buf.window(600.0, now)
 
         # KPIs
         kpi_veh    = str(len(vehs))
         kpi_alerts = str(len(alerts_recent))
         kpi_rsu    = str(len(rsu_recent))
 
-        # Median TTC (ignore None)
-        ttc_vals = [s["ttc"] for s in ssm_recent if isinstance(s.get("ttc"), (int, float))]
-        kpi_ttc  = f"{statistics.median(ttc_vals):.1f} s" if ttc_vals else "—"
+        # Median TTC from the server-side sketch (finite TTCs of the last 10 min)
+        ttc_m    = ssm_kpi.summary()["metrics"]["ttc"]
+        kpi_ttc  = _kpi_text(ttc_m, "p50", ".1f", "s")
 
         # Live map
         fig = go.Figure()
@@ -493,9 +628,8 @@ def init_dash(flask_app: Flask):
         } for a in sorted(alerts_recent, key=lambda z: z["ts"], reverse=True)[:50]]
 
         # TTC histogram
-        if ttc_vals:
-            hist = px.histogram({"ttc": ttc_vals}, x="ttc", nbins=40, opacity=0.85,
-                                labels={"ttc": "TTC [s]"}, title="TTC distribution (last 10 min)")
+        if ttc_m["count"]:
+            hist = _hist_figure(ttc_m, "TTC [s]", "TTC distribution (last 10 min)")
         else:
             hist = go.Figure(); hist.update_layout(title="TTC distribution (no SSM rows)")
 
@@ -2,120 +2,73 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, request, jsonify, send_file, Response
-import math
 import time
-import threading
 import pandas as pd
 import json
-import os
-import io
-from collections import deque
+
+import metrics
+import ssm_kernel
+import v2x_codec
+from plot_cache import PlotCache, render_map
+from recent_buffer import RecentBuffer, parse_cursor
+from result_log import ResultLog
+from ssm_response import parse_view, shape_result
+from tick_engine import TickEngine
+from vehicle_store import VehicleStore
 
 # ---------------- Flask base app ----------------
 app = Flask(__name__)
+v2x_codec.install(app)  # fast JSON / MessagePack bodies and replies
 
-# ---------------- Excel logging utilities ----------------
-_excel_lock = threading.Lock()
+# ---------------- Result logging ----------------
+# Rows are appended to a SQLite log by a background flusher (result_log.py);
+# the dashboard reads the newest rows from it and /download/excel builds the
+# workbook on demand.
+RESULT_LOG_PATH = "server_results.sqlite"
 EXCEL_PATH = "server_results.xlsx"
 SHEET_NAME = "server_results"
-"""
-def _append_rows_to_excel(rows, excel_path=EXCEL_PATH, sheet_name=SHEET_NAME):
-    if not rows:
-        return
-    df_new = pd.DataFrame(rows)
-    cols = [
-        "timestamp_utc",
-        "vehicle_id",
-        "record_type",            # "ssm" | "alert" | "safe" | "vru_ssm" | "rsu_detection"
-        # ssm fields
-        "other_id",
-        "distance_m",
-        "closing_speed_mps",
-        "delta_v_mps",
-        "ttc_s",
-        "required_deceleration_mps2",
-        "time_headway_s",
-        # alert fields
-        "alert_type",
-        "alert_from",
-        "alert_to",
-        "risk_score",
-        "recommended_action",
-        # VRU-only extras
-        "pet_s",
-        # RSU detection fields
-        "rsu_id",
-        "object_type",
-        "object_id",
-        "object_x",
-        "object_y",
-        "object_distance_m",
-        "object_speed_mps",
-        # raw
-        "raw_payload"
-    ]
-    for c in cols:
-        if c not in df_new.columns:
-            df_new[c] = pd.NA
-    df_new = df_new[cols]
-
-    with _excel_lock:
-        if os.path.exists(excel_path):
-            try:
-                existing = pd.read_excel(excel_path, sheet_name=sheet_name, engine="openpyxl")
-                combined = pd.concat([existing, df_new], ignore_index=True)
-            except Exception:
-                combined = df_new
-            with pd.ExcelWriter(excel_path, engine="openpyxl", mode="w") as writer:
-                combined.to_excel(writer, sheet_name=sheet_name, index=False)
-        else:
-            with pd.ExcelWriter(excel_path, engine="openpyxl", mode="w") as writer:
-                df_new.to_excel(writer, sheet_name=sheet_name, index=False)
-"""
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+result_log = ResultLog(RESULT_LOG_PATH)
 # ---------------- State (recent vehicle positions for live map) ----------------
-# vid -> {"position": (x,y), "speed": v, "heading": deg, "timestamp": t}
-vehicle_states = {}
+# vehicle_store.states: vid -> {"position": (x,y), "speed": v, "heading": deg, "timestamp": t, "sim_time": s}
+# vehicle_store.py keeps the spatial grid and SoA table in step with the states and
+# evicts vehicles on arrival, or after STATE_TTL_SIM_S sim seconds / STATE_TTL_WALL_S
+# wall seconds without an update (background sweep every STATE_SWEEP_S).
+# Neighbour search: only vehicles within NEIGHBOR_RADIUS_M, or close enough to meet
+# within NEIGHBOR_HORIZON_S at their current speeds, are paired (spatial_index.py).
+# The rest are counted as "out_of_range" in the response.
+# Updates carrying sim_time are evaluated per tick (tick_engine.py); an open tick is
+# closed by the next step, POST /v2x/tick/close, or TICK_DEADLINE_S after it opened.
+NEIGHBOR_RADIUS_M = 150.0
+NEIGHBOR_HORIZON_S = 5.0
+STATE_TTL_SIM_S = 5.0
+STATE_TTL_WALL_S = 30.0
+STATE_SWEEP_S = 1.0
+TICK_DEADLINE_S = 1.0
+vehicle_store = VehicleStore(ttl_sim=STATE_TTL_SIM_S, ttl_wall=STATE_TTL_WALL_S,
+                             cell_size=NEIGHBOR_RADIUS_M)
+vehicle_store.start_sweeper(STATE_SWEEP_S)
 
 # keep last N RSU detections in memory as well (for quick JSON snapshot)
-_recent_rsu = deque(maxlen=2000)
-
-# ---------------- Helper math ----------------
-def euclidean_distance(p1, p2):
-    dx = p1[0] - p2[0]
-    dy = p1[1] - p2[1]
-    return math.hypot(dx, dy)
-
-def unit_vector(vx, vy):
-    mag = math.hypot(vx, vy)
-    if mag == 0.0:
-        return 0.0, 0.0
-    return vx / mag, vy / mag
-
-def project_speed_along_line(pos_rel, heading_speed_vec):
-    dx, dy = pos_rel
-    ux, uy = unit_vector(dx, dy)
-    rvx, rvy = heading_speed_vec
-    return -(rvx * ux + rvy * uy)
-
-def compute_ttc(distance, closing_speed):
-    if closing_speed <= 0 or distance <= 0:
-        return float('inf')
-    return distance / closing_speed
-
-def required_deceleration(rel_speed, distance, cushion=0.0):
-    d_eff = max(distance - cushion, 1e-3)
-    return (rel_speed ** 2) / (2.0 * d_eff)
-
-def time_headway(distance, follower_speed):
-    if follower_speed <= 0:
-        return float('inf')
-    return distance / follower_speed
+_recent_rsu = RecentBuffer(2000)
+
+# SSM math lives in ssm_kernel.py (shared by all server variants)
+
+# ---------------- Metrics ----------------
+# Request count/latency/in-flight of the V2X endpoints and state gauges at GET /metrics
+# (metrics.py, Prometheus text format); the tick engine (kernel time, pairs per
+# evaluation) and the result log register their own metrics.
+METRIC_PATHS = ("/v2x/check/vehicle", "/v2x/check/vru", "/v2x/check", "/v2x/check/rsu", "/v2x/snapshot")
+metrics.instrument(app, METRIC_PATHS)
+metrics.REGISTRY.gauge("v2x_vehicles_live", "Live vehicles in the store", fn=lambda: len(vehicle_store))
+metrics.REGISTRY.gauge("v2x_buffer_rows", "Rows held by the in-memory record buffers", ("buffer",),
+                       fn=lambda: {("rsu",): len(_recent_rsu)})
 
 # ---------------- VRU endpoint ----------------
 @app.route('/v2x/check/vru', methods=['POST'])
 def vru_check_risk():
     try:
-        payload = request.get_json(force=True)
+        payload = v2x_codec.read_payload(v2x_codec.VRU)
         v = payload["vehicle"]
         p = payload["pedestrian"]
 
@@ -126,21 +79,9 @@ def vru_check_risk():
         vh = float(v.get("heading", 0.0))
         ph = float(p.get("heading", 0.0))
 
-        dist = euclidean_distance(vpos, ppos)
-
-        vvx, vvy = vs * math.cos(math.radians(vh)), vs * math.sin(math.radians(vh))
-        pvx, pvy = ps * math.cos(math.radians(ph)), ps * math.sin(math.radians(ph))
-
-        rel_vx = vvx - pvx
-        rel_vy = vvy - pvy
-        pos_rel = (ppos[0] - vpos[0], ppos[1] - vpos[1])
-
-        closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-        ttc = compute_ttc(dist, closing)
-        pet = abs((dist/ps) - (dist/closing)) if (ps > 0 and closing > 0) else float('inf')
-        delta_v = abs(math.hypot(rel_vx, rel_vy))
-        req_dec = required_deceleration(delta_v, dist)
-        thw = time_headway(dist, vs)
+        m = ssm_kernel.point_metrics(vpos, vs, vh, ppos, ps, ph, pet_speed=ps)
+        dist, closing, delta_v = m["distance"], m["closing"], m["delta_v"]
+        ttc, pet, req_dec, thw = m["ttc"], m["pet"], m["req_dec"], m["thw"]
 
         risk = 0.0
         if ttc != float('inf'):
@@ -183,151 +124,207 @@ def vru_check_alias():
     return vru_check_risk()
 
 # ---------------- Vehicle↔Vehicle endpoint ----------------
-@app.route('/v2x/check/vehicle', methods=['POST'])
-def check_vehicle_risk():
-    try:
-        data = request.get_json(force=True)
-        vid = data["id"]
-        pos = tuple(data["position"])
-        speed = float(data.get("speed", 0.0))
-        heading = float(data.get("heading", 0.0))
-
-        vehicle_states[vid] = {
-            "position": pos,
-            "speed": speed,
-            "heading": heading,
-            "timestamp": time.time()
-        }
+def _vehicle_result(vid, pairs, out_of_range, ts):
+    """Response entry for one vehicle of an evaluated tick (tick_engine shape callback)."""
+    ssm_list, alerts = [], []
+    excel_rows = []
 
-        ssm_list, alerts = [], []
-        excel_rows = []
+    for other_id, core in pairs:
+        distance, closing, delta_v, ttc, req_dec, thw, _ = core
 
-        for other_id, other in vehicle_states.items():
-            if other_id == vid:
-                continue
-
-            opos = tuple(other["position"])
-            ospeed = float(other.get("speed", 0.0))
-            ohead = float(other.get("heading", 0.0))
-
-            distance = euclidean_distance(pos, opos)
-
-            vx, vy = speed * math.cos(math.radians(heading)), speed * math.sin(math.radians(heading))
-            ovx, ovy = ospeed * math.cos(math.radians(ohead)), ospeed * math.sin(math.radians(ohead))
-
-            pos_rel = (opos[0] - pos[0], opos[1] - pos[1])
-            rel_vx, rel_vy = vx - ovx, vy - ovy
+        ssm = {
+            "other_id": other_id,
+            "distance": round(distance, 3),
+            "closing_speed": round(closing, 3),
+            "delta_v": round(delta_v, 3),
+            "ttc": None if ttc == float('inf') else round(ttc, 3),
+            "required_deceleration": round(req_dec, 3),
+            "time_headway": None if thw == float('inf') else round(thw, 3),
+        }
+        ssm_list.append(ssm)
+
+        excel_rows.append({
+            "timestamp_utc": ts,
+            "vehicle_id": vid,
+            "record_type": "ssm",
+            "other_id": other_id,
+            "distance_m": round(distance, 3),
+            "closing_speed_mps": round(closing, 3),
+            "delta_v_mps": round(delta_v, 3),
+            "ttc_s": None if ttc == float('inf') else round(ttc, 3),
+            "required_deceleration_mps2": round(req_dec, 3),
+            "time_headway_s": None if thw == float('inf') else round(thw, 3),
+            "raw_payload": json.dumps({"ego": vid, "other": other_id, "ssm": ssm})
+        })
 
-            closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-            ttc = compute_ttc(distance, closing)
-            delta_v = abs(math.hypot(rel_vx, rel_vy))
-            req_dec = required_deceleration(delta_v, distance)
-            thw = time_headway(distance, speed)
+        risk = 0.0
+        if ttc != float('inf'):
+            risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
+        if req_dec > 5.0:
+            risk += 0.2
+        if delta_v > 5.0:
+            risk += 0.2
+        risk = min(1.0, risk)
 
-            ssm = {
-                "other_id": other_id,
-                "distance": round(distance, 3),
-                "closing_speed": round(closing, 3),
-                "delta_v": round(delta_v, 3),
-                "ttc": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration": round(req_dec, 3),
-                "time_headway": None if thw == float('inf') else round(thw, 3),
+        if risk >= 0.8:
+            alert = {
+                "type": "collision_imminent",
+                "from": vid, "to": other_id,
+                "risk_score": round(risk, 3),
+                "recommended_action": "emergency_brake",
+                "ttc": None if ttc == float('inf') else round(ttc, 3)
             }
-            ssm_list.append(ssm)
-
+            alerts.append(alert)
             excel_rows.append({
-                "timestamp_utc": time.time(),
+                "timestamp_utc": ts,
                 "vehicle_id": vid,
-                "record_type": "ssm",
-                "other_id": other_id,
-                "distance_m": round(distance, 3),
-                "closing_speed_mps": round(closing, 3),
-                "delta_v_mps": round(delta_v, 3),
-                "ttc_s": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration_mps2": round(req_dec, 3),
-                "time_headway_s": None if thw == float('inf') else round(thw, 3),
-                "raw_payload": json.dumps({"ego": vid, "other": other_id, "ssm": ssm})
+                "record_type": "alert",
+                "alert_type": alert["type"],
+                "alert_from": alert["from"],
+                "alert_to": alert["to"],
+                "risk_score": alert["risk_score"],
+                "recommended_action": alert["recommended_action"],
+                "alert_ttc_s": alert["ttc"],
+                "raw_payload": json.dumps({"ego": vid, "alert": alert})
             })
-
-            risk = 0.0
-            if ttc != float('inf'):
-                risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
-            if req_dec > 5.0:
-                risk += 0.2
-            if delta_v > 5.0:
-                risk += 0.2
-            risk = min(1.0, risk)
-
-            if risk >= 0.8:
-                alert = {
-                    "type": "collision_imminent",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "emergency_brake",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                excel_rows.append({
-                    "timestamp_utc": time.time(),
-                    "vehicle_id": vid,
-                    "record_type": "alert",
-                    "alert_type": alert["type"],
-                    "alert_from": alert["from"],
-                    "alert_to": alert["to"],
-                    "risk_score": alert["risk_score"],
-                    "recommended_action": alert["recommended_action"],
-                    "alert_ttc_s": alert["ttc"],
-                    "raw_payload": json.dumps({"ego": vid, "alert": alert})
-                })
-            elif risk >= 0.4:
-                alert = {
-                    "type": "collision_warning",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "slow_down",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                excel_rows.append({
-                    "timestamp_utc": time.time(),
-                    "vehicle_id": vid,
-                    "record_type": "alert",
-                    "alert_type": alert["type"],
-                    "alert_from": alert["from"],
-                    "alert_to": alert["to"],
-                    "risk_score": alert["risk_score"],
-                    "recommended_action": alert["recommended_action"],
-                    "alert_ttc_s": alert["ttc"],
-                    "raw_payload": json.dumps({"ego": vid, "alert": alert})
-                })
-
-        if not alerts:
-            safe = {"action": "safe", "timestamp": time.time()}
-            alerts = [safe]
+        elif risk >= 0.4:
+            alert = {
+                "type": "collision_warning",
+                "from": vid, "to": other_id,
+                "risk_score": round(risk, 3),
+                "recommended_action": "slow_down",
+                "ttc": None if ttc == float('inf') else round(ttc, 3)
+            }
+            alerts.append(alert)
             excel_rows.append({
-                "timestamp_utc": time.time(),
+                "timestamp_utc": ts,
                 "vehicle_id": vid,
                 "record_type": "alert",
-                "alert_type": safe.get("action"),
-                "alert_from": vid,
-                "alert_to": None,
-                "risk_score": None,
-                "recommended_action": None,
-                "alert_ttc_s": safe.get("timestamp"),
-                "raw_payload": json.dumps({"ego": vid, "alerts": [safe]})
+                "alert_type": alert["type"],
+                "alert_from": alert["from"],
+                "alert_to": alert["to"],
+                "risk_score": alert["risk_score"],
+                "recommended_action": alert["recommended_action"],
+                "alert_ttc_s": alert["ttc"],
+                "raw_payload": json.dumps({"ego": vid, "alert": alert})
             })
-        return jsonify({"vehicle_id": vid, "ssm": ssm_list, "alerts": alerts})
 
+    if not alerts:
+        safe = {"action": "safe", "timestamp": ts}
+        alerts = [safe]
+        excel_rows.append({
+            "timestamp_utc": ts,
+            "vehicle_id": vid,
+            "record_type": "alert",
+            "alert_type": safe.get("action"),
+            "alert_from": vid,
+            "alert_to": None,
+            "risk_score": None,
+            "recommended_action": None,
+            "alert_ttc_s": safe.get("timestamp"),
+            "raw_payload": json.dumps({"ego": vid, "alerts": [safe]})
+        })
+    result_log.append(excel_rows)
+    return {"vehicle_id": vid, "ssm": ssm_list, "alerts": alerts, "out_of_range": out_of_range}
+
+vehicle_ticks = TickEngine(vehicle_store, NEIGHBOR_RADIUS_M, NEIGHBOR_HORIZON_S,
+                           shape=_vehicle_result, deadline_s=TICK_DEADLINE_S)
+
+@app.route('/v2x/check/vehicle', methods=['POST'])
+def check_vehicle_risk():
+    """
+    JSON: { "id": "veh_1", "position":[x,y], "speed": v, "heading": deg, "sim_time": t }
+    With sim_time the update joins tick t and the reply is this vehicle's result from
+    the last closed tick ("tick" = its sim_time; empty until the first tick closes).
+    Without sim_time the vehicle is evaluated against nearby live vehicles right away.
+    Optional "response": {"view": "alerts" | "top_k" | "threshold" | "full", "k", "ttc_lt", "fields"}
+    trims the ssm list of the reply (ssm_response.py).
+    """
+    try:
+        data = v2x_codec.read_payload(v2x_codec.VEHICLE)
+        try:
+            view = parse_view(data.get("response"), request.args)
+        except ValueError as e:
+            return jsonify({"error": f"bad response options: {e}"}), 400
+        vid = data["id"]
+        pos = tuple(data["position"])
+        speed = float(data.get("speed", 0.0))
+        heading = float(data.get("heading", 0.0))
+        if data.get("sim_time") is None:
+            return jsonify(shape_result(vehicle_ticks.evaluate_now(vid, pos, speed, heading), view))
+
+        tick, res = vehicle_ticks.update(vid, pos, speed, heading, float(data["sim_time"]))
+        return jsonify({**shape_result(res or {"vehicle_id": vid, "ssm": [], "alerts": []}, view), "tick": tick})
+
+    except v2x_codec.PayloadError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/v2x/tick/close', methods=['POST'])
+def tick_close():
+    """
+    JSON: { "sim_time": 12.4 }
+    Sent after the last per-vehicle update of a step; evaluates that tick now
+    instead of waiting for the next step or the TICK_DEADLINE_S deadline.
+    """
+    try:
+        data = request.get_json(force=True)
+        sim_time = data.get("sim_time")
+        tick = vehicle_ticks.close(None if sim_time is None else float(sim_time))
+        return jsonify(tick.summary() if tick else {"sim_time": sim_time, "closed_by": None})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/v2x/tick', methods=['GET'])
+def tick_stats():
+    """Open tick, last closed tick (size, pairs, eval time) and close/late counters."""
+    return jsonify(vehicle_ticks.stats())
+
+# ---------------- Vehicle lifecycle (from run.py) ----------------
+@app.route('/v2x/vehicle/departed', methods=['POST'])
+def vehicle_departed():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it enters the simulation; drops state left over
+    from an earlier vehicle with the same id.
+    """
+    try:
+        data = request.get_json(force=True)
+        replaced = vehicle_store.depart(data.get("ids", []), data.get("sim_time"))
+        return jsonify({"sim_time": data.get("sim_time"), "replaced": replaced})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/v2x/vehicle/arrived', methods=['POST'])
+def vehicle_arrived():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it leaves the simulation; drops its state so it
+    is no longer paired with live vehicles.
+    """
+    try:
+        data = request.get_json(force=True)
+        removed = vehicle_store.arrive(data.get("ids", []))
+        return jsonify({"sim_time": data.get("sim_time"), "removed": removed})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/v2x/vehicle/stats', methods=['GET'])
+def vehicle_stats():
+    """Live vehicle count, sim clock, departures and eviction counts by reason."""
+    return jsonify(vehicle_store.stats())
+
 # ---------------- RSU detections endpoint (from run.py) ----------------
+
 @app.route('/v2x/check/rsu', methods=['POST'])
 def rsu_check():
     try:
-        d = request.get_json(force=True)
+        d = v2x_codec.read_payload(v2x_codec.RSU)
         # Accept the flat dict format produced by your run.py
         rid = d.get("rsu_id")
         obj_type = d.get("obj_type")
@@ -336,7 +333,7 @@ def rsu_check():
         d["_ts"] = time.time()
         _recent_rsu.append(d)
 
-        # Log into Excel (record_type=rsu_detection)
+        # Log into the result log (record_type=rsu_detection)
         row = {
             "timestamp_utc": time.time(),
             "vehicle_id": None,
@@ -350,83 +347,95 @@ def rsu_check():
             "object_speed_mps": d.get("speed_mps"),
             "raw_payload": json.dumps(d)
         }
+        result_log.append([row])
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 # ---------------- JSON snapshots for Dash ----------------
+SNAPSHOT_EPOCH = format(time.time_ns(), "x")  # keeps ETags of different server runs apart
+
+def _vehicle_rows(view):
+    return [{
+        "veh_id": vid,
+        "x": v["position"][0],
+        "y": v["position"][1],
+        "speed": v["speed"],
+        "heading": v.get("heading", 0.0),
+        "timestamp": v.get("timestamp", 0.0)
+    } for vid, v in view.items()]
+
 @app.route('/v2x/snapshot', methods=['GET'])
 def snapshot():
     """
     Small JSON for Dash to poll quickly.
     Returns live vehicles + last ~N RSU detections (from memory).
+    ?since=<cursor> (the "cursor" of an earlier reply) returns only the RSU detections
+    added since; vehicles are always complete. "reset": true means the cursor did not
+    belong to this server run (list complete). If-None-Match with the ETag of an
+    unchanged state returns 304.
     """
     try:
-        vehicles = []
-        for vid, v in vehicle_states.items():
-            vehicles.append({
-                "veh_id": vid,
-                "x": v["position"][0],
-                "y": v["position"][1],
-                "speed": v["speed"],
-                "heading": v.get("heading", 0.0),
-                "timestamp": v.get("timestamp", 0.0)
-            })
-        rsu = list(_recent_rsu)
-        return jsonify({"vehicles": vehicles, "rsu_recent": rsu, "server_time": time.time()})
+        after, = parse_cursor(request.args.get("since"), 1)
+    except ValueError as e:
+        return jsonify({"error": f"bad since cursor: {e}"}), 400
+    try:
+        version, view = vehicle_store.versioned_snapshot()
+        etag = f"{SNAPSHOT_EPOCH}-{version}-{_recent_rsu.appended}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+        rsu, cursor, reset = _recent_rsu.read(after)
+        resp = jsonify({"vehicles": _vehicle_rows(view), "rsu_recent": rsu, "server_time": time.time(),
+                        "cursor": str(cursor), "delta": after is not None and not reset, "reset": reset})
+        resp.set_etag(etag)
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # ---------------- Simple static plot (kept) ----------------
+# kept for compatibility; the Dash map is richer. Rendered at most once per
+# vehicle_store version and every PLOT_MIN_INTERVAL_S, shared by all clients.
+PLOT_MIN_INTERVAL_S = 1.0
+plot_cache = PlotCache(lambda: render_map(vehicle_store.snapshot(), title="V2X Vehicle Map (risk pairs highlighted)"),
+                       min_interval_s=PLOT_MIN_INTERVAL_S)
+
 @app.route('/v2x/plot', methods=['GET'])
 def plot_vehicle_map():
-    # kept for compatibility; the Dash map is richer
-    import matplotlib
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.set_title("V2X Vehicle Map (risk pairs highlighted)")
-    ax.set_xlabel("X [m]"); ax.set_ylabel("Y [m]")
-
-    vids = list(vehicle_states.keys())
-    ax.grid(True); ax.set_aspect('equal', adjustable='datalim')
-
-    for vid in vids:
-        v = vehicle_states[vid]
-        (x, y), hdg = v["position"], v.get("heading", 0.0)
-        ax.plot(x, y, 'bo', markersize=4)
-        ax.text(x + 1, y + 1, vid, fontsize=7)
-        ax.arrow(x, y, 3*math.cos(math.radians(hdg)), 3*math.sin(math.radians(hdg)),
-                 head_width=0.8, color='blue', length_includes_head=True)
-
-    buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    png, version = plot_cache.get(vehicle_store.version)
+    resp = Response(png, mimetype='image/png')
+    resp.set_etag(f"{version}")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@app.route('/v2x/plot/stats', methods=['GET'])
+def plot_stats():
+    """Renders, cache hits and the last render time of /v2x/plot."""
+    return jsonify(plot_cache.stats())
 
 @app.route('/download/excel', methods=['GET'])
 def download_excel():
-    if not os.path.exists(EXCEL_PATH):
-        return jsonify({"error": "No Excel yet"}), 404
-    return send_file(EXCEL_PATH, as_attachment=True, download_name=EXCEL_PATH)
+    """Build the workbook from the result log on demand."""
+    try:
+        buf = result_log.to_excel_bytes(SHEET_NAME)
+    except Exception as e:
+        return jsonify({"error": f"Excel export failed: {e}"}), 500
+    return send_file(buf, as_attachment=True, download_name=EXCEL_PATH, mimetype=XLSX_MIME)
+
+@app.route('/v2x/results/stats', methods=['GET'])
+def results_stats():
+    """Rows written / pending and the last flush time of the result log."""
+    return jsonify(result_log.stats())
 
 # ---------------- Dash app (mounted at /dash) ----------------
-def _safe_read_excel(n_rows=10000):
-    """Read recent rows from Excel safely; return empty DataFrame on failure."""
-    if not os.path.exists(EXCEL_PATH):
+def _recent_results(n_rows=10000):
+    """Newest rows of the result log; empty DataFrame on failure."""
+    try:
+        return result_log.recent(n_rows)
+    except Exception as e:
+        print("[WARN] result log read failed:", e)
         return pd.DataFrame()
-    with _excel_lock:
-        try:
-            df = pd.read_excel(EXCEL_PATH, sheet_name=SHEET_NAME, engine="openpyxl")
-        except Exception as e:
-            print("[WARN] read_excel failed:", e)
-            return pd.DataFrame()
-    if len(df) > n_rows:
-        df = df.tail(n_rows).copy()
-    return df
 
 def init_dash(flask_app: Flask):
     from dash import Dash, dcc, html, dash_table, Input, Output  # Dash 2.x
@@ -500,20 +509,14 @@ def init_dash(flask_app: Flask):
         Input("timer","n_intervals")
     )
     def refresh(_):
-        import requests as _rq
-        # 1) Live snapshot for vehicles/RSU recent
-        try:
-            snap = _rq.get("http://127.0.0.1:5000/v2x/snapshot", timeout=0.6).json()
-        except Exception:
-            snap = {"vehicles": [], "rsu_recent": []}
-
-        vehs = snap.get("vehicles", [])
-        rsu_recent = snap.get("rsu_recent", [])
+        # 1) Live vehicles/RSU recent, read in-process (what /v2x/snapshot serves, without HTTP/JSON)
+        vehs = _vehicle_rows(vehicle_store.snapshot())
+        rsu_recent = _recent_rsu.view()
         kpi_veh = len(vehs)
         kpi_rsu = len(rsu_recent)
 
-        # 2) Read Excel (last rows)
-        df = _safe_read_excel(n_rows=8000)
+        # 2) Read the result log (last rows)
+        df = _recent_results(n_rows=8000)
         df["timestamp_utc"] = pd.to_datetime(df.get("timestamp_utc", pd.Series(dtype=float)), unit="s", errors="coerce")
 
         # KPIs for alerts in last 10 minutes
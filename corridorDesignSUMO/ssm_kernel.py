@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ssm_kernel.py
+Surrogate safety measure (SSM) math shared by every SSM server, vectorized with NumPy.
+
+Vehicle state is kept in a VehicleTable: a structure of contiguous arrays
+(x, y, vx, vy, heading, speed), one row per vehicle. Velocity components are
+computed once when a vehicle is stored, not again for every pair.
+pair_metrics() evaluates all SSMs for any broadcastable ego/other arrays, so
+ego-vs-all (ego_metrics), an explicit pair list (pair_list_metrics) and
+all-vs-all blocks (block_metrics) each cost a handful of array ops.
+
+Definitions (ego -> other):
+  distance  |p_o - p_e|
+  closing   (v_e - v_o) projected on the ego->other line, > 0 when closing
+  ttc       distance / closing if closing > 0 and distance > 0, else inf
+  delta_v   |v_e - v_o|
+  req_dec   delta_v^2 / (2 * max(distance, 1e-3))
+  thw       distance / ego speed if ego speed > 0, else inf
+  pet       |distance / closing - distance / ref_speed| if both > 0, else inf
+            (ref_speed: ego speed for vehicle pairs, pedestrian speed for VRUs)
+
+Results are dicts of float64 arrays keyed by CORE; core_tuples() turns them
+into per-pair tuples of Python floats for building JSON rows.
+"""
+import math
+
+import numpy as np
+
+INF = float("inf")
+CORE = ("distance", "closing", "delta_v", "ttc", "req_dec", "thw", "pet")
+
+
+def velocity(speed, heading_deg):
+    """(vx, vy) from speed and heading in degrees (scalars)."""
+    rad = math.radians(heading_deg)
+    return speed * math.cos(rad), speed * math.sin(rad)
+
+
+def arrival_gap(distance, closing, ref_speed):
+    """PET proxy: gap between the two arrival times at the current line (see module docstring)."""
+    distance, closing, ref_speed = np.broadcast_arrays(*map(np.asarray, (distance, closing, ref_speed)))
+    ok = (closing > 0) & (ref_speed > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ok, np.abs(distance / closing - distance / ref_speed), INF)
+
+
+def pair_metrics(ex, ey, evx, evy, espeed, ox, oy, ovx, ovy):
+    """All SSMs for broadcastable ego (e*) / other (o*) arrays; returns {name: array} for CORE."""
+    dx, dy = ox - ex, oy - ey
+    distance = np.hypot(dx, dy)
+    rvx, rvy = evx - ovx, evy - ovy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nz = distance > 0
+        ux = np.where(nz, dx / distance, 0.0)
+        uy = np.where(nz, dy / distance, 0.0)
+        closing = -(rvx * ux + rvy * uy)
+        ttc = np.where((closing > 0) & nz, distance / closing, INF)
+        delta_v = np.hypot(rvx, rvy)
+        req_dec = delta_v ** 2 / (2.0 * np.maximum(distance, 1e-3))
+        thw = np.where(espeed > 0, distance / espeed, INF)
+    pet = arrival_gap(distance, closing, espeed)
+    return {"distance": distance, "closing": closing, "delta_v": delta_v, "ttc": ttc,
+            "req_dec": req_dec, "thw": thw, "pet": pet}
+
+
+def point_metrics(pos, speed, heading, opos, ospeed, ohead, pet_speed=None):
+    """
+    One ego/other pair from raw positions, speeds and headings (e.g. vehicle vs
+    pedestrian). pet_speed overrides the PET reference speed. Returns a dict of floats.
+    """
+    vx, vy = velocity(speed, heading)
+    ovx, ovy = velocity(ospeed, ohead)
+    m = pair_metrics(float(pos[0]), float(pos[1]), vx, vy, speed, float(opos[0]), float(opos[1]), ovx, ovy)
+    if pet_speed is not None:
+        m["pet"] = arrival_gap(m["distance"], m["closing"], pet_speed)
+    return {k: float(v) for k, v in m.items()}
+
+
+def core_tuples(m):
+    """Per-pair (distance, closing, delta_v, ttc, req_dec, thw, pet) tuples of Python floats."""
+    return zip(*(np.ravel(m[k]).tolist() for k in CORE))
+
+
+class VehicleTable:
+    """Structure-of-arrays vehicle state with O(1) upsert/remove (swap with last row)."""
+
+    COLUMNS = ("x", "y", "vx", "vy", "heading", "speed")
+
+    def __init__(self, capacity=256):
+        self.ids = []
+        self.index = {}   # vid -> row
+        for c in self.COLUMNS:
+            setattr(self, c, np.zeros(max(1, int(capacity))))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, vid):
+        return vid in self.index
+
+    def _grow(self):
+        for c in self.COLUMNS:
+            old = getattr(self, c)
+            new = np.zeros(2 * len(old))
+            new[:len(old)] = old
+            setattr(self, c, new)
+
+    def upsert(self, vid, x, y, speed, heading):
+        row = self.index.get(vid)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.x):
+                self._grow()
+            self.index[vid] = row
+            self.ids.append(vid)
+        vx, vy = velocity(speed, heading)
+        self.x[row], self.y[row] = x, y
+        self.vx[row], self.vy[row] = vx, vy
+        self.heading[row], self.speed[row] = heading, speed
+        return row
+
+    def remove(self, vid):
+        row = self.index.pop(vid, None)
+        if row is None:
+            return False
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            for c in self.COLUMNS:
+                col = getattr(self, c)
+                col[row] = col[last]
+            self.ids[row] = moved
+            self.index[moved] = row
+        self.ids.pop()
+        return True
+
+    def rows(self, vids):
+        return np.fromiter((self.index[v] for v in vids), dtype=np.intp, count=len(vids))
+
+    def _take(self, rows):
+        return (self.x[rows], self.y[rows], self.vx[rows], self.vy[rows], self.speed[rows])
+
+
+def ego_metrics(table, ego_id, other_ids):
+    """SSMs of one ego against a list of other vehicle ids (arrays aligned with other_ids)."""
+    e = table.index[ego_id]
+    ox, oy, ovx, ovy, _ = table._take(table.rows(other_ids))
+    return pair_metrics(table.x[e], table.y[e], table.vx[e], table.vy[e], table.speed[e], ox, oy, ovx, ovy)
+
+
+def pair_list_metrics(table, ego_ids, other_ids):
+    """SSMs for explicit (ego_ids[i], other_ids[i]) pairs."""
+    ex, ey, evx, evy, es = table._take(table.rows(ego_ids))
+    ox, oy, ovx, ovy, _ = table._take(table.rows(other_ids))
+    return pair_metrics(ex, ey, evx, evy, es, ox, oy, ovx, ovy)
+
+
+def block_metrics(table, ego_ids=None, other_ids=None):
+    """[len(ego_ids), len(other_ids)] SSM matrices (all-vs-all by default; diagonal is self-pairs)."""
+    er = table.rows(ego_ids) if ego_ids is not None else np.arange(len(table))
+    orows = table.rows(other_ids) if other_ids is not None else np.arange(len(table))
+    ex, ey, evx, evy, es = (a[:, None] for a in table._take(er))
+    ox, oy, ovx, ovy, _ = (a[None, :] for a in table._take(orows))
+    return pair_metrics(ex, ey, evx, evy, es, ox, oy, ovx, ovy)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ssm_response.py
+Response shaping for the vehicle SSM endpoints.
+
+A vehicle result lists one "ssm" entry per in-range pair, which is most of the
+JSON a step produces, while clients such as run.py only act on the alerts.
+Clients ask for less with a "response" object in the request JSON (or the same
+keys as query parameters, e.g. ?view=top_k&k=5):
+
+  {"view": "full"}                       every pair (default: replies as before)
+  {"view": "alerts"}                     no "ssm" list, only "alerts"
+  {"view": "top_k", "k": 5}              the k riskiest pairs: lowest TTC first,
+                                         then highest required deceleration
+  {"view": "threshold", "ttc_lt": 5.0}   the pairs with TTC < ttc_lt
+  "ttc_lt" also filters top_k; "fields": ["other_id", "ttc", ...] keeps only
+  these keys of each ssm entry
+
+Shaped replies add "ssm_total" (pairs before filtering). The evaluated results
+are cached per tick and shared, so shaping builds a new reply and never edits
+them; selecting is one pass over the vehicle's pairs, and only the selected
+entries are copied and serialized.
+
+    view = parse_view(data.get("response"), request.args)   # ValueError -> 400
+    return jsonify(shape_result(result, view))
+"""
+import heapq
+
+VIEWS = ("full", "alerts", "top_k", "threshold")
+DEFAULT_K = 5
+
+
+def _number(kind, value, name):
+    """int()/float() of a JSON value; anything unconvertible (list, object, "abc") is a ValueError."""
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"response {name} must be a number") from None
+
+
+def parse_view(opts=None, args=None):
+    """
+    Response options from the request JSON (dict) or the query args; None = full reply.
+    Any malformed option raises ValueError (the endpoints answer 400).
+    """
+    if opts is not None and not isinstance(opts, dict):
+        raise ValueError("response must be an object")
+    opts = dict(opts or {})
+    if not opts and args is not None:
+        opts = {key: args.get(key) for key in ("view", "k", "ttc_lt", "fields") if args.get(key) is not None}
+        if "fields" in opts:
+            opts["fields"] = opts["fields"].split(",")
+    view = opts.get("view", "full")
+    if view not in VIEWS:
+        raise ValueError(f"response view must be one of {', '.join(VIEWS)}")
+    k = _number(int, opts.get("k", DEFAULT_K), "k") if view == "top_k" else None
+    if k is not None and k < 0:
+        raise ValueError("response k must be >= 0")
+    ttc_lt = opts.get("ttc_lt")
+    if view == "threshold" and ttc_lt is None:
+        raise ValueError("response view 'threshold' needs ttc_lt")
+    ttc_lt = None if ttc_lt is None else _number(float, ttc_lt, "ttc_lt")
+    fields = opts.get("fields")
+    if fields is not None and (not isinstance(fields, (list, tuple)) or not all(isinstance(f, str) for f in fields)):
+        raise ValueError("response fields must be a list of ssm keys")
+    if view == "full" and fields is None:
+        return None
+    return {"view": view, "k": k, "ttc_lt": ttc_lt, "fields": None if fields is None else tuple(fields)}
+
+
+def _risk_key(ssm):
+    ttc = ssm.get("ttc")
+    return (float("inf") if ttc is None else ttc, -(ssm.get("required_deceleration") or 0.0))
+
+
+def select_pairs(ssm_list, view):
+    """The ssm entries `view` keeps, riskiest first for top_k (input order otherwise)."""
+    if view["view"] == "alerts":
+        return []
+    if view["ttc_lt"] is not None:
+        lim = view["ttc_lt"]
+        ssm_list = [s for s in ssm_list if s.get("ttc") is not None and s["ttc"] < lim]
+    if view["view"] == "top_k":
+        return heapq.nsmallest(view["k"], ssm_list, key=_risk_key)
+    return ssm_list
+
+
+def shape_result(result, view):
+    """Reply for one vehicle result dict under `view` (None: the result itself)."""
+    if view is None or result is None:
+        return result
+    ssm_list = result.get("ssm", [])
+    picked = select_pairs(ssm_list, view)
+    if view["fields"] is not None:
+        picked = [{f: s[f] for f in view["fields"] if f in s} for s in picked]
+    out = {key: val for key, val in result.items() if key != "ssm"}
+    if view["view"] != "alerts":
+        out["ssm"] = picked
+    out["ssm_total"] = len(ssm_list)
+    return out
@@ -2,133 +2,63 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, request, jsonify, send_file, Response
-import math
 import time
-import threading
-import pandas as pd
 import json
-import os
-import io
 
-# plotting
-import matplotlib
-matplotlib.use("Agg")  # headless
-import matplotlib.pyplot as plt
+import metrics
+import ssm_kernel
+import v2x_codec
+from plot_cache import PlotCache, render_map
+from result_log import ResultLog
+from ssm_response import parse_view, shape_result
+from tick_engine import TickEngine
+from vehicle_store import VehicleStore
 
 app = Flask(__name__)
+v2x_codec.install(app)  # fast JSON / MessagePack bodies and replies
 
-# ---------------- Excel logging utilities ----------------
-_excel_lock = threading.Lock()
+# ---------------- Result logging ----------------
+# Rows are appended to a SQLite log by a background flusher (result_log.py);
+# the Excel workbook is only built on demand by /download/excel.
+RESULT_LOG_PATH = "server_results.sqlite"
 EXCEL_PATH = "server_results.xlsx"
 SHEET_NAME = "server_results"
-
-def _append_rows_to_excel(rows, excel_path=EXCEL_PATH, sheet_name=SHEET_NAME):
-    """
-    rows: list[dict] with columns below. Safely appends by reading, concat, rewrite.
-    """
-    if not rows:
-        return
-
-    df_new = pd.DataFrame(rows)
-
-    cols = [
-        "timestamp_utc",
-        "vehicle_id",
-        "record_type",            # "ssm" | "alert" | "safe" | "vru_ssm"
-        # ssm fields
-        "other_id",
-        "distance_m",
-        "closing_speed_mps",
-        "delta_v_mps",
-        "ttc_s",
-        "required_deceleration_mps2",
-        "time_headway_s",
-        # alert fields
-        "alert_type",
-        "alert_from",
-        "alert_to",
-        "risk_score",
-        "recommended_action",
-        # VRU-only extras
-        "pet_s",
-        # raw
-        "raw_payload"
-    ]
-    for c in cols:
-        if c not in df_new.columns:
-            df_new[c] = pd.NA
-    df_new = df_new[cols]
-
-    with _excel_lock:
-        if os.path.exists(excel_path):
-            try:
-                existing = pd.read_excel(excel_path, sheet_name=sheet_name, engine="openpyxl")
-                combined = pd.concat([existing, df_new], ignore_index=True)
-            except Exception:
-                combined = df_new
-            with pd.ExcelWriter(excel_path, engine="openpyxl", mode="w") as writer:
-                combined.to_excel(writer, sheet_name=sheet_name, index=False)
-        else:
-            with pd.ExcelWriter(excel_path, engine="openpyxl", mode="w") as writer:
-                df_new.to_excel(writer, sheet_name=sheet_name, index=False)
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+result_log = ResultLog(RESULT_LOG_PATH)
 
 # ---------------- State ----------------
-# Latest known vehicles (populated by /v2x/check/vehicle calls from SUMO/TraCI)
-vehicle_states = {}  # vid -> {"position": (x,y), "speed": v, "heading": deg, "timestamp": t}
-
-# ---------------- Helper math ----------------
-def euclidean_distance(p1, p2):
-    dx = p1[0] - p2[0]
-    dy = p1[1] - p2[1]
-    return math.hypot(dx, dy)
-
-def unit_vector(vx, vy):
-    mag = math.hypot(vx, vy)
-    if mag == 0.0:
-        return 0.0, 0.0
-    return vx / mag, vy / mag
-
-def project_speed_along_line(pos_rel, heading_speed_vec):
-    """
-    pos_rel = other - ego (dx, dy)
-    heading_speed_vec = ego_v - other_v (vx, vy)
-    returns +ve when closing, -ve when separating
-    """
-    dx, dy = pos_rel
-    ux, uy = unit_vector(dx, dy)
-    rvx, rvy = heading_speed_vec
-    return -(rvx * ux + rvy * uy)
-
-def compute_ttc(distance, closing_speed):
-    """ seconds until collision if closing_speed>0 (else inf) """
-    if closing_speed <= 0 or distance <= 0:
-        return float('inf')
-    return distance / closing_speed
-
-def required_deceleration(rel_speed, distance, cushion=0.0):
-    """ a = v^2 / (2d) with a small cushion on distance """
-    d_eff = max(distance - cushion, 1e-3)
-    return (rel_speed ** 2) / (2.0 * d_eff)
-
-def time_headway(distance, follower_speed):
-    if follower_speed <= 0:
-        return float('inf')
-    return distance / follower_speed
-
-# Quick pair-risk used for the plot (very simple, uses TTC threshold)
-def will_collide(p1, p2, v1, v2, h1=0.0, h2=0.0, ttc_thresh=2.0):
-    """
-    Return (is_risky, distance, rel_speed_closing) using line-of-approach projection.
-    """
-    d = euclidean_distance(p1, p2)
-    v1x, v1y = v1 * math.cos(math.radians(h1)), v1 * math.sin(math.radians(h1))
-    v2x, v2y = v2 * math.cos(math.radians(h2)), v2 * math.sin(math.radians(h2))
-    pos_rel = (p2[0] - p1[0], p2[1] - p1[1])
-    rel_vx = v1x - v2x
-    rel_vy = v1y - v2y
-    closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-    ttc = compute_ttc(d, closing)
-    return (ttc != float('inf') and ttc < ttc_thresh), d, closing
+# Latest known vehicles (populated by /v2x/check/vehicle calls from SUMO/TraCI).
+# vehicle_store.py keeps the spatial grid and SoA table in step with the states and
+# evicts vehicles on arrival, or after STATE_TTL_SIM_S sim seconds / STATE_TTL_WALL_S
+# wall seconds without an update (background sweep every STATE_SWEEP_S).
+# Neighbour search: only vehicles within NEIGHBOR_RADIUS_M, or close enough to meet
+# within NEIGHBOR_HORIZON_S at their current speeds, are paired (spatial_index.py).
+# The rest are counted as "out_of_range" in the response.
+# Updates carrying sim_time are evaluated per tick (tick_engine.py); an open tick is
+# closed by the next step, POST /v2x/tick/close, or TICK_DEADLINE_S after it opened.
+NEIGHBOR_RADIUS_M = 150.0
+NEIGHBOR_HORIZON_S = 5.0
+STATE_TTL_SIM_S = 5.0
+STATE_TTL_WALL_S = 30.0
+STATE_SWEEP_S = 1.0
+TICK_DEADLINE_S = 1.0
+PLOT_MIN_INTERVAL_S = 1.0   # /v2x/plot re-renders at most this often
+PLOT_TTC_S = 2.0            # pairs below this TTC are drawn on /v2x/plot
+vehicle_store = VehicleStore(ttl_sim=STATE_TTL_SIM_S, ttl_wall=STATE_TTL_WALL_S,
+                             cell_size=NEIGHBOR_RADIUS_M)
+vehicle_store.start_sweeper(STATE_SWEEP_S)
+# vehicle_store.states: vid -> {"position": (x,y), "speed": v, "heading": deg, "timestamp": t, "sim_time": s}
+
+# SSM math lives in ssm_kernel.py (shared by all server variants)
+
+# ---------------- Metrics ----------------
+# Request count/latency/in-flight of the V2X endpoints and state gauges at GET /metrics
+# (metrics.py, Prometheus text format); the tick engine (kernel time, pairs per
+# evaluation) and the result log register their own metrics.
+METRIC_PATHS = ("/v2x/check/vehicle", "/v2x/check/vehicles/batch", "/v2x/check/vru", "/v2x/check",
+                "/v2x/rsu/detections")
+metrics.instrument(app, METRIC_PATHS)
+metrics.REGISTRY.gauge("v2x_vehicles_live", "Live vehicles in the store", fn=lambda: len(vehicle_store))
 
 # ---------------- VRU endpoint (vehicle ↔ pedestrian) ----------------
 @app.route('/v2x/check/vru', methods=['POST'])
@@ -141,7 +71,7 @@ def vru_check_risk():
     }
     """
     try:
-        payload = request.get_json(force=True)
+        payload = v2x_codec.read_payload(v2x_codec.VRU)
         v = payload["vehicle"]
         p = payload["pedestrian"]
 
@@ -152,21 +82,9 @@ def vru_check_risk():
         vh = float(v.get("heading", 0.0))
         ph = float(p.get("heading", 0.0))
 
-        dist = euclidean_distance(vpos, ppos)
-
-        vvx, vvy = vs * math.cos(math.radians(vh)), vs * math.sin(math.radians(vh))
-        pvx, pvy = ps * math.cos(math.radians(ph)), ps * math.sin(math.radians(ph))
-
-        rel_vx = vvx - pvx
-        rel_vy = vvy - pvy
-        pos_rel = (ppos[0] - vpos[0], ppos[1] - vpos[1])
-
-        closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-        ttc = compute_ttc(dist, closing)
-        pet = abs((dist/ps) - (dist/closing)) if (ps > 0 and closing > 0) else float('inf')
-        delta_v = abs(math.hypot(rel_vx, rel_vy))
-        req_dec = required_deceleration(delta_v, dist)
-        thw = time_headway(dist, vs)
+        m = ssm_kernel.point_metrics(vpos, vs, vh, ppos, ps, ph, pet_speed=ps)
+        dist, closing, delta_v = m["distance"], m["closing"], m["delta_v"]
+        ttc, pet, req_dec, thw = m["ttc"], m["pet"], m["req_dec"], m["thw"]
 
         # risk scoring
         risk = 0.0
@@ -200,26 +118,21 @@ def vru_check_risk():
             "severity": severity,
             "timestamp": time.time()
         }
-"""
         # log one row
-        try:
-            _append_rows_to_excel([{
-                "timestamp_utc": time.time(),
-                "vehicle_id": v.get("id"),
-                "record_type": "vru_ssm",
-                "other_id": p.get("id"),
-                "distance_m": round(dist, 3),
-                "closing_speed_mps": round(closing, 3),
-                "delta_v_mps": round(delta_v, 3),
-                "ttc_s": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration_mps2": round(req_dec, 3),
-                "time_headway_s": None if thw == float('inf') else round(thw, 3),
-                "pet_s": None if pet == float('inf') else round(pet, 3),
-                "raw_payload": json.dumps(resp)
-            }])
-        except Exception as e:
-            print("[WARN] Excel append failed (VRU):", e)
-"""
+        result_log.append([{
+            "timestamp_utc": time.time(),
+            "vehicle_id": v.get("id"),
+            "record_type": "vru_ssm",
+            "other_id": p.get("id"),
+            "distance_m": round(dist, 3),
+            "closing_speed_mps": round(closing, 3),
+            "delta_v_mps": round(delta_v, 3),
+            "ttc_s": None if ttc == float('inf') else round(ttc, 3),
+            "required_deceleration_mps2": round(req_dec, 3),
+            "time_headway_s": None if thw == float('inf') else round(thw, 3),
+            "pet_s": None if pet == float('inf') else round(pet, 3),
+            "raw_payload": json.dumps(resp)
+        }])
         return jsonify(resp)
 
     except Exception as e:
@@ -231,158 +144,236 @@ def vru_check_alias():
     return vru_check_risk()
 
 # ---------------- Vehicle↔Vehicle endpoint ----------------
+def _pair_result(vid, other_id, core):
+    """ SSM dict + alert (or None) for one (ego, other) pair from its ssm_kernel core tuple. """
+    distance, closing, delta_v, ttc, req_dec, thw, _ = core
+
+    ssm = {
+        "other_id": other_id,
+        "distance": round(distance, 3),
+        "closing_speed": round(closing, 3),
+        "delta_v": round(delta_v, 3),
+        "ttc": None if ttc == float('inf') else round(ttc, 3),
+        "required_deceleration": round(req_dec, 3),
+        "time_headway": None if thw == float('inf') else round(thw, 3),
+    }
+
+    # risk score & alerts
+    risk = 0.0
+    if ttc != float('inf'):
+        risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
+    if req_dec > 5.0:
+        risk += 0.2
+    if delta_v > 5.0:
+        risk += 0.2
+    risk = min(1.0, risk)
+
+    if risk >= 0.8:
+        alert_type, action = "collision_imminent", "emergency_brake"
+    elif risk >= 0.4:
+        alert_type, action = "collision_warning", "slow_down"
+    else:
+        return ssm, None
+    return ssm, {
+        "type": alert_type,
+        "from": vid, "to": other_id,
+        "risk_score": round(risk, 3),
+        "recommended_action": action,
+        "ttc": None if ttc == float('inf') else round(ttc, 3)
+    }
+
+def _excel_ssm_row(vid, ssm, ts):
+    return {
+        "timestamp_utc": ts,
+        "vehicle_id": vid,
+        "record_type": "ssm",
+        "other_id": ssm["other_id"],
+        "distance_m": ssm["distance"],
+        "closing_speed_mps": ssm["closing_speed"],
+        "delta_v_mps": ssm["delta_v"],
+        "ttc_s": ssm["ttc"],
+        "required_deceleration_mps2": ssm["required_deceleration"],
+        "time_headway_s": ssm["time_headway"],
+        "raw_payload": json.dumps({"ego": vid, "other": ssm["other_id"], "ssm": ssm})
+    }
+
+def _excel_alert_row(vid, alert, ts):
+    return {
+        "timestamp_utc": ts,
+        "vehicle_id": vid,
+        "record_type": "alert",
+        "alert_type": alert["type"],
+        "alert_from": alert["from"],
+        "alert_to": alert["to"],
+        "risk_score": alert["risk_score"],
+        "recommended_action": alert["recommended_action"],
+        "alert_ttc_s": alert["ttc"],
+        "raw_payload": json.dumps({"ego": vid, "alert": alert})
+    }
+
+def _excel_safe_row(vid, safe, ts):
+    return {
+        "timestamp_utc": ts,
+        "vehicle_id": vid,
+        "record_type": "alert",
+        "alert_type": safe.get("action"),
+        "alert_from": vid,
+        "alert_to": None,
+        "risk_score": None,
+        "recommended_action": None,
+        "alert_ttc_s": safe.get("timestamp"),
+        "raw_payload": json.dumps({"ego": vid, "alerts": [safe]})
+    }
+
+def _parse_vehicle(data):
+    """Vehicle payload -> (vid, pos, speed, heading)."""
+    return (data["id"], tuple(data["position"]),
+            float(data.get("speed", 0.0)), float(data.get("heading", 0.0)))
+
+# ego -> [(other_id, distance, closing)] of its pairs below PLOT_TTC_S in its last
+# evaluation (drawn by /v2x/plot; guarded by vehicle_store.lock like the evaluation)
+_plot_pairs = {}
+
+def _vehicle_result(vid, pairs, out_of_range, ts):
+    """ Response entry for one vehicle of an evaluated tick (tick_engine shape callback). """
+    ssm_list, alerts = [], []
+    excel_rows = []
+    risky = []
+
+    for other_id, core in pairs:
+        ssm, alert = _pair_result(vid, other_id, core)
+        ssm_list.append(ssm)
+        if core[3] < PLOT_TTC_S:
+            risky.append((other_id, ssm["distance"], ssm["closing_speed"]))
+        excel_rows.append(_excel_ssm_row(vid, ssm, ts))
+        if alert:
+            alerts.append(alert)
+            excel_rows.append(_excel_alert_row(vid, alert, ts))
+
+    # if no alerts produced, write a "safe" sentinel
+    if not alerts:
+        safe = {"action": "safe", "timestamp": ts}
+        alerts = [safe]
+        excel_rows.append(_excel_safe_row(vid, safe, ts))
+    result_log.append(excel_rows)
+    _plot_pairs[vid] = risky
+    return {"vehicle_id": vid, "ssm": ssm_list, "alerts": alerts, "out_of_range": out_of_range}
+
+vehicle_ticks = TickEngine(vehicle_store, NEIGHBOR_RADIUS_M, NEIGHBOR_HORIZON_S,
+                           shape=_vehicle_result, deadline_s=TICK_DEADLINE_S)
+
 @app.route('/v2x/check/vehicle', methods=['POST'])
 def check_vehicle_risk():
     """
-    JSON: { "id": "veh_1", "position":[x,y], "speed": v, "heading": deg }
-    Returns SSMs vs all other known vehicles + alerts. Appends all rows to Excel.
+    JSON: { "id": "veh_1", "position":[x,y], "speed": v, "heading": deg, "sim_time": t }
+    With sim_time the update joins tick t and the reply is this vehicle's result from
+    the last closed tick ("tick" = its sim_time; empty until the first tick closes).
+    Without sim_time the vehicle is evaluated against nearby live vehicles right away.
+    Optional "response": {"view": "alerts" | "top_k" | "threshold" | "full", "k", "ttc_lt", "fields"}
+    trims the ssm list of the reply (ssm_response.py).
     """
     try:
-        data = request.get_json(force=True)
-        vid = data["id"]
-        pos = tuple(data["position"])
-        speed = float(data.get("speed", 0.0))
-        heading = float(data.get("heading", 0.0))
-
-        vehicle_states[vid] = {
-            "position": pos,
-            "speed": speed,
-            "heading": heading,
-            "timestamp": time.time()
-        }
-
-        ssm_list, alerts = [], []
-        excel_rows = []
+        data = v2x_codec.read_payload(v2x_codec.VEHICLE)
+        try:
+            view = parse_view(data.get("response"), request.args)
+        except ValueError as e:
+            return jsonify({"error": f"bad response options: {e}"}), 400
+        vid, pos, speed, heading = _parse_vehicle(data)
+        if data.get("sim_time") is None:
+            return jsonify(shape_result(vehicle_ticks.evaluate_now(vid, pos, speed, heading), view))
 
-        for other_id, other in vehicle_states.items():
-            if other_id == vid:
-                continue
+        tick, res = vehicle_ticks.update(vid, pos, speed, heading, float(data["sim_time"]))
+        return jsonify({**shape_result(res or {"vehicle_id": vid, "ssm": [], "alerts": []}, view), "tick": tick})
 
-            opos = tuple(other["position"])
-            ospeed = float(other.get("speed", 0.0))
-            ohead = float(other.get("heading", 0.0))
-
-            distance = euclidean_distance(pos, opos)
-
-            vx, vy = speed * math.cos(math.radians(heading)), speed * math.sin(math.radians(heading))
-            ovx, ovy = ospeed * math.cos(math.radians(ohead)), ospeed * math.sin(math.radians(ohead))
-
-            pos_rel = (opos[0] - pos[0], opos[1] - pos[1])
-            rel_vx, rel_vy = vx - ovx, vy - ovy
-
-            closing = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-            ttc = compute_ttc(distance, closing)
-            delta_v = abs(math.hypot(rel_vx, rel_vy))
-            req_dec = required_deceleration(delta_v, distance)
-            thw = time_headway(distance, speed)
-
-            ssm = {
-                "other_id": other_id,
-                "distance": round(distance, 3),
-                "closing_speed": round(closing, 3),
-                "delta_v": round(delta_v, 3),
-                "ttc": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration": round(req_dec, 3),
-                "time_headway": None if thw == float('inf') else round(thw, 3),
-            }
-            ssm_list.append(ssm)
-
-            excel_rows.append({
-                "timestamp_utc": time.time(),
-                "vehicle_id": vid,
-                "record_type": "ssm",
-                "other_id": other_id,
-                "distance_m": round(distance, 3),
-                "closing_speed_mps": round(closing, 3),
-                "delta_v_mps": round(delta_v, 3),
-                "ttc_s": None if ttc == float('inf') else round(ttc, 3),
-                "required_deceleration_mps2": round(req_dec, 3),
-                "time_headway_s": None if thw == float('inf') else round(thw, 3),
-                "raw_payload": json.dumps({"ego": vid, "other": other_id, "ssm": ssm})
-            })
+    except v2x_codec.PayloadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-            # risk score & alerts
-            risk = 0.0
-            if ttc != float('inf'):
-                risk += 0.6 if ttc < 1.0 else (0.3 if ttc < 2.5 else 0.0)
-            if req_dec > 5.0:
-                risk += 0.2
-            if delta_v > 5.0:
-                risk += 0.2
-            risk = min(1.0, risk)
-
-            if risk >= 0.8:
-                alert = {
-                    "type": "collision_imminent",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "emergency_brake",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                excel_rows.append({
-                    "timestamp_utc": time.time(),
-                    "vehicle_id": vid,
-                    "record_type": "alert",
-                    "alert_type": alert["type"],
-                    "alert_from": alert["from"],
-                    "alert_to": alert["to"],
-                    "risk_score": alert["risk_score"],
-                    "recommended_action": alert["recommended_action"],
-                    "alert_ttc_s": alert["ttc"],
-                    "raw_payload": json.dumps({"ego": vid, "alert": alert})
-                })
-            elif risk >= 0.4:
-                alert = {
-                    "type": "collision_warning",
-                    "from": vid, "to": other_id,
-                    "risk_score": round(risk, 3),
-                    "recommended_action": "slow_down",
-                    "ttc": None if ttc == float('inf') else round(ttc, 3)
-                }
-                alerts.append(alert)
-                excel_rows.append({
-                    "timestamp_utc": time.time(),
-                    "vehicle_id": vid,
-                    "record_type": "alert",
-                    "alert_type": alert["type"],
-                    "alert_from": alert["from"],
-                    "alert_to": alert["to"],
-                    "risk_score": alert["risk_score"],
-                    "recommended_action": alert["recommended_action"],
-                    "alert_ttc_s": alert["ttc"],
-                    "raw_payload": json.dumps({"ego": vid, "alert": alert})
-                })
-
-        # if no alerts produced, write a "safe" sentinel
-        if not alerts:
-            safe = {"action": "safe", "timestamp": time.time()}
-            alerts = [safe]
-            excel_rows.append({
-                "timestamp_utc": time.time(),
-                "vehicle_id": vid,
-                "record_type": "alert",
-                "alert_type": safe.get("action"),
-                "alert_from": vid,
-                "alert_to": None,
-                "risk_score": None,
-                "recommended_action": None,
-                "alert_ttc_s": safe.get("timestamp"),
-                "raw_payload": json.dumps({"ego": vid, "alerts": [safe]})
-            })
-"""
+@app.route('/v2x/check/vehicles/batch', methods=['POST'])
+def check_vehicles_batch():
+    """
+    JSON: { "sim_time": 12.4, "vehicles": [ {"id","position","speed","heading"}, ... ] }
+    One call per simulation step = one tick: every vehicle is stored first, then
+    each pair is evaluated once (both directions). Returns
+      { "sim_time": ..., "results": [ {"vehicle_id","ssm","alerts"}, ... ] }
+    An optional "response" object shapes every result as on /v2x/check/vehicle.
+    """
+    try:
+        data = v2x_codec.read_payload(v2x_codec.VEHICLE_BATCH)
         try:
-            _append_rows_to_excel(excel_rows, EXCEL_PATH, SHEET_NAME)
-        except Exception as e:
-            print("[WARN] Excel append failed (vehicle):", e)
-"""
-        return jsonify({"vehicle_id": vid, "ssm": ssm_list, "alerts": alerts})
-
+            view = parse_view(data.get("response"), request.args)
+        except ValueError as e:
+            return jsonify({"error": f"bad response options: {e}"}), 400
+        batch = [_parse_vehicle(v) for v in data.get("vehicles", [])]
+        sim_time = data.get("sim_time")
+        tick = vehicle_ticks.run_tick(None if sim_time is None else float(sim_time), batch)
+        results = [shape_result(tick.results[b[0]], view) for b in batch if b[0] in tick.results] if tick else []
+        return jsonify({"sim_time": data.get("sim_time"), "results": results})
+
+    except v2x_codec.PayloadError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/v2x/tick/close', methods=['POST'])
+def tick_close():
+    """
+    JSON: { "sim_time": 12.4 }
+    Sent after the last per-vehicle update of a step; evaluates that tick now
+    instead of waiting for the next step or the TICK_DEADLINE_S deadline.
+    """
+    try:
+        data = request.get_json(force=True)
+        sim_time = data.get("sim_time")
+        tick = vehicle_ticks.close(None if sim_time is None else float(sim_time))
+        return jsonify(tick.summary() if tick else {"sim_time": sim_time, "closed_by": None})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/v2x/tick', methods=['GET'])
+def tick_stats():
+    """Open tick, last closed tick (size, pairs, eval time) and close/late counters."""
+    return jsonify(vehicle_ticks.stats())
+
+@app.route('/v2x/vehicle/departed', methods=['POST'])
+def vehicle_departed():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it enters the simulation; drops state left over
+    from an earlier vehicle with the same id.
+    """
+    try:
+        data = request.get_json(force=True)
+        replaced = vehicle_store.depart(data.get("ids", []), data.get("sim_time"))
+        return jsonify({"sim_time": data.get("sim_time"), "replaced": replaced})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/v2x/vehicle/arrived', methods=['POST'])
+def vehicle_arrived():
+    """
+    JSON: { "sim_time": 12.4, "ids": ["veh_1", ...] }
+    Sent once per vehicle when it leaves the simulation; drops its state so it
+    is no longer paired with live vehicles.
+    """
+    try:
+        data = request.get_json(force=True)
+        removed = vehicle_store.arrive(data.get("ids", []))
+        return jsonify({"sim_time": data.get("sim_time"), "removed": removed})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/v2x/vehicle/stats', methods=['GET'])
+def vehicle_stats():
+    """Live vehicle count, sim clock, departures and eviction counts by reason."""
+    return jsonify(vehicle_store.stats())
+
+
 #rsu detection 
 @app.route('/v2x/rsu/detections', methods=['POST'])
 def rsu_detections():
@@ -400,7 +391,7 @@ def rsu_detections():
     Or: { "detections": [ ...same objects... ] }
     """
     try:
-        data = request.get_json(force=True)
+        data = v2x_codec.read_payload(v2x_codec.RSU_DETECTIONS)
 
         # normalize to list
         if "detections" in data and isinstance(data["detections"], list):
@@ -434,13 +425,7 @@ def rsu_detections():
                 # keep raw in case we evolve the schema later
                 "raw_payload": json.dumps(d)
             })
-"""
-        if rows:
-            try:
-                _append_rows_to_excel(rows, EXCEL_PATH, SHEET_NAME)
-            except Exception as e:
-                print("[WARN] Excel append failed (RSU):", e)
-"""
+        result_log.append(rows)
         return jsonify({"ok": True, "accepted": len(rows)})
 
     except Exception as e:
@@ -448,58 +433,38 @@ def rsu_detections():
         
         
 # ---------------- Live plot & download ----------------
+# /v2x/plot is rendered at most once per vehicle_store version and at most every
+# PLOT_MIN_INTERVAL_S, and the PNG is shared by all clients (plot_cache.py). The
+# risky pairs are not recomputed: they come from _plot_pairs, filled by the SSM
+# evaluation (_vehicle_result).
+def _render_plot():
+    with vehicle_store.lock:
+        states = vehicle_store.snapshot()
+        for vid in [vid for vid in _plot_pairs if vid not in states]:
+            del _plot_pairs[vid]
+        risky = {}
+        for vid, lst in _plot_pairs.items():
+            for other_id, dist, closing in lst:
+                if other_id in states:
+                    risky.setdefault(tuple(sorted((vid, other_id))), (dist, closing))
+    msgs = [f"{a} ↔ {b}  d={d:.1f}m  close={c:.1f} m/s" for (a, b), (d, c) in risky.items()]
+    return render_map(states, list(risky), title="V2X Vehicle Map (risk pairs highlighted)",
+                      pair_title=f"Pairs < {PLOT_TTC_S:g}s TTC:", pair_lines=msgs)
+
+plot_cache = PlotCache(_render_plot, min_interval_s=PLOT_MIN_INTERVAL_S)
+
 @app.route('/v2x/plot', methods=['GET'])
 def plot_vehicle_map():
-    # build a static snapshot
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.set_title("V2X Vehicle Map (risk pairs highlighted)")
-    ax.set_xlabel("X [m]"); ax.set_ylabel("Y [m]")
-
-    vids = list(vehicle_states.keys())
-    risky_pairs = set()
-    alert_msgs = []
-
-    # scatter all vehicles
-    for vid in vids:
-        v = vehicle_states[vid]
-        (x, y), spd, hdg = v["position"], v["speed"], v.get("heading", 0.0)
-        ax.plot(x, y, 'bo', markersize=4)
-        ax.text(x + 1, y + 1, vid, fontsize=7)
-        ax.arrow(x, y, 3*math.cos(math.radians(hdg)), 3*math.sin(math.radians(hdg)),
-                 head_width=0.8, color='blue', length_includes_head=True)
-
-    # pairwise simple risk
-    for i in range(len(vids)):
-        for j in range(i+1, len(vids)):
-            v1 = vehicle_states[vids[i]]
-            v2 = vehicle_states[vids[j]]
-            risky, dist, rel = will_collide(v1["position"], v2["position"], v1["speed"], v2["speed"],
-                                            v1.get("heading", 0.0), v2.get("heading", 0.0))
-            if risky:
-                risky_pairs.add((vids[i], vids[j]))
-                alert_msgs.append(f"{vids[i]} ↔ {vids[j]}  d={dist:.1f}m  close={rel:.1f} m/s")
-
-    for a, b in risky_pairs:
-        x1, y1 = vehicle_states[a]["position"]
-        x2, y2 = vehicle_states[b]["position"]
-        ax.plot([x1, x2], [y1, y2], 'r--', linewidth=2)
-
-    ax.grid(True); ax.set_aspect('equal', adjustable='datalim')
-    ax.text(0.01, 0.99, f"Vehicles: {len(vids)}\nAlerts: {len(risky_pairs)}",
-            transform=ax.transAxes, va='top', fontsize=10,
-            bbox=dict(boxstyle="round", fc="w", ec="0.5"))
-
-    if alert_msgs:
-        ax.text(1.02, 0.97, "Pairs < 2s TTC:", transform=ax.transAxes, va='top', fontsize=9)
-        for i, m in enumerate(alert_msgs[:10]):
-            ax.text(1.02, 0.93 - 0.05*i, m, transform=ax.transAxes, fontsize=8)
-
-    buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=120)
-    plt.close(fig)
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    png, version = plot_cache.get(vehicle_store.version)
+    resp = Response(png, mimetype='image/png')
+    resp.set_etag(f"{version}")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@app.route('/v2x/plot/stats', methods=['GET'])
+def plot_stats():
+    """Renders, cache hits and the last render time of /v2x/plot."""
+    return jsonify(plot_cache.stats())
 
 @app.route('/')
 def dashboard():
@@ -520,9 +485,17 @@ def dashboard():
 
 @app.route('/download/excel', methods=['GET'])
 def download_excel():
-    if not os.path.exists(EXCEL_PATH):
-        return jsonify({"error": "No Excel yet"}), 404
-    return send_file(EXCEL_PATH, as_attachment=True, download_name=EXCEL_PATH)
+    """Build the workbook from the result log on demand."""
+    try:
+        buf = result_log.to_excel_bytes(SHEET_NAME)
+    except Exception as e:
+        return jsonify({"error": f"Excel export failed: {e}"}), 500
+    return send_file(buf, as_attachment=True, download_name=EXCEL_PATH, mimetype=XLSX_MIME)
+
+@app.route('/v2x/results/stats', methods=['GET'])
+def results_stats():
+    """Rows written / pending and the last flush time of the result log."""
+    return jsonify(result_log.stats())
 
 # ---------------- Main ----------------
 if __name__ == '__main__':
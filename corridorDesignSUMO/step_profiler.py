@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+step_profiler.py
+Per-phase timing of the run.py TraCI loop.
+
+The loop calls mark(phase) after each piece of work; the time since the previous
+mark is added to that phase, so interleaved per-vehicle work (state reads, lane
+fixes, HTTP submits, CSV rows) is split without nested timers:
+
+    prof.begin_step()
+    traci.simulationStep();           prof.mark("sumo_step")
+    ...per vehicle: read state;       prof.mark("veh_state")
+                    lane check;       prof.mark("lane_fix")
+    row = prof.end_step(t)            # -> step_profile table row
+
+TraCI round trips are counted by wrapping traci's Connection._sendExact (every
+command, including simulationStep, goes through it once). Rolling percentiles
+cover the last `window` steps; run totals cover the whole run.
+
+NullProfiler has the same interface and does nothing (used when --profile is off).
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+PHASES = (
+    "sumo_step", "lifecycle", "veh_state", "lane_fix", "v2x_send", "csv_write",
+    "ped_state", "infra", "rsu_detect", "v2x_responses", "detectors", "csv_flush",
+)
+
+_traci_calls = 0
+
+
+def install_traci_counter():
+    """Count TraCI round trips (idempotent). Only called when profiling is on."""
+    from traci.connection import Connection
+    if getattr(Connection._sendExact, "_counted", False):
+        return
+    original = Connection._sendExact
+
+    def _sendExact(self, *a, **kw):
+        global _traci_calls
+        _traci_calls += 1
+        return original(self, *a, **kw)
+
+    _sendExact._counted = True
+    Connection._sendExact = _sendExact
+
+
+def columns():
+    """Column (name, kind) list of the step_profile table."""
+    return ([("sim_time", "float"), ("wall_ms", "float"), ("traci_calls", "int")]
+            + [(f"{p}_ms", "float") for p in PHASES])
+
+
+class StepProfiler:
+    def __init__(self, window=1000):
+        install_traci_counter()
+        self.window = max(1, int(window))
+        self._hist = {p: deque(maxlen=self.window) for p in PHASES + ("wall", "traci_calls")}
+        self._totals = dict.fromkeys(PHASES + ("wall", "traci_calls"), 0.0)
+        self.steps = 0
+        self._cur = dict.fromkeys(PHASES, 0.0)
+        self._step_start = self._last = time.perf_counter()
+        self._calls_start = _traci_calls
+
+    def begin_step(self):
+        self._cur = dict.fromkeys(PHASES, 0.0)
+        self._step_start = self._last = time.perf_counter()
+        self._calls_start = _traci_calls
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._cur[phase] += now - self._last
+        self._last = now
+
+    def end_step(self, sim_time):
+        """Close the step; returns its step_profile row (times in ms)."""
+        wall = (time.perf_counter() - self._step_start) * 1000.0
+        calls = _traci_calls - self._calls_start
+        row = {"sim_time": sim_time, "wall_ms": round(wall, 3), "traci_calls": calls}
+        for p, sec in self._cur.items():
+            ms = sec * 1000.0
+            row[f"{p}_ms"] = round(ms, 3)
+            self._hist[p].append(ms)
+            self._totals[p] += ms
+        self._hist["wall"].append(wall)
+        self._hist["traci_calls"].append(calls)
+        self._totals["wall"] += wall
+        self._totals["traci_calls"] += calls
+        self.steps += 1
+        return row
+
+    def percentiles(self, name, qs=(50, 95, 99)):
+        vals = self._hist[name]
+        if not vals:
+            return [0.0] * len(qs)
+        return [float(v) for v in np.percentile(np.fromiter(vals, float, len(vals)), qs)]
+
+    def status(self):
+        """One-line rolling summary for the periodic status print."""
+        p50, p95, _ = self.percentiles("wall")
+        c50, = self.percentiles("traci_calls", (50,))
+        return f"step p50={p50:.2f}ms p95={p95:.2f}ms traci_calls p50={c50:.0f}"
+
+    def summary(self):
+        """Final report: run totals, share of wall time, rolling p50/p95/p99 per phase."""
+        n = max(1, self.steps)
+        wall_total = self._totals["wall"] or 1.0
+        lines = [
+            f"Step profile: {self.steps} steps, {self._totals['wall'] / 1000.0:.2f}s in loop, "
+            f"{self._totals['traci_calls'] / n:.1f} TraCI calls/step "
+            f"(percentiles over last {min(self.steps, self.window)} steps)",
+            f"{'phase':<14}{'total s':>9}{'share':>8}{'mean ms':>9}{'p50':>9}{'p95':>9}{'p99':>9}",
+        ]
+        for p in PHASES + ("wall",):
+            tot = self._totals[p]
+            p50, p95, p99 = self.percentiles(p)
+            lines.append(f"{p:<14}{tot / 1000.0:>9.3f}{100.0 * tot / wall_total:>7.1f}%"
+                         f"{tot / n:>9.3f}{p50:>9.3f}{p95:>9.3f}{p99:>9.3f}")
+        c50, c95, c99 = self.percentiles("traci_calls")
+        lines.append(f"{'traci_calls':<14}{self._totals['traci_calls']:>9.0f}{'':>8}"
+                     f"{self._totals['traci_calls'] / n:>9.1f}{c50:>9.0f}{c95:>9.0f}{c99:>9.0f}")
+        return "\n".join(lines)
+
+
+class NullProfiler:
+    """Profiling disabled: every hook is a no-op."""
+    steps = 0
+
+    def begin_step(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_step(self, sim_time):
+        return None
+
+    def status(self):
+        return ""
+
+    def summary(self):
+        return ""
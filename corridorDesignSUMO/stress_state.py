@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stress_state.py
+Concurrency stress run for the SSM servers' shared state.
+
+Starts one server module in-process on a threaded werkzeug server, then for
+--seconds runs writer threads (per-vehicle updates with sim_time, tick closes,
+VRU checks, RSU detections, arrivals) against reader threads (snapshot, stats
+and tick endpoints) at the same time. Any 5xx, connection error or inconsistent
+snapshot (a vehicle listed twice) is counted as a failure; the exit code is 1
+if there was any. The interpreter's thread switch interval is lowered so that
+request threads interleave far more often than they would by chance.
+
+    python stress_state.py --server ssm_dash_noexcel --seconds 20 --writers 8 --readers 8
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from request_stats import RequestStats, percentile
+
+READ_PATHS = ("/v2x/snapshot", "/v2x/vehicle/stats", "/v2x/tick", "/v2x/results/stats")
+
+
+def _call(stats, session, method, url, path, **kw):
+    t0 = time.perf_counter()
+    try:
+        r = session.request(method, url + path, timeout=30, **kw)
+        ok, detail = r.status_code < 500, f"HTTP {r.status_code} {r.text[:200]}"
+    except Exception as e:
+        r, ok, detail = None, False, repr(e)
+    if ok and path == "/v2x/snapshot":
+        ids = [v["veh_id"] for v in r.json().get("vehicles", [])]
+        if len(ids) != len(set(ids)):
+            ok, detail = False, "vehicle listed twice"
+    stats.record(path, (time.perf_counter() - t0) * 1000.0, ok, detail)
+    return r
+
+
+def writer(stats, url, paths, wid, n_vehicles, stop, t0, step_s):
+    s = requests.Session()
+    rnd = random.Random(wid)
+    while not stop.is_set():
+        # all writers share one sim clock running at wall speed, like one SUMO client
+        sim_time = int((time.monotonic() - t0) / step_s) * step_s
+        for i in range(n_vehicles):
+            vid = f"w{wid}_v{i}"
+            _call(stats, s, "POST", url, "/v2x/check/vehicle", json={
+                "id": vid, "position": [rnd.uniform(0, 1500), rnd.uniform(0, 20)],
+                "speed": rnd.uniform(0, 20), "heading": rnd.choice([90.0, 270.0]),
+                "sim_time": round(sim_time, 3)})
+        if "/v2x/tick/close" in paths:
+            _call(stats, s, "POST", url, "/v2x/tick/close", json={"tick": round(sim_time, 3)})
+        if "/v2x/check/vru" in paths:
+            _call(stats, s, "POST", url, "/v2x/check/vru", json={
+                "vehicle": {"id": f"w{wid}_v0", "position": [rnd.uniform(0, 1500), 5.0], "speed": 10.0, "heading": 90.0},
+                "pedestrian": {"id": f"w{wid}_p", "position": [rnd.uniform(0, 1500), 8.0], "speed": 1.3, "heading": 180.0}})
+        if "/v2x/check/rsu" in paths:
+            _call(stats, s, "POST", url, "/v2x/check/rsu", json={
+                "rsu_id": "RSU_A2", "rsu_x": 600.0, "rsu_y": 10.0, "obj_type": "vehicle",
+                "obj_id": f"w{wid}_v0", "obj_x": 610.0, "obj_y": 5.0, "distance_m": 11.2, "speed_mps": 10.0})
+        if "/v2x/vehicle/arrived" in paths and rnd.random() < 0.2:
+            _call(stats, s, "POST", url, "/v2x/vehicle/arrived", json={
+                "sim_time": round(sim_time, 3), "ids": [f"w{wid}_v{rnd.randrange(n_vehicles)}"]})
+
+
+def reader(stats, url, paths, stop):
+    s = requests.Session()
+    while not stop.is_set():
+        for path in paths:
+            _call(stats, s, "GET", url, path)
+
+
+def main(args):
+    sys.setswitchinterval(args.switch_interval)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+    module = __import__(args.server)
+    app = module.app
+    routes = {r.rule for r in app.url_map.iter_rules()}
+    read_paths = [p for p in READ_PATHS if p in routes]
+    if args.plot and "/v2x/plot" in routes:
+        read_paths.append("/v2x/plot")
+
+    srv = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_port}"
+    print(f"[INFO] {args.server} on {url}: {args.writers} writers x {args.vehicles} vehicles, "
+          f"{args.readers} readers on {read_paths}")
+
+    stats, stop, t0 = RequestStats(), threading.Event(), time.monotonic()
+    threads = [threading.Thread(target=writer, args=(stats, url, routes, w, args.vehicles, stop, t0, args.step_length))
+               for w in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(stats, url, read_paths, stop))
+                for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    srv.shutdown()
+
+    print(f"{'path':28s} {'calls':>8s} {'failed':>7s} {'p50 ms':>8s} {'p99 ms':>8s}")
+    for path in sorted(stats.calls):
+        lat = stats.lat_ms[path]
+        print(f"{path:28s} {stats.calls[path]:8d} {stats.failed[path]:7d} "
+              f"{percentile(lat, 0.50):8.2f} {percentile(lat, 0.99):8.2f}")
+    for ex in stats.examples:
+        print("[FAIL]", ex)
+    failed = sum(stats.failed.values())
+    print(f"[INFO] {sum(stats.calls.values())} calls in {args.seconds:.0f}s, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Hammer the update and snapshot endpoints of an SSM server concurrently.")
+    ap.add_argument("--server", default="ssm_dash_noexcel",
+                    help="Server module to load (ssm_server, ssm_desh, ssm_dash_noexcel, ssm_dash_noexcel_pet)")
+    ap.add_argument("--seconds", type=float, default=20.0, help="Duration of the run")
+    ap.add_argument("--writers", type=int, default=8, help="Writer threads (each drives its own vehicles)")
+    ap.add_argument("--readers", type=int, default=8, help="Reader threads")
+    ap.add_argument("--vehicles", type=int, default=25, help="Vehicles per writer")
+    ap.add_argument("--step-length", type=float, default=0.1, help="Sim step (s); the sim clock runs at wall speed")
+    ap.add_argument("--switch-interval", type=float, default=1e-5,
+                    help="sys.setswitchinterval() for the run (default CPython: 0.005)")
+    ap.add_argument("--plot", action="store_true", help="Readers also fetch /v2x/plot (slow)")
+    sys.exit(main(ap.parse_args()))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_tick_engine.py
+TickEngine evaluation against a VehicleStore whose entries expire mid-tick.
+
+    python -m pytest -q test_tick_engine.py
+"""
+from tick_engine import TickEngine
+from vehicle_store import VehicleStore
+
+
+def _engine(store):
+    return TickEngine(store, radius=150.0, horizon=5.0, deadline_s=None,
+                      shape=lambda vid, pairs, out_of_range, ts: {"pairs": [o for o, _ in pairs],
+                                                                  "out_of_range": out_of_range})
+
+
+def test_tick_member_expiring_during_evaluation_is_skipped():
+    store = VehicleStore(ttl_sim=None, ttl_wall=30.0)
+    for vid, x in (("a", 0.0), ("b", 10.0), ("c", 20.0), ("far", 5000.0)):
+        store.upsert(vid, (x, 0.0), 10.0, 0.0, sim_time=1.0)
+    # b's wall TTL ran out: a's neighbour search evicts it before b's turn comes
+    store._seen["b"] -= 60.0
+    engine = _engine(store)
+
+    results, pairs = engine.evaluate(["a", "b", "c"])
+
+    assert "b" not in store
+    assert set(results) == {"a", "c"}
+    assert results["a"]["pairs"] == ["c"] and results["c"]["pairs"] == ["a"]
+    assert results["a"]["out_of_range"] == 1  # "far"
+    assert pairs == 2
+    assert store.evicted["ttl_wall"] == 1
+
+
+def test_tick_close_with_expired_member():
+    store = VehicleStore(ttl_sim=None, ttl_wall=30.0)
+    engine = _engine(store)
+    for vid, x in (("a", 0.0), ("b", 10.0), ("c", 20.0)):
+        engine.update(vid, (x, 0.0), 10.0, 0.0, sim_time=1.0)
+    store._seen["b"] -= 60.0
+
+    tick = engine.close(1.0)
+
+    assert tick.closed_by == "explicit"
+    assert set(tick.results) == {"a", "c"}
+    assert engine.cached("b") == (1.0, None)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_v2x_sender.py
+V2XSender against a local stdlib HTTP server that records what it receives.
+
+    python -m pytest -q test_v2x_sender.py
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from v2x_sender import V2XSender
+
+VEH_PATH = "/v2x/check/vehicle"
+CLOSE_PATH = "/v2x/tick/close"
+ARRIVED_PATH = "/v2x/vehicle/arrived"
+
+
+class Recorder:
+    """Threaded HTTP server; `gate` holds every request until set, `delay` slows each one."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+        self.received = []          # (path, body) in arrival order
+        self.lock = threading.Lock()
+        rec = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with rec.lock:
+                    rec.received.append((self.path, body))
+                rec.gate.wait()
+                time.sleep(rec.delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self, path):
+        return [body for p, body in self.received if p == path]
+
+    def shutdown(self):
+        self.gate.set()
+        self.server.shutdown()
+
+
+@pytest.fixture
+def recorder():
+    rec = Recorder()
+    yield rec
+    rec.shutdown()
+
+
+def _wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize("policy", ["drop", "latest"])
+def test_full_queue_keeps_ordered_messages(recorder, policy):
+    recorder.gate.clear()
+    sender = V2XSender(recorder.url, workers=1, queue_size=3, policy=policy)
+    # the worker is held by the first message; everything after it queues up
+    sender.submit(VEH_PATH, {"id": "v0", "sim_time": 0}, key="v0")
+    _wait_for(lambda: len(recorder.received) == 1)
+    for step in range(1, 6):
+        sender.submit(ARRIVED_PATH, {"sim_time": step, "ids": [f"gone{step}"]}, ordered=True)
+        for i in range(4):
+            sender.submit(VEH_PATH, {"id": f"v{step}_{i}", "sim_time": step}, key=f"v{step}_{i}")
+        sender.submit(CLOSE_PATH, {"sim_time": step}, ordered=True)
+    assert sender.stats()["dropped"] > 0
+    recorder.gate.set()
+    sender.close(10.0)
+
+    assert [b["sim_time"] for b in recorder.paths(ARRIVED_PATH)] == [1, 2, 3, 4, 5]
+    assert [b["sim_time"] for b in recorder.paths(CLOSE_PATH)] == [1, 2, 3, 4, 5]
+    assert len(recorder.paths(VEH_PATH)) == 1 + 3  # the held one plus a full queue
+
+
+def test_lagging_server_coalesces_updates_across_steps():
+    rec = Recorder(delay=0.02)     # ~20 ms per request, far slower than the 5 ms steps below
+    try:
+        n_veh, steps = 20, 15
+        sender = V2XSender(rec.url, workers=2, queue_size=n_veh + 5, policy="latest")
+        for step in range(steps):
+            for i in range(n_veh):
+                sender.submit(VEH_PATH, {"id": f"v{i}", "sim_time": step}, key=f"v{i}")
+            sender.submit(CLOSE_PATH, {"sim_time": step}, ordered=True)
+            assert sender.stats()["queued"] <= n_veh + steps
+            time.sleep(0.005)
+        sender.close(30.0)
+        st = sender.stats()
+    finally:
+        rec.shutdown()
+
+    assert st["dropped"] == 0
+    assert st["superseded"] > 0
+    assert [b["sim_time"] for b in rec.paths(CLOSE_PATH)] == list(range(steps))
+    # no update reaches the server after the close of its own (or a later) step
+    closed = -1
+    for path, body in rec.received:
+        if path == CLOSE_PATH:
+            closed = body["sim_time"]
+        else:
+            assert body["sim_time"] > closed
+    last = {b["id"]: b["sim_time"] for b in rec.paths(VEH_PATH)}
+    assert last == {f"v{i}": steps - 1 for i in range(n_veh)}
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tick_engine.py
+Sim-time-synchronous SSM evaluation for the SSM servers.
+
+Vehicle updates are grouped by the sim_time the client sends. While a tick is
+open its updates only go into the VehicleStore (vehicle_store.py); nothing is
+paired. When the tick closes, every vehicle of the tick is paired with its
+live neighbours in one vectorized pass (ssm_kernel.pair_list_metrics), so all
+vehicles are compared against same-step positions and each pair is listed once
+per direction. A tick closes on whichever comes first:
+
+  next_tick  an update for a later sim_time arrives
+  explicit   close(sim_time), i.e. POST /v2x/tick/close after the last update
+  deadline   deadline_s wall seconds after the tick opened
+  batch      run_tick(): a whole step in one call (/v2x/check/vehicles/batch)
+
+Per-vehicle queries are answered from the last closed tick (cached(vid)), so an
+update for step t returns the vehicle's result for the latest closed step.
+Updates for a tick older than the open one, or for an already closed tick, are
+counted as "late": they refresh the stored state (unless it is newer) but are not
+evaluated. A jump back by more than the store's rewind_s
+(simulation restarted) resets the ticks instead.
+
+The server supplies shape(ego, pairs, out_of_range, ts) -> result dict, where
+pairs is a list of (other_id, core) with core an ssm_kernel.CORE tuple; shape
+runs once per vehicle per tick (under the store lock), so side effects such
+as dashboard buffers are recorded exactly once. Each close also publishes the
+store's read-only view (VehicleStore.snapshot()).
+
+Exported metrics (metrics.REGISTRY): kernel time and pairs per evaluation,
+pairs evaluated, ticks closed by reason, late updates.
+"""
+import threading
+import time
+
+import ssm_kernel
+from metrics import COUNT_BUCKETS, REGISTRY
+
+CLOSE_REASONS = ("next_tick", "explicit", "deadline", "batch")
+
+KERNEL_SECONDS = REGISTRY.histogram("ssm_kernel_seconds", "Time of one vectorized SSM kernel pass (pair_list_metrics)")
+EVAL_PAIRS = REGISTRY.histogram("ssm_eval_pairs", "Directed pairs per SSM evaluation (tick close or tick-less request)",
+                                buckets=COUNT_BUCKETS)
+PAIRS_TOTAL = REGISTRY.counter("ssm_pairs_evaluated_total", "Directed pairs evaluated by the SSM kernel")
+TICKS_CLOSED = REGISTRY.counter("ssm_ticks_closed_total", "Ticks closed, by reason", ("reason",))
+LATE_UPDATES = REGISTRY.counter("ssm_late_updates_total", "Updates for an already closed or older tick")
+
+
+class Tick:
+    def __init__(self, sim_time):
+        self.sim_time = sim_time
+        self.ids = {}               # vid -> None (insertion-ordered set)
+        self.opened = time.monotonic()
+        self.timer = None
+        self.closed_by = None
+        self.results = {}           # vid -> shape() result
+        self.pairs = 0
+        self.eval_ms = 0.0
+
+    def summary(self):
+        return {"sim_time": self.sim_time, "vehicles": len(self.ids), "pairs": self.pairs,
+                "eval_ms": round(self.eval_ms, 3), "closed_by": self.closed_by}
+
+
+class TickEngine:
+    def __init__(self, store, radius, horizon, shape, deadline_s=1.0):
+        self.store = store
+        self.radius = radius
+        self.horizon = horizon
+        self.shape = shape
+        self.deadline_s = deadline_s  # None/0 disables the deadline
+        self.lock = store.lock        # one lock for state + ticks
+        self.open = None              # Tick collecting updates
+        self.last = None              # last closed Tick
+        self.closed = dict.fromkeys(CLOSE_REASONS, 0)
+        self.late = 0
+        self.restarts = 0
+
+    # ---- evaluation ----
+    def evaluate(self, ids):
+        """
+        Pair `ids` with their live neighbours now; returns ({vid: result}, pair count).
+        neighbors() evicts expired vehicles as it meets them, which can include
+        later members of `ids`: those are skipped and get no result.
+        """
+        with self.lock:
+            egos, others = [], []
+            near_by = dict.fromkeys(ids)
+            done = set()
+            version = self.store.version
+            # (ego, other) pairs in range; both directions when both are in ids
+            for a in ids:
+                if a not in self.store:
+                    del near_by[a]
+                    continue
+                near_by[a] = self.store.neighbors(a, self.radius, self.horizon)
+                for b in near_by[a]:
+                    if b in done:
+                        continue  # pair already listed from b's side
+                    egos.append(a)
+                    others.append(b)
+                    if b in near_by:
+                        egos.append(b)
+                        others.append(a)
+                done.add(a)
+            if self.store.version != version:
+                # something was evicted on the way: drop pairs listed before it went
+                live_ids = self.store.states
+                kept = [(e, o) for e, o in zip(egos, others) if e in live_ids and o in live_ids]
+                egos, others = [e for e, _ in kept], [o for _, o in kept]
+                near_by = {vid: [b for b in near if b in live_ids]
+                           for vid, near in near_by.items() if vid in live_ids}
+
+            t0 = time.perf_counter()
+            m = ssm_kernel.pair_list_metrics(self.store.table, egos, others)
+            KERNEL_SECONDS.observe(time.perf_counter() - t0)
+            EVAL_PAIRS.observe(len(egos))
+            PAIRS_TOTAL.inc(len(egos))
+            pairs_by = {vid: [] for vid in near_by}
+            for ego, other, core in zip(egos, others, ssm_kernel.core_tuples(m)):
+                pairs_by[ego].append((other, core))
+
+            live, ts = len(self.store), time.time()
+            return {vid: self.shape(vid, pairs_by[vid], live - 1 - len(near_by[vid]), ts)
+                    for vid in near_by}, len(egos)
+
+    def evaluate_now(self, vid, pos, speed, heading, **extra):
+        """Tick-less path for clients that send no sim_time: store + evaluate one vehicle."""
+        with self.lock:
+            self.store.upsert(vid, pos, speed, heading, **extra)
+            return self.evaluate([vid])[0][vid]
+
+    # ---- ticks ----
+    def _add(self, vid, pos, speed, heading, sim_time, extra):
+        newest = self.open or self.last
+        if newest is not None and sim_time < newest.sim_time - self.store.rewind_s:
+            self._restart()
+        if self.open is not None and sim_time > self.open.sim_time:
+            self._close("next_tick")
+        if (self.open is not None and sim_time < self.open.sim_time) or \
+                (self.last is not None and sim_time <= self.last.sim_time):
+            self.late += 1
+            LATE_UPDATES.inc()
+            prev = self.store.states.get(vid)
+            if prev is None or prev["sim_time"] is None or prev["sim_time"] <= sim_time:
+                self.store.upsert(vid, pos, speed, heading, sim_time=sim_time, **extra)
+            return False
+        self.store.upsert(vid, pos, speed, heading, sim_time=sim_time, **extra)
+        if self.open is None:
+            self.open = Tick(sim_time)
+            if self.deadline_s:
+                tick = self.open
+                tick.timer = threading.Timer(self.deadline_s, self._deadline, args=(tick,))
+                tick.timer.daemon = True
+                tick.timer.start()
+        self.open.ids[vid] = None
+        return True
+
+    def update(self, vid, pos, speed, heading, sim_time, **extra):
+        """Buffer one update into its tick; returns (tick sim_time, result) for vid from the last closed tick."""
+        with self.lock:
+            self._add(vid, pos, speed, heading, sim_time, extra)
+            return self.cached(vid)
+
+    def cached(self, vid):
+        with self.lock:
+            if self.last is None:
+                return None, None
+            return self.last.sim_time, self.last.results.get(vid)
+
+    def run_tick(self, sim_time, vehicles, **extra):
+        """
+        A whole step at once: vehicles is [(vid, pos, speed, heading)]; returns the
+        closed Tick (None if the whole step was late). sim_time=None evaluates the
+        vehicles on their own, outside the tick sequence.
+        """
+        with self.lock:
+            if sim_time is None:
+                tick = Tick(None)
+                for vid, pos, speed, heading in vehicles:
+                    self.store.upsert(vid, pos, speed, heading, **extra)
+                    tick.ids[vid] = None
+                tick.results, tick.pairs = self.evaluate(list(tick.ids))
+                return tick
+            for vid, pos, speed, heading in vehicles:
+                self._add(vid, pos, speed, heading, sim_time, extra)
+            if self.open is None or self.open.sim_time != sim_time:
+                return None
+            return self._close("batch")
+
+    def close(self, sim_time=None):
+        """Close the open tick (only if it is `sim_time` or older); returns it, or None."""
+        with self.lock:
+            if self.open is None or (sim_time is not None and self.open.sim_time > sim_time):
+                return None
+            return self._close("explicit")
+
+    def _restart(self):
+        if self.open is not None and self.open.timer is not None:
+            self.open.timer.cancel()
+        self.open = self.last = None
+        self.restarts += 1
+
+    def _deadline(self, tick):
+        with self.lock:
+            if self.open is tick:
+                self._close("deadline")
+
+    def _close(self, reason):
+        tick, self.open = self.open, None
+        if tick.timer is not None:
+            tick.timer.cancel()
+        t0 = time.perf_counter()
+        ids = [vid for vid in tick.ids if vid in self.store]  # may have arrived meanwhile
+        tick.results, tick.pairs = self.evaluate(ids)
+        tick.eval_ms = (time.perf_counter() - t0) * 1000.0
+        tick.closed_by = reason
+        self.closed[reason] += 1
+        TICKS_CLOSED.inc(1, reason)
+        self.last = tick
+        self.store.publish()  # readers see the states of this tick
+        return tick
+
+    def stats(self):
+        with self.lock:
+            return {"open": None if self.open is None else {"sim_time": self.open.sim_time,
+                                                            "vehicles": len(self.open.ids)},
+                    "last": None if self.last is None else self.last.summary(),
+                    "closed": dict(self.closed), "late": self.late, "restarts": self.restarts,
+                    "deadline_s": self.deadline_s}
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+v2x_codec.py
+Wire codecs for the V2X endpoints: fast JSON and MessagePack, chosen per request.
+
+Server side, install(app) once after creating the Flask app:
+  - a body sent as Content-Type: application/msgpack is unpacked, any other body is
+    parsed as JSON (orjson when installed), so request.get_json(force=True) works
+    unchanged in every handler
+  - jsonify() replies in MessagePack when the Accept header prefers
+    application/msgpack, otherwise in JSON encoded by orjson (with Vary: Accept)
+  - read_payload(VEHICLE) = get_json + validate(): the vehicle, batch, VRU and RSU
+    payloads are type-checked in one pass before a handler uses them. A mismatch
+    raises PayloadError (a ValueError) naming the field; handlers answer it with 400
+
+Client side (v2x_sender.py, run.py --v2x-codec):
+    body, headers = encode_body(payload, "msgpack")
+    r = session.post(url, data=body, headers=headers)
+    reply = decode_body(r)
+
+Codecs: "json" (stdlib, the old wire format), "fast-json" (orjson, same wire
+format), "msgpack". orjson and msgpack are optional: without orjson JSON falls back
+to the stdlib; without msgpack the server never replies in it and rejects
+msgpack bodies with a PayloadError.
+"""
+import json
+
+from flask import Request, Response, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # optional: only needed for application/msgpack
+    msgpack = None
+
+JSON_MIME = "application/json"
+MSGPACK_MIME = "application/msgpack"
+CODECS = ("json", "fast-json", "msgpack")
+
+
+class PayloadError(ValueError):
+    """Undecodable body or a payload that does not match its schema (HTTP 400)."""
+
+
+def _default(o):
+    """Encoder fallback for NumPy scalars/arrays and sets."""
+    if hasattr(o, "tolist"):  # numpy scalar or array
+        return o.tolist()
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not serializable")
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. ints beyond 64 bit: let the stdlib try
+    return json.dumps(obj, default=_default).encode()
+
+
+def loads_json(data):
+    try:
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    except ValueError as e:
+        raise PayloadError(f"invalid JSON body: {e}") from None
+
+
+def packb(obj):
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def unpackb(data):
+    if msgpack is None:
+        raise PayloadError("application/msgpack bodies need the msgpack package on the server")
+    try:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except Exception as e:
+        raise PayloadError(f"invalid MessagePack body: {e}") from None
+
+
+# ---- Flask integration ----
+class CodecRequest(Request):
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype != MSGPACK_MIME:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        if cache and getattr(self, "_msgpack_body", None) is not None:
+            return self._msgpack_body
+        try:
+            obj = unpackb(self.get_data(cache=cache))
+        except PayloadError:
+            if silent:
+                return None
+            raise
+        if cache:
+            self._msgpack_body = obj
+        return obj
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """flask.json / jsonify backed by orjson; jsonify negotiates MessagePack."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # indent, sort_keys, ...: only the stdlib path takes options
+            return super().dumps(obj, **kwargs)
+        return dumps_json(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads_json(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if msgpack is not None and has_request_context() and \
+                request.accept_mimetypes.best_match([JSON_MIME, MSGPACK_MIME], JSON_MIME) == MSGPACK_MIME:
+            resp = Response(packb(obj), mimetype=MSGPACK_MIME)
+        else:
+            resp = Response(dumps_json(obj), mimetype=JSON_MIME)
+        resp.vary.add("Accept")
+        return resp
+
+
+def install(app):
+    """Use the codecs for every request body / jsonify() of `app`."""
+    app.request_class = CodecRequest
+    app.json = CodecJSONProvider(app)
+    return app
+
+
+def read_payload(schema):
+    """Body of the current request, validated against `schema`."""
+    try:
+        data = request.get_json(force=True)
+    except PayloadError:
+        raise
+    except Exception:  # werkzeug BadRequest for unparsable JSON
+        raise PayloadError("body is not valid JSON") from None
+    validate(data, schema)
+    return data
+
+
+# ---- client side ----
+def encode_body(payload, codec="json"):
+    """(body bytes, headers) for a POST of `payload` with `codec`."""
+    if codec == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack is required for --v2x-codec msgpack (pip install msgpack)")
+        return packb(payload), {"Content-Type": MSGPACK_MIME, "Accept": MSGPACK_MIME}
+    body = dumps_json(payload) if codec == "fast-json" else json.dumps(payload).encode()
+    return body, {"Content-Type": JSON_MIME, "Accept": JSON_MIME}
+
+
+def decode_body(resp):
+    """Decoded body of a requests.Response, by its Content-Type."""
+    if resp.headers.get("Content-Type", "").startswith(MSGPACK_MIME):
+        return unpackb(resp.content)
+    return loads_json(resp.content)
+
+
+# ---- schemas ----
+# A schema maps field -> (check, required). Checks return an error message or None;
+# fields not listed are passed through unchecked.
+def _number(v):
+    if isinstance(v, bool) or not isinstance(v, (int, float)):
+        return "must be a number"
+
+
+def _opt_number(v):
+    return None if v is None else _number(v)
+
+
+def _ident(v):
+    if isinstance(v, bool) or not isinstance(v, (str, int)):
+        return "must be a string or an integer"
+
+
+def _opt_ident(v):
+    return None if v is None else _ident(v)
+
+
+def _opt_text(v):
+    if v is not None and not isinstance(v, str):
+        return "must be a string"
+
+
+def _xy(v):
+    if not isinstance(v, (list, tuple)) or len(v) != 2 or _number(v[0]) or _number(v[1]):
+        return "must be [x, y] numbers"
+
+
+def _opt_object(v):
+    if v is not None and not isinstance(v, dict):
+        return "must be an object"
+
+
+def _object(schema):
+    def check(v):
+        if not isinstance(v, dict):
+            return "must be an object"
+        err = _errors(v, schema)
+        return err and "." + err
+    return check
+
+
+def _list_of(schema):
+    def check(v):
+        if not isinstance(v, list):
+            return "must be a list"
+        for i, item in enumerate(v):
+            if not isinstance(item, dict):
+                return f"[{i}] must be an object"
+            err = _errors(item, schema)
+            if err:
+                return f"[{i}].{err}"
+    return check
+
+
+def _errors(data, schema):
+    for field, (check, required) in schema.items():
+        if field not in data:
+            if required:
+                return f"{field}: is required"
+            continue
+        err = check(data[field])
+        if err:  # nested errors come back as ".field: ..." / "[i].field: ..."
+            return f"{field}{err}" if err.startswith((".", "[")) else f"{field}: {err}"
+
+
+def validate(data, schema):
+    """Raise PayloadError if `data` does not match `schema`."""
+    if not isinstance(data, dict):
+        raise PayloadError("payload must be an object")
+    err = _errors(data, schema)
+    if err:
+        raise PayloadError(err)
+    return data
+
+
+VEHICLE = {
+    "id": (_ident, True),
+    "position": (_xy, True),
+    "speed": (_number, False),
+    "heading": (_number, False),
+    "sim_time": (_opt_number, False),
+    "response": (_opt_object, False),
+}
+VEHICLE_BATCH = {
+    "sim_time": (_opt_number, False),
+    "vehicles": (_list_of({k: v for k, v in VEHICLE.items() if k not in ("sim_time", "response")}), True),
+    "response": (_opt_object, False),
+}
+VRU_ENTITY = {
+    "id": (_opt_ident, False),
+    "position": (_xy, True),
+    "speed": (_number, False),
+    "heading": (_number, False),
+}
+VRU = {
+    "vehicle": (_object(VRU_ENTITY), True),
+    "pedestrian": (_object(VRU_ENTITY), True),
+}
+RSU = {  # flat detection from run.py (/v2x/check/rsu)
+    "rsu_id": (_ident, True),
+    "rsu_x": (_opt_number, False),
+    "rsu_y": (_opt_number, False),
+    "obj_type": (_opt_text, False),
+    "obj_id": (_opt_ident, False),
+    "obj_x": (_opt_number, False),
+    "obj_y": (_opt_number, False),
+    "distance_m": (_opt_number, False),
+    "speed_mps": (_opt_number, False),
+    "sim_time": (_opt_number, False),
+}
+RSU_DETECTION = {  # nested detection (/v2x/rsu/detections); bad records are skipped by the handler
+    "rsu_id": (_opt_ident, False),
+    "rsu": (_opt_object, False),
+    "object": (_opt_object, False),
+    "sim_time": (_opt_number, False),
+}
+RSU_DETECTIONS = dict(RSU_DETECTION, detections=(_list_of(RSU_DETECTION), False))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+v2x_sender.py
+V2X senders used by run.py to talk to the Flask SSM server.
+
+  - DirectSender : blocking requests.post per message (old behaviour)
+  - V2XSender    : persistent pooled requests.Session + bounded queue drained by
+                   worker threads; SUMO stepping never waits on the network
+
+Both expose the same interface:
+  submit(path, payload, key=None, ordered=False)  -> queue/send one POST
+  poll()                           -> list of (path, key, response_json) received so far
+  stats()                          -> {"sent","dropped","failed","superseded","queued"}
+  close()
+
+Bodies are encoded with `codec` ("json", "fast-json" or "msgpack", see
+v2x_codec.py); replies are decoded by their Content-Type.
+
+Queue policies for V2XSender when the server lags:
+  - "drop"   : queue full -> the new message is dropped
+  - "latest" : messages with the same key (e.g. vehicle id) replace the pending
+               one in place; queue full with a new key -> oldest pending dropped
+Ordered messages (below) don't count towards queue_size and are never dropped.
+
+Ordering: V2XSender's workers take messages off the queue in submission order,
+but with more than one worker several POSTs are in flight at once and the
+server may receive (and finish) them in any order, also two messages of the
+same key. A "latest" replacement keeps the pending message's place, so it can
+end up ahead of messages submitted before it. Messages that must not be
+overtaken either way (tick close, departed/arrived) are submitted with
+ordered=True: such a message is sent only after every earlier message has been
+answered, and nothing submitted after it is sent before it is answered.
+Ordered messages only order delivery; they don't stop coalescing. A vehicle
+update that replaces one queued before an ordered message moves behind the
+newest ordered message, so a server lagging by several steps receives each
+vehicle once, in the latest step. DirectSender sends everything in submission
+order.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from v2x_codec import CODECS, decode_body, encode_body
+
+POLICIES = ("drop", "latest")
+
+
+def _check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"unknown codec {codec!r} (expected one of {CODECS})")
+    encode_body({}, codec)  # fails early if the codec's package is missing
+    return codec
+
+
+class DirectSender:
+    """Synchronous sender: one blocking requests.post per submit()."""
+
+    def __init__(self, base_url, timeout=5.0, codec="json"):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.codec = _check_codec(codec)
+        self._responses = []
+        self._counters = {"sent": 0, "dropped": 0, "failed": 0, "superseded": 0}
+
+    def submit(self, path, payload, key=None, ordered=False):
+        try:
+            body, headers = encode_body(payload, self.codec)
+            r = requests.post(f"{self.base_url}{path}", data=body, headers=headers, timeout=self.timeout)
+            if r.ok:
+                self._counters["sent"] += 1
+                self._responses.append((path, key, decode_body(r)))
+            else:
+                self._counters["failed"] += 1
+                print(f"[WARN] Flask {path} responded {r.status_code}")
+        except Exception as e:
+            self._counters["failed"] += 1
+            print(f"[ERROR] V2X {path} error for {key}: {e}")
+
+    def poll(self):
+        out, self._responses = self._responses, []
+        return out
+
+    def stats(self):
+        return dict(self._counters, queued=0)
+
+    def close(self, timeout=None):
+        pass
+
+
+class V2XSender:
+    """
+    Background sender. submit() only touches an in-memory queue; `workers`
+    threads share one pooled Session (keep-alive, pool size = workers) and push
+    server replies onto a response list that the TraCI loop drains with poll().
+    """
+
+    def __init__(self, base_url, workers=2, queue_size=2000, policy="latest", timeout=5.0, codec="json"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown sender policy {policy!r} (expected one of {POLICIES})")
+        self.base_url = base_url
+        self.timeout = timeout
+        self.codec = _check_codec(codec)
+        self.policy = policy
+        self.queue_size = max(1, int(queue_size))
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # slot -> (path, key, payload, ordered, epoch); insertion order == dequeue order
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._bounded = 0           # pending messages that count towards queue_size (not ordered)
+        self._epoch = 0             # ordered messages submitted so far
+        self._inflight = 0          # messages taken by a worker and not answered yet
+        self._ordered_busy = False  # an ordered message is in flight
+        self._cv = threading.Condition()
+        self._closing = False
+
+        self._resp_lock = threading.Lock()
+        self._responses = []
+        self._counters = {"sent": 0, "dropped": 0, "failed": 0, "superseded": 0}
+
+        self._threads = [threading.Thread(target=self._worker, name=f"v2x-sender-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for th in self._threads:
+            th.start()
+
+    # ---- producer side (TraCI thread) ----
+    def submit(self, path, payload, key=None, ordered=False):
+        with self._cv:
+            if self._closing:
+                self._counters["dropped"] += 1
+                return
+            if ordered:
+                self._epoch += 1
+                slot = next(self._seq)
+            elif self.policy == "latest" and key is not None:
+                slot = (path, key)
+            else:
+                slot = next(self._seq)
+            entry = (path, key, payload, ordered, self._epoch)
+            if slot in self._pending:
+                # keep-latest: newer state replaces the unsent one and keeps its place,
+                # unless an ordered message was queued since: then it goes behind that
+                self._counters["superseded"] += 1
+                if self._pending[slot][4] != self._epoch:
+                    del self._pending[slot]
+                self._pending[slot] = entry
+                return
+            if not ordered:
+                if self._bounded >= self.queue_size:
+                    self._counters["dropped"] += 1
+                    if self.policy == "drop":
+                        return
+                    # evict the oldest message that isn't ordered
+                    del self._pending[next(k for k, v in self._pending.items() if not v[3])]
+                    self._bounded -= 1
+                self._bounded += 1
+            self._pending[slot] = entry
+            self._cv.notify()
+
+    def poll(self):
+        with self._resp_lock:
+            out, self._responses = self._responses, []
+        return out
+
+    def stats(self):
+        with self._cv:
+            return dict(self._counters, queued=len(self._pending))
+
+    def close(self, timeout=5.0):
+        """Stop accepting messages, let workers drain the queue, then join."""
+        with self._cv:
+            self._closing = True
+            self._cv.notify_all()
+        for th in self._threads:
+            th.join(timeout)
+        self._session.close()
+
+    # ---- consumer side (worker threads) ----
+    def _ready(self):
+        """The head of the queue may be sent now (called with the lock held)."""
+        if not self._pending or self._ordered_busy:
+            return False
+        ordered = next(iter(self._pending.values()))[3]
+        return not ordered or self._inflight == 0
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._ready():
+                    if self._closing and not self._pending:
+                        return
+                    self._cv.wait()
+                _, (path, key, payload, ordered, _) = self._pending.popitem(last=False)
+                if not ordered:
+                    self._bounded -= 1
+                self._inflight += 1
+                self._ordered_busy = ordered
+            try:
+                self._send(path, key, payload)
+            finally:
+                with self._cv:
+                    self._inflight -= 1
+                    if ordered:
+                        self._ordered_busy = False
+                    self._cv.notify_all()
+
+    def _send(self, path, key, payload):
+        try:
+            body, headers = encode_body(payload, self.codec)
+            r = self._session.post(f"{self.base_url}{path}", data=body, headers=headers, timeout=self.timeout)
+            if r.ok:
+                body = decode_body(r)
+                with self._cv:
+                    self._counters["sent"] += 1
+                with self._resp_lock:
+                    self._responses.append((path, key, body))
+            else:
+                with self._cv:
+                    self._counters["failed"] += 1
+                print(f"[WARN] Flask {path} responded {r.status_code}")
+        except Exception as e:
+            with self._cv:
+                self._counters["failed"] += 1
+            print(f"[ERROR] V2X {path} error for {key}: {e}")
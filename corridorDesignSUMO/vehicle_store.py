@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+vehicle_store.py
+Live-vehicle state for the SSM servers: the latest state per vehicle plus the
+spatial grid (spatial_index.py) and SoA table (ssm_kernel.py) kept in step with it.
+
+Entries leave the store for one of these reasons, each counted in stats()["evicted"]:
+  arrived   explicit /v2x/vehicle/arrived notification from run.py
+  ttl_sim   no update for ttl_sim seconds of *simulation* time (the sim clock is
+            the largest sim_time seen in any update)
+  ttl_wall  no update for ttl_wall seconds of wall time (covers clients that send
+            no sim_time, and a client that stopped without saying goodbye)
+  replaced  a departure notification for an id that still holds state from before
+            that departure (ids reused across runs)
+  rewind    the sim clock jumped back by more than rewind_s (the client restarted
+            the simulation); every entry from the old run is dropped
+
+Expired entries are removed by a background sweeper (start_sweeper), when the sim
+clock advances, and lazily by neighbors(), so pair evaluation only sees live
+vehicles even between sweeps. Handlers hold `lock` across store + kernel calls.
+
+Readers that only iterate the states (/v2x/snapshot, plots, dashboards) use
+snapshot(): a read-only mapping that is copied only when the states changed and
+then shared by every reader (copy-on-write). The tick engine publishes one per
+closed tick; if a writer holds the lock, snapshot() returns the last published
+view instead of waiting. Stored state dicts are replaced on update, never
+modified, so a view stays consistent however long it is held.
+
+    store = VehicleStore(ttl_sim=5.0, ttl_wall=30.0, cell_size=150.0)
+    store.start_sweeper(1.0)
+    store.upsert("veh_1", (x, y), speed, heading, sim_time=12.4)
+    near = store.neighbors("veh_1", radius=150.0, horizon=5.0)
+    store.arrive(["veh_1"])
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from spatial_index import SpatialGrid
+from ssm_kernel import VehicleTable
+
+EVICTION_REASONS = ("arrived", "ttl_sim", "ttl_wall", "replaced", "rewind")
+
+
+class VehicleStore:
+    def __init__(self, ttl_sim=5.0, ttl_wall=30.0, cell_size=150.0, rewind_s=10.0):
+        self.ttl_sim = ttl_sim      # None/0 disables
+        self.ttl_wall = ttl_wall    # None/0 disables
+        self.rewind_s = rewind_s
+        self.lock = threading.RLock()
+        self.states = {}            # vid -> {"position","speed","heading","timestamp","sim_time", ...}
+        self.grid = SpatialGrid(cell_size=cell_size)
+        self.table = VehicleTable()
+        self.sim_now = None         # latest sim_time seen
+        self.departed = 0
+        self.evicted = dict.fromkeys(EVICTION_REASONS, 0)
+        self._seen = {}             # vid -> time.monotonic() of the last update
+        self._sweeper = None
+        self.version = 0            # bumped on every change of `states` (change detection, ETags)
+        self._published = (0, MappingProxyType({}))  # (version, read-only view) handed to readers
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, vid):
+        return vid in self.states
+
+    # ---- updates ----
+    def upsert(self, vid, pos, speed, heading, sim_time=None, **extra):
+        """Store the latest state of `vid`; returns the stored dict."""
+        with self.lock:
+            if self.rewound(sim_time):
+                self._evict([v for v, s in self.states.items()
+                             if s["sim_time"] is not None and s["sim_time"] > sim_time], "rewind")
+                self.sim_now = None
+            state = {"position": pos, "speed": speed, "heading": heading,
+                     "timestamp": time.time(), "sim_time": sim_time, **extra}
+            self.states[vid] = state
+            self.version += 1
+            self._seen[vid] = time.monotonic()
+            self.grid.update(vid, pos[0], pos[1], speed)
+            self.table.upsert(vid, pos[0], pos[1], speed, heading)
+            if sim_time is not None and (self.sim_now is None or sim_time > self.sim_now):
+                self.sim_now = sim_time
+                if self.ttl_sim:
+                    self._evict(self._expired_sim(), "ttl_sim")
+            return state
+
+    def rewound(self, sim_time):
+        """True if sim_time lies more than rewind_s behind the sim clock (simulation restarted)."""
+        return sim_time is not None and self.sim_now is not None and sim_time < self.sim_now - self.rewind_s
+
+    def depart(self, ids, sim_time=None):
+        """Departure notification; drops state an id still holds from an earlier life."""
+        with self.lock:
+            self.departed += len(ids)
+            if sim_time is None:
+                return []
+            stale = [vid for vid in ids
+                     if vid in self.states and (self.states[vid]["sim_time"] or 0.0) < sim_time]
+            return self._evict(stale, "replaced")
+
+    def arrive(self, ids):
+        """Arrival notification; returns the ids that were actually dropped."""
+        with self.lock:
+            return self._evict([vid for vid in ids if vid in self.states], "arrived")
+
+    # ---- expiry ----
+    def _expired_sim(self):
+        limit = self.sim_now - self.ttl_sim
+        return [vid for vid, s in self.states.items()
+                if s["sim_time"] is not None and s["sim_time"] < limit]
+
+    def _expired_wall(self, now):
+        limit = now - self.ttl_wall
+        return [vid for vid, seen in self._seen.items() if seen < limit]
+
+    def _is_live(self, vid, now):
+        if self.ttl_wall and now - self._seen[vid] > self.ttl_wall:
+            return False
+        st = self.states[vid]["sim_time"]
+        if self.ttl_sim and st is not None and self.sim_now - st > self.ttl_sim:
+            return False
+        return True
+
+    def _evict(self, ids, reason):
+        for vid in ids:
+            del self.states[vid]
+            del self._seen[vid]
+            self.grid.remove(vid)
+            self.table.remove(vid)
+        self.evicted[reason] += len(ids)
+        if ids:
+            self.version += 1
+        return ids
+
+    def sweep(self):
+        """Drop every expired entry; returns the number evicted."""
+        with self.lock:
+            n = 0
+            if self.ttl_sim and self.sim_now is not None:
+                n += len(self._evict(self._expired_sim(), "ttl_sim"))
+            if self.ttl_wall:
+                n += len(self._evict(self._expired_wall(time.monotonic()), "ttl_wall"))
+            return n
+
+    def start_sweeper(self, interval=1.0):
+        """Run sweep() every `interval` seconds on a daemon thread (idempotent)."""
+        if self._sweeper is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print("[WARN] vehicle state sweep failed:", e)
+
+        self._sweeper = threading.Thread(target=_loop, name="vehicle-sweeper", daemon=True)
+        self._sweeper.start()
+
+    # ---- queries ----
+    def neighbors(self, vid, radius, horizon=0.0):
+        """Live vehicles in range of `vid` (spatial_index rule); expired ones found on the way are evicted."""
+        with self.lock:
+            now = time.monotonic()
+            near, dead = [], []
+            for other in self.grid.neighbors(vid, radius, horizon):
+                (near if self._is_live(other, now) else dead).append(other)
+            if dead:
+                wall = [o for o in dead if self.ttl_wall and now - self._seen[o] > self.ttl_wall]
+                self._evict(wall, "ttl_wall")
+                self._evict([o for o in dead if o not in wall], "ttl_sim")
+            return near
+
+    def others(self, vid):
+        """Every other live vehicle, no spatial filter (servers that pair ego-vs-all)."""
+        with self.lock:
+            self.sweep()
+            return [o for o in self.table.ids if o != vid]
+
+    def publish(self):
+        """Freeze the current states as the view snapshot() hands out; returns it."""
+        with self.lock:
+            if self._published[0] != self.version:
+                self._published = (self.version, MappingProxyType(dict(self.states)))
+            return self._published[1]
+
+    def versioned_snapshot(self):
+        """(version, view): the read-only view and the store version it was taken at."""
+        published = self._published
+        if published[0] == self.version or not self.lock.acquire(blocking=False):
+            return published
+        try:
+            self.publish()
+            return self._published
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """Read-only view of the live states; never waits for a writer (see module doc)."""
+        return self.versioned_snapshot()[1]
+
+    def stats(self):
+        with self.lock:
+            return {"live": len(self.states), "sim_now": self.sim_now,
+                    "departed": self.departed, "evicted": dict(self.evicted),
+                    "ttl_sim_s": self.ttl_sim, "ttl_wall_s": self.ttl_wall,
+                    "view_lag": self.version - self._published[0]}
@@ -27,6 +27,12 @@ writer.writerow(["time", "vehicle", "pedestrian", "action", "distance"])
 while traci.simulation.getMinExpectedNumber() > 0:
     traci.simulationStep()
 
+    # colours never change: set them once, when the entity enters the network
+    for veh_id in traci.simulation.getDepartedIDList():
+        traci.vehicle.setColor(veh_id, get_entity_color(veh_id))
+    for pid in traci.simulation.getDepartedPersonIDList():
+        traci.person.setColor(pid, get_entity_color(pid))
+
     veh_ids = traci.vehicle.getIDList()
     ped_ids = traci.person.getIDList()
 
@@ -35,15 +41,13 @@ while traci.simulation.getMinExpectedNumber() > 0:
     for veh_id in veh_ids:
         vpos = traci.vehicle.getPosition(veh_id)
         vspeed = traci.vehicle.getSpeed(veh_id)
-        traci.vehicle.setColor(veh_id, get_entity_color(veh_id))
         print(" vehicle position is ",vpos)
         print(" vehicle speed is ",vspeed)
-        payload={"id": veh_id, "position": vpos, "speed": vspeed}
+        payload={"id": veh_id, "position": vpos, "speed": vspeed, "sim_time": traci.simulation.getTime()}
         r = requests.post("http://localhost:5000/v2x/check/vehicle", json=payload)
         print(r.json())
         for pid in ped_ids:
             ppos = traci.person.getPosition(pid)
-            traci.person.setColor(pid, get_entity_color(pid))
 
             #distance = math.sqrt((vpos[0] - ppos[0])**2 + (vpos[1] - ppos[1])**2)
 
@@ -1,16 +1,29 @@
 # v2x_server.py (simplified)
 from flask import Flask, request, jsonify,send_file
 import math
+import os
+import sys
 import time
-import matplotlib.pyplot as plt
 import io
 
+# live-vehicle store shared with the corridor servers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "corridorDesignSUMO"))
+from plot_cache import PlotCache, render_map
+from vehicle_store import VehicleStore
+
 
 app = Flask(__name__)
 
 
-# Global dictionary to store latest vehicle data
-vehicle_states = {}
+# Latest vehicle data; vehicles not updated for STATE_TTL_WALL_S seconds are
+# dropped by a background sweep
+STATE_TTL_WALL_S = 30.0
+vehicle_store = VehicleStore(ttl_sim=5.0, ttl_wall=STATE_TTL_WALL_S)
+vehicle_store.start_sweeper(1.0)
+
+# vid -> {other_id: (distance, rel_speed)} of the pairs will_collide() flagged in
+# the vehicle's last check (drawn by /v2x/plot)
+collide_pairs = {}
 
 def euclidean_distance(pos1, pos2):
     dx = pos1[0] - pos2[0]
@@ -56,22 +69,22 @@ def check_vehicle_risk():
         heading = data.get("heading", 0.0)  # Optional
 
         # Store current state
-        vehicle_states[vid] = {
-            "position": pos,
-            "speed": speed,
-            "heading": heading,
-            "timestamp": time.time()
-        }
+        vehicle_store.upsert(vid, pos, speed, heading, sim_time=data.get("sim_time"))
 
         alerts = []
+        hits = {}
 
-        # Check for potential collisions with other vehicles
-        for other_id, other in vehicle_states.items():
-            if other_id == vid:
-                continue
+        # Check for potential collisions with other live vehicles
+        with vehicle_store.lock:
+            other_ids = vehicle_store.others(vid)
+            vehicle_states = vehicle_store.snapshot()
+        for other_id in other_ids:
+            other = vehicle_states[other_id]
 
             # Simple collision check
             collision, distance, rel_speed = will_collide(pos, other["position"], speed, other["speed"])
+            if collision:
+                hits[other_id] = (distance, rel_speed)
 
             # Predict future positions for advanced logic (optional)
             future_pos1 = predict_position(pos, speed, heading, t=1)
@@ -91,6 +104,8 @@ def check_vehicle_risk():
                     "timestamp": time.time()
                 })
                 print(alerts)
+        with vehicle_store.lock:
+            collide_pairs[vid] = hits
         return jsonify({
             "vehicle_id": vid,
             "alerts": alerts if alerts else [{"action": "safe", "timestamp": time.time()}]
@@ -99,70 +114,40 @@ def check_vehicle_risk():
     except Exception as e:
         print("Error processing request:", e)
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/v2x/vehicle/stats', methods=['GET'])
+def vehicle_stats():
+    """Live vehicle count and eviction counts by reason."""
+    return jsonify(vehicle_store.stats())
         
         
+# /v2x/plot re-renders at most once per state version and every PLOT_MIN_INTERVAL_S;
+# all clients share the PNG. Risky pairs are the will_collide() results the vehicle
+# checks already computed (collide_pairs), not a new all-pairs loop.
+PLOT_MIN_INTERVAL_S = 1.0
+
+def render_plot():
+    with vehicle_store.lock:
+        vehicle_states = vehicle_store.snapshot()
+        for vid in [vid for vid in collide_pairs if vid not in vehicle_states]:
+            del collide_pairs[vid]
+        risky_pairs = {}
+        for vid1, hits in collide_pairs.items():
+            for vid2, (dist, rel_speed) in hits.items():
+                if vid2 in vehicle_states:
+                    risky_pairs.setdefault(tuple(sorted((vid1, vid2))), (dist, rel_speed))
+    alert_messages = [f"⚠ {vid1} ↔ {vid2} | {dist:.1f}m @ Δv={rel_speed:.1f} m/s"
+                      for (vid1, vid2), (dist, rel_speed) in risky_pairs.items()]
+    return render_map(vehicle_states, list(risky_pairs), title="V2X Vehicle Map with Collision Risk",
+                      pair_title="Live Alerts:", pair_lines=alert_messages, figsize=(10, 8), dpi=100)
+
+plot_cache = PlotCache(render_plot, min_interval_s=PLOT_MIN_INTERVAL_S)
+
 @app.route('/v2x/plot', methods=['GET'])
 def plot_vehicle_map():
-    fig, ax = plt.subplots(figsize=(10, 8))
-    ax.set_title("V2X Vehicle Map with Collision Risk", fontsize=14)
-    ax.set_xlabel("X (meters)")
-    ax.set_ylabel("Y (meters)")
-
-    risky_pairs = set()
-    alert_messages = []
-
-    # Draw each vehicle
-    for vid1, v1 in vehicle_states.items():
-        x, y = v1["position"]
-        heading = v1["heading"]
-        ax.plot(x, y, 'bo')  # blue dot
-        ax.text(x + 1, y + 1, vid1, fontsize=8)
-
-        # Heading arrow
-        arrow_dx = math.cos(math.radians(heading)) * 3
-        arrow_dy = math.sin(math.radians(heading)) * 3
-        ax.arrow(x, y, arrow_dx, arrow_dy, head_width=1, color='blue')
-
-        # Compare with others for collision
-        for vid2, v2 in vehicle_states.items():
-            if vid1 >= vid2:
-                continue
-            coll, dist, rel_speed = will_collide(v1["position"], v2["position"], v1["speed"], v2["speed"])
-            if coll:
-                risky_pairs.add((vid1, vid2))
-                # Store alert as text
-                alert_messages.append(f"⚠ {vid1} ↔ {vid2} | {dist:.1f}m @ Δv={rel_speed:.1f} m/s")
-
-    # Red dashed lines for risky pairs
-    for vid1, vid2 in risky_pairs:
-        x1, y1 = vehicle_states[vid1]["position"]
-        x2, y2 = vehicle_states[vid2]["position"]
-        ax.plot([x1, x2], [y1, y2], 'r--', linewidth=2)
-
-    # Show stats on the plot
-    stats_text = (
-        f"Vehicles: {len(vehicle_states)}\n"
-        f"Active Alerts: {len(risky_pairs)}"
-    )
-    ax.text(0.01, 0.99, stats_text, transform=ax.transAxes,
-            fontsize=12, verticalalignment='top', bbox=dict(boxstyle="round", fc="lightgray", ec="black"))
-
-    # Display alert messages on side
-    if alert_messages:
-        ax.text(1.02, 0.95, "Live Alerts:", transform=ax.transAxes, fontsize=10, fontweight='bold')
-        for i, msg in enumerate(alert_messages[:10]):  # Limit to 10 alerts for space
-            ax.text(1.02, 0.92 - i * 0.05, msg, transform=ax.transAxes, fontsize=9)
-
-    ax.set_aspect('equal')
-    ax.grid(True)
-    plt.tight_layout()
-
-    # Return image
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    png, _ = plot_cache.get(vehicle_store.version)
+    return send_file(io.BytesIO(png), mimetype='image/png')
 
 @app.route('/')
 def dashboard():
@@ -1,58 +1,24 @@
 from flask import Flask, request, jsonify, send_file
 import math
+import os
+import sys
 import time
 
-app = Flask(__name__)
-
-# Global dictionary to store latest vehicle data
-vehicle_states = {}
-
-# ---------- Helper SSM functions ----------
-
-def euclidean_distance(pos1, pos2):
-    dx = pos1[0] - pos2[0]
-    dy = pos1[1] - pos2[1]
-    return math.hypot(dx, dy)
-
-def unit_vector(vx, vy):
-    mag = math.hypot(vx, vy)
-    if mag == 0:
-        return 0.0, 0.0
-    return vx / mag, vy / mag
+# shared SSM kernel lives next to the corridor servers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "corridorDesignSUMO"))
+import ssm_kernel
+from vehicle_store import VehicleStore
 
-def project_speed_along_line(pos_rel, heading_speed_vec):
-    """
-    Project relative velocity onto line-of-approach (vector from ego->other)
-    pos_rel: (dx, dy) = other - ego
-    heading_speed_vec: (vx, vy) relative velocity (ego_v - other_v)
-    Returns relative speed along approach (positive if closing)
-    """
-    dx, dy = pos_rel
-    ux, uy = unit_vector(dx, dy)
-    rvx, rvy = heading_speed_vec
-    return -(rvx * ux + rvy * uy)  # negative sign so positive when closing
-
-def compute_ttc(distance, closing_speed):
-    """Approximate Time-To-Collision (seconds). If closing_speed <= 0 => inf"""
-    if closing_speed <= 0 or distance <= 0:
-        return float('inf')
-    return distance / closing_speed
-
-def required_deceleration(rel_speed, distance, cushion=0.0):
-    """
-    Required deceleration (m/s^2) to avoid collision assuming constant deceleration:
-    a = (v^2) / (2 * d)
-    apply small cushion in distance if needed.
-    """
-    d_eff = max(distance - cushion, 1e-3)
-    return (rel_speed ** 2) / (2.0 * d_eff)
+app = Flask(__name__)
 
-def time_headway(distance, follower_speed):
-    if follower_speed <= 0:
-        return float('inf')
-    return distance / follower_speed
+# Latest vehicle data (+ the same vehicles as arrays for the vectorized SSM kernel).
+# Vehicles not updated for STATE_TTL_WALL_S seconds are dropped by a background sweep.
+STATE_TTL_WALL_S = 30.0
+vehicle_store = VehicleStore(ttl_sim=5.0, ttl_wall=STATE_TTL_WALL_S)
+vehicle_store.start_sweeper(1.0)
 
-# ---------- End helper functions ----------
+# SSM math (distance, closing speed, TTC, ΔV, required deceleration, THW, PET)
+# comes from ssm_kernel.py
 
 @app.route('/v2x/check/vru', methods=['POST'])
 def vru_check_risk():
@@ -76,48 +42,10 @@ def vru_check_risk():
         vhdg = float(v.get("heading", 0.0))   # degrees vehicle heading
         phd = float(p.get("heading", 0.0))    # degrees pedestrian heading (optional)
 
-        # relative geometry
-        dist = euclidean_distance(vpos, ppos)
-
-        # approximate velocities as vectors (vx,vy)
-        vvx = vspeed * math.cos(math.radians(vhdg))
-        vvy = vspeed * math.sin(math.radians(vhdg))
-        pvx = pspeed * math.cos(math.radians(phd))
-        pvy = pspeed * math.sin(math.radians(phd))
-
-        # relative speed vector (vehicle towards pedestrian)
-        rel_vx = vvx - pvx
-        rel_vy = vvy - pvy
-        pos_rel = (ppos[0] - vpos[0], ppos[1] - vpos[1])  # vector from vehicle -> pedestrian
-
-        # closing speed along line of approach (positive if closing)
-        closing_speed = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-
-        # TTC (vehicle to pedestrian) and PET approximation
-        ttc = compute_ttc(dist, closing_speed)
-
-        # PET approx as difference between pedestrian arrival time at conflict point and vehicle arrival time.
-        # Approximate conflict point as current midpoint projected along each's heading:
-        # (Very simplistic) Time for pedestrian to reach current vehicle's path projection:
-        # For robustness, if headings not provided, fallback to simple estimate:
-        if pspeed > 0:
-            t_ped_arrive = dist / pspeed
-        else:
-            t_ped_arrive = float('inf')
-
-        if closing_speed > 0:
-            t_vehicle_arrive = dist / closing_speed
-        else:
-            t_vehicle_arrive = float('inf')
-
-        pet = abs(t_vehicle_arrive - t_ped_arrive)
-
-        # relative speed (ΔV) and required deceleration to avoid collision
-        delta_v = abs(math.hypot(rel_vx, rel_vy))
-        req_dec = required_deceleration(delta_v, dist)
-
-        # THW from vehicle perspective (time headway)
-        thw = time_headway(dist, vspeed)
+        # relative geometry, TTC, PET (arrival-time gap), ΔV, required deceleration, THW
+        m = ssm_kernel.point_metrics(vpos, vspeed, vhdg, ppos, pspeed, phd, pet_speed=pspeed)
+        dist, closing_speed, ttc, pet = m["distance"], m["closing"], m["ttc"], m["pet"]
+        delta_v, req_dec, thw = m["delta_v"], m["req_dec"], m["thw"]
 
         # simple risk scoring (tunable)
         # Higher risk if TTC small, PET small, req_dec large
@@ -183,54 +111,16 @@ def check_vehicle_risk():
         speed = float(data.get("speed", 0.0))
         heading = float(data.get("heading", 0.0))  # degrees
 
-        # Store current state
-        vehicle_states[vid] = {
-            "position": pos,
-            "speed": speed,
-            "heading": heading,
-            "timestamp": time.time()
-        }
-
         ssm_list = []
         alerts = []
 
-        # iterate through other vehicles and compute SSMs
-        for other_id, other in vehicle_states.items():
-            if other_id == vid:
-                continue
-
-            other_pos = tuple(other["position"])
-            other_speed = float(other.get("speed", 0.0))
-            other_heading = float(other.get("heading", 0.0))
-
-            # distance
-            distance = euclidean_distance(pos, other_pos)
-
-            # velocity vectors
-            vx = speed * math.cos(math.radians(heading))
-            vy = speed * math.sin(math.radians(heading))
-            ovx = other_speed * math.cos(math.radians(other_heading))
-            ovy = other_speed * math.sin(math.radians(other_heading))
-
-            # relative vector from ego -> other and relative velocity (ego - other)
-            pos_rel = (other_pos[0] - pos[0], other_pos[1] - pos[1])
-            rel_vx = vx - ovx
-            rel_vy = vy - ovy
-
-            # closing speed along line of approach
-            closing_speed = project_speed_along_line(pos_rel, (rel_vx, rel_vy))
-
-            # TTC
-            ttc = compute_ttc(distance, closing_speed)
-
-            # ΔV magnitude
-            delta_v = abs(math.hypot(rel_vx, rel_vy))
-
-            # required deceleration for ego to avoid collision (approx)
-            req_dec = required_deceleration(delta_v, distance)
-
-            # time headway (distance / follower speed assuming ego is follower)
-            thw = time_headway(distance, speed)
+        # Store current state, then SSMs vs every other live vehicle in one vectorized pass
+        with vehicle_store.lock:
+            vehicle_store.upsert(vid, pos, speed, heading, sim_time=data.get("sim_time"))
+            other_ids = vehicle_store.others(vid)
+            m = ssm_kernel.ego_metrics(vehicle_store.table, vid, other_ids)
+        for other_id, core in zip(other_ids, ssm_kernel.core_tuples(m)):
+            distance, closing_speed, delta_v, ttc, req_dec, thw, _ = core
 
             # simple SSM record
             ssm = {
@@ -287,6 +177,12 @@ def check_vehicle_risk():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@app.route('/v2x/vehicle/stats', methods=['GET'])
+def vehicle_stats():
+    """Live vehicle count and eviction counts by reason."""
+    return jsonify(vehicle_store.stats())
         
          
 @app.route('/v2x/plot', methods=['GET'])
@@ -299,6 +195,8 @@ def plot_vehicle_map():
     risky_pairs = set()
     alert_messages = []
 
+    vehicle_states = vehicle_store.snapshot()
+
     # Draw each vehicle
     for vid1, v1 in vehicle_states.items():
         x, y = v1["position"]